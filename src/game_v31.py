@@ -4,11 +4,21 @@
 # Author: Suyu Chen
 # Date: 06/03/2020
 #########################################
-import pygame, time
+import pygame, time, os
 from game_v31_classes import *
+from game_v31_kepler import KeplerCoast
+from game_v31_gravity import loadSystem
+from game_v31_hud import Hud
+from game_v31_predict import Predictor
+from game_v31_profiler import FrameProfiler, ProfilerOverlay
+from game_v31_telemetry import TelemetryRecorder, TelemetryReader, recordedRows
+from game_v31_inputlog import InputLog
+from game_v31_simthread import SimThread
+from game_v31_audio import Audio
+from game_v31_save import Snapshot, SaveWriter, loadSnapshot
 
 pygame.init()
-pygame.mixer.init(22050, -16, 4, 1024)
+pygame.mixer.init(22050, -16, 2, 1024)     # stereo, every decoded sound takes half the memory of quad
 
 width  = DEFAULT_RES[0]
 height = DEFAULT_RES[1]
@@ -16,52 +26,67 @@ gameWindow = pygame.display.set_mode((width,height), pygame.RESIZABLE)
 
 clock = pygame.time.Clock()
 FPS = 60   
+MAX_TIME_WARP = 100000
+IDLE_POLL = 100     # ms between checks for the background while a menu waits for it
+SYSTEM_FILE = None  # json file of moving bodies to fly in, e.g. "systems/earth_moon_belt.json"
+FLIGHT_FILE = "flights/last.rtl"    # telemetry of the last flight, for the replay
+INPUT_FILE = "flights/last.inputs"  # controls of the last flight, re-simulate with game_v31_inputlog.py
+INPUT_SNAPSHOT_FILE = "flights/last.rsav"   # the quickload INPUT_FILE starts from
+SAVE_FILE = "saves/quick.rsav"      # F5 quicksaves the flight here, F9 quickloads it
 
 #---------------------------------------#
 # Icon, Caption, Background and Fonts   #
 #---------------------------------------#
-pygame.display.set_icon(loadImg("icon.png"))
+# assets are only registered here, each file is read the first time it is used
+assets.registerImage("icon", "icon.png")
+assets.registerImage("space", "space.jpg", False)
+pygame.display.set_icon(assets.get("icon"))
 pygame.display.set_caption("Space Sim")
 
-originalBg = loadImg("space.jpg", False)
-bg = pygame.transform.scale(originalBg, (width, height))
+bg = None   # the background is drawn once the preload thread has read it, or it is baked
 
-largeFont = pygame.font.Font("fonts/font.ttf", 50)
-medFont = pygame.font.Font("fonts/font.ttf", 35)
-smallFont = pygame.font.Font("fonts/font.ttf", 25)
-tinyFont = pygame.font.Font("fonts/font.ttf", 18)
-titleFont = pygame.font.Font("fonts/titleFont.otf", 70)
+assets.registerFont("largeFont", "font.ttf", 50)
+assets.registerFont("medFont", "font.ttf", 35)
+assets.registerFont("smallFont", "font.ttf", 25)
+assets.registerFont("tinyFont", "font.ttf", 18)
+assets.registerFont("titleFont", "titleFont.otf", 70)
 
 #-----------------------------------#
 # Rocket Data and Images            #
 #-----------------------------------#
-## rocket data format: [image, height (1 m = 2 px), mass, max thrust]
-spaceShuttleData = [loadImg("spaceShuttle.png"), 112, 2030000, 34696128]
-falcon9Data = [loadImg("falcon9.png"), 140, 541300, 5885000]
-longMarch2FData = [loadImg("longMarch2F.png"), 124, 464000, 5920000]
-soyuzData = [loadImg("soyuz.png"),91, 305000, 3357000]
+## rocket data format: [image name, height (1 m = 2 px), mass, max thrust, width]
+spaceShuttleData = ["spaceShuttle"] + ROCKET_SPECS["spaceShuttle"]
+falcon9Data = ["falcon9"] + ROCKET_SPECS["falcon9"]
+longMarch2FData = ["longMarch2F"] + ROCKET_SPECS["longMarch2F"]
+soyuzData = ["soyuz"] + ROCKET_SPECS["soyuz"]
 
 rockets = [spaceShuttleData, falcon9Data, longMarch2FData, soyuzData]
+for rocketData in rockets:
+    assets.registerImage(rocketData[0], rocketData[0] + ".png")
 chosenRocketData = None
 
 #-----------------------------------#
 # Sound and Music                   #
 #-----------------------------------#
-explosionVolume = 0.4
-explosionSound = loadSound("explosion.wav", explosionVolume)
-explosionChannel = pygame.mixer.Channel(1)
+# volumes are set on the channels, so the engine and the rcs thrusters share one decoded sound
+# and long clips (the explosion) are streamed from disk while they play
+audio = Audio(assets)
+assets.registerSound("explosion", "explosion.wav")
+assets.registerSound("countdown", "countdown.wav")
+assets.registerSound("engine", "engine.wav")
 
+explosionVolume = 0.4
+audio.channel("explosion", 1, "explosion", explosionVolume)
 countdownVolume = 0.5
-countdownSound = loadSound("countdown.wav", countdownVolume)
-countdownChannel = pygame.mixer.Channel(2)
-
+audio.channel("countdown", 2, "countdown", countdownVolume)
 engineVolume = 0.15
-engineSound = loadSound("engine.wav", engineVolume)
-engineChannel = pygame.mixer.Channel(3)
-
+audio.channel("engine", 3, "engine", engineVolume)
 rcsVolume = 0.1
-rcsSound = loadSound("engine.wav", rcsVolume)
-rcsChannel = pygame.mixer.Channel(4)
+audio.channel("rcs", 4, "engine", rcsVolume)
+
+# read the rest in the background while the menu shows, in the order they are needed
+assets.preload(["space"] + [rocketData[0] for rocketData in rockets] +
+               [name for name in ["countdown", "engine", "explosion"] if name not in audio.streamed()])
 
 pygame.mixer.music.load("audio/music.mp3")
 pygame.mixer.music.set_volume(0.2)
@@ -77,64 +102,102 @@ drawDev = False
 printDev = False
 showFps = True
 
+# frame profiling, F3 shows the overlay and F4 writes profile.json (chrome://tracing) and profile.csv
+profiler = FrameProfiler(["display", "wait", "sim", "path", "planets", "rocket", "hud", "dev",
+                          "crash", "audio", "events", "overlay"])
+profilerOverlay = None
+
+# snapshots are written to disk on their own thread, see game_v31_save
+saveWriter = SaveWriter()
+
+# menus are only drawn when something on them changes, and wait for events in between
+STATIC_MODES = ["menu", "controls", "rockets", "crashed"]
+redrawAll = True    # the whole window has to be drawn again
+resizer = ResizeDebouncer()
+smoothScaling = True    # False while the window is being resized
+dirtyRects = []     # parts of the window drawn since the last display update
+
 inPlay = True
 while inPlay:  
-    pygame.display.update()
+    if dirtyRects:
+        pygame.display.update(dirtyRects)
+        dirtyRects = []
+    if gameMode in STATIC_MODES and not redrawAll:
+        timeout = resizer.timeLeft()    # wake up for the high quality pass after a resize
+        if bg == None:
+            timeout = min(timeout or IDLE_POLL, IDLE_POLL)
+        events = waitForEvents(timeout or 0)
+        clock.tick()    # so the first frame of the game does not count the time spent waiting
+    else:
+        clock.tick(FPS)
+        events = pygame.event.get()
     mousePos = pygame.mouse.get_pos()
-    gameWindow.blit(bg, (0,0))
-    clock.tick(FPS)
+    if bg == None and (assets.isReady(assets.scaledName("space", (width, height))) or assets.isReady("space")):
+        bg = assets.getScaled("space", (width, height))
+        redrawAll = True
 
     mouseClick = False
-    for event in pygame.event.get():
+    for event in events:
         if event.type == pygame.QUIT:
             inPlay = False
+        if event.type == pygame.VIDEOEXPOSE:
+            redrawAll = True
         if event.type == pygame.VIDEORESIZE:
-            width, height = event.w, event.h
-            gameWindow = pygame.display.set_mode((width, height), pygame.RESIZABLE)
-            bg = pygame.transform.scale(originalBg, (width, height))
-            if gameMode in ["menu", "controls", "rockets", "crashed"]:
-                gameMode += "Resize"
+            resizer.push((event.w, event.h))
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1:
                 mouseClick = True
+
+    # window resizing, laid out quickly while an edge is dragged and properly once it stops
+    resized = resizer.poll()
+    if resized != None:
+        (width, height), smoothScaling = resized
+        if gameWindow.get_size() != (width, height):
+            gameWindow = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+        if bg != None:
+            if smoothScaling:
+                bg = assets.getScaled("space", (width, height), False)   # not baked, any size can come up
+            else:
+                bg = scaleImage(bg, (width, height), False)
+        if gameMode in STATIC_MODES:
+            gameMode += "Resize"
     
     if gameMode == "menuLoad":
-        menuTitle1 = ScalableText("ROCKET", titleFont, WHITE)
-        menuTitle2 = ScalableText("SIMULATOR", titleFont, WHITE)
-        playButton = TextButton("Play", largeFont, WHITE)
-        controlsButton = TextButton("Controls", largeFont, WHITE)
-        quitButton = TextButton("Quit", largeFont, WHITE)
+        menuTitle1 = ScalableText("ROCKET", assets.get("titleFont"), WHITE)
+        menuTitle2 = ScalableText("SIMULATOR", assets.get("titleFont"), WHITE)
+        playButton = TextButton("Play", assets.get("largeFont"), WHITE)
+        controlsButton = TextButton("Controls", assets.get("largeFont"), WHITE)
+        replayButton = TextButton("Replay", assets.get("largeFont"), WHITE)
+        quitButton = TextButton("Quit", assets.get("largeFont"), WHITE)
+        menuScreen = StaticScreen([menuTitle1, menuTitle2, playButton, controlsButton, replayButton, quitButton])
         gameMode = "menuResize"
 
     if gameMode == "menuResize":
-        menuTitle1.resize((width//2, height*3//12), (width, height), DEFAULT_RES)
-        menuTitle2.resize((width//2, height*9//24), (width, height), DEFAULT_RES)
-        playButton.resize((width//2, height*13//24), (width, height), DEFAULT_RES)
-        controlsButton.resize((width//2, height*8//12), (width, height), DEFAULT_RES)
-        quitButton.resize((width//2, height*19//24), (width, height), DEFAULT_RES)
+        menuTitle1.resize((width//2, height*3//12), (width, height), DEFAULT_RES, smoothScaling)
+        menuTitle2.resize((width//2, height*9//24), (width, height), DEFAULT_RES, smoothScaling)
+        playButton.resize((width//2, height*12//24), (width, height), DEFAULT_RES, smoothScaling)
+        controlsButton.resize((width//2, height*29//48), (width, height), DEFAULT_RES, smoothScaling)
+        replayButton.resize((width//2, height*17//24), (width, height), DEFAULT_RES, smoothScaling)
+        quitButton.resize((width//2, height*39//48), (width, height), DEFAULT_RES, smoothScaling)
+        redrawAll = True
         gameMode = "menu"
         
     if gameMode == "menu":
-        menuTitle1.draw(gameWindow)
-        menuTitle2.draw(gameWindow)   
-        playButton.draw(gameWindow)
-        controlsButton.draw(gameWindow)
-        quitButton.draw(gameWindow)
-
-        playButton.detectMouseHover(mousePos)
-        quitButton.detectMouseHover(mousePos)
-        controlsButton.detectMouseHover(mousePos)
+        dirtyRects += menuScreen.update(gameWindow, bg, mousePos, redrawAll)
+        redrawAll = False
 
         if mouseClick:
             if playButton.selected:
                 gameMode = "rocketsLoad"
             if controlsButton.selected:
                 gameMode = "controlsLoad"
+            if replayButton.selected and recordedRows(FLIGHT_FILE) > 0:    # nothing to replay before a launch
+                gameMode = "replayLoad"
             if quitButton.selected:
                 inPlay = False
 
     if gameMode == "controlsLoad":
-        controlsTitle = ScalableText("CONTROLS", titleFont, WHITE)
+        controlsTitle = ScalableText("CONTROLS", assets.get("titleFont"), WHITE)
         controlsText = ["SPACE - Launch or Throttle to Max",
                         "X - Engines Off",
                         "W - Throttle Up",
@@ -145,60 +208,58 @@ while inPlay:
                         "1 - Slow Down Simulation",
                         "2 - Normal Speed Simulation",
                         "3 - Speed Up Simulation",
+                        "F5/F9 - Quicksave/Quickload",
                         "ESC - Exit Game, Return to Menu"]
         controlLines = []
         for controlText in controlsText:
-            controlLines.append(ScalableText(controlText, smallFont, WHITE))
-        backButton = TextButton("Back to Menu", medFont, WHITE)
+            controlLines.append(ScalableText(controlText, assets.get("smallFont"), WHITE))
+        backButton = TextButton("Back to Menu", assets.get("medFont"), WHITE)
+        controlsScreen = StaticScreen([controlsTitle] + controlLines + [backButton])
         gameMode = "controlsResize"
 
     if gameMode == "controlsResize":
-        controlsTitle.resize((width//2, height*2//12), (width, height), DEFAULT_RES)
+        controlsTitle.resize((width//2, height*2//12), (width, height), DEFAULT_RES, smoothScaling)
         controlLinesPositions = [(width//2, height*11//40)]
         for i in range(len(controlLines) - 1):
             controlLinesPositions.append((width//2, controlLinesPositions[0][1] + height//20*(i+1)))
         for i in range(len(controlLines)):
-            controlLines[i].resize(controlLinesPositions[i], (width, height), DEFAULT_RES)
-        backButton.resize((width//2, height*14//16), (width, height), DEFAULT_RES)
+            controlLines[i].resize(controlLinesPositions[i], (width, height), DEFAULT_RES, smoothScaling)
+        backButton.resize((width//2, height*14//16), (width, height), DEFAULT_RES, smoothScaling)
+        redrawAll = True
         gameMode = "controls"
 
     if gameMode == "controls":
-        controlsTitle.draw(gameWindow)
-        for controlLine in controlLines:
-            controlLine.draw(gameWindow)
-        backButton.draw(gameWindow)
-
-        backButton.detectMouseHover(mousePos)
+        dirtyRects += controlsScreen.update(gameWindow, bg, mousePos, redrawAll)
+        redrawAll = False
         if mouseClick and backButton.selected:
             gameMode = "menuLoad"
 
     if gameMode == "rocketsLoad":
         chosenRocketData = None
-        rocketsTitle = ScalableText("SELECT ROCKET", titleFont, WHITE)
+        rocketsTitle = ScalableText("SELECT ROCKET", assets.get("titleFont"), WHITE)
         rocketButtons = []
         for rocket in rockets:
-            img = scaleMaintainAspect(rocket[0], newH=round(rocket[1]*1.5))
+            img = assets.getScaledMaintainAspect(rocket[0], newH=round(rocket[1]*1.5))
             rocketButtons.append(ImgButton(img))
-        backButton = TextButton("Back to Menu", largeFont, WHITE)
+        backButton = TextButton("Back to Menu", assets.get("largeFont"), WHITE)
+        rocketsScreen = StaticScreen([rocketsTitle, backButton] + rocketButtons)
         gameMode = "rocketsResize"
 
     if gameMode == "rocketsResize":
-        rocketsTitle.resize((width//2, height//6), (width, height), DEFAULT_RES)
+        rocketsTitle.resize((width//2, height//6), (width, height), DEFAULT_RES, smoothScaling)
         for i in range(len(rockets)):
-            rocketButtons[i].resize((width//(len(rockets)+1)*(i+1), height//2), (width, height), DEFAULT_RES)
-        backButton.resize((width//2, height*5//6), (width, height), DEFAULT_RES)
+            rocketButtons[i].resize((width//(len(rockets)+1)*(i+1), height//2), (width, height), DEFAULT_RES, smoothScaling)
+        backButton.resize((width//2, height*5//6), (width, height), DEFAULT_RES, smoothScaling)
+        redrawAll = True
         gameMode = "rockets"
 
     if gameMode == "rockets":
-        rocketsTitle.draw(gameWindow)
-        backButton.draw(gameWindow)
-        backButton.detectMouseHover(mousePos)
+        dirtyRects += rocketsScreen.update(gameWindow, bg, mousePos, redrawAll)
+        redrawAll = False
         if mouseClick and backButton.selected:
             gameMode = "menuLoad"
 
         for i in range(len(rocketButtons)):
-            rocketButtons[i].draw(gameWindow)
-            rocketButtons[i].detectMouseHover(mousePos)
             if mouseClick and rocketButtons[i].selected:
                 chosenRocketData = rockets[i]
                 gameMode = "gameLoad"
@@ -209,68 +270,111 @@ while inPlay:
         rcs = False
         explosionPlayed = False
 
-        # resetting sound volumes
-        rcsSound.set_volume(rcsVolume)
-        engineSound.set_volume(engineVolume)
-        countdownSound.set_volume(countdownVolume)
-        explosionSound.set_volume(explosionVolume)
-
         # countdown
         countdownStart = None
-        countdownLength = countdownSound.get_length()
+        countdownLength = audio["countdown"].length()
 
         # delay after rocket explosion
         crashedTime = None
         crashedDelay = 4
         # planets
-        earth = Planet("earth", 0, 0, 10000, 1.46838e19, DARK_BLUE) 
-        moon = Planet("moon", 0, -100000, 3000, 2.1846e17, GREY)
-        planets = [earth, moon]
+        if SYSTEM_FILE == None:
+            planets = makePlanets(Planet, [DARK_BLUE, GREY])
+        else:
+            planets = loadSystem(SYSTEM_FILE, Planet, GREY)
+        earth = planets[0]
 
         # sprites
         explosionSprite = ExplosionSprite("explosion.png", 8, 8)
-        rocket = Rocket(200, chosenRocketData, earth, planets)
+        rocketImg = assets.getScaledMaintainAspect(chosenRocketData[0], newH=chosenRocketData[1])
+        rocket = Rocket(200, [rocketImg] + chosenRocketData[1:], earth, planets)
+        if bg == None:
+            bg = assets.getScaled("space", (width, height))
+        assets.trim(0, IMAGE)   # only the chosen rocket is drawn from now on, drop the other images
+
+        # simulation core, the game only feeds it input and draws its state
+        sim = Simulation(rocket, planets, "verlet", KeplerCoast(planets))
+        simClock = SimClock()
+
+        # every frame of the flight goes to FLIGHT_FILE
+        recorder = TelemetryRecorder(FLIGHT_FILE, planets, chosenRocketData[0])
+        # and every control input, by simulation tick
+        inputLog = InputLog(INPUT_FILE, sim, simClock, chosenRocketData[0], SYSTEM_FILE)
+
+        # forecast of the trajectory, computed in a background thread
+        predictedPath = Path(GREY)
+        predictor = Predictor(predictedPath)
 
         # camera
         camera = Camera(round(rocket.center.x - width/2),
                         round(rocket.center.y - height/2),
                         width, height, 1)
 
-        infoText = []
+        # flight info, labels are rendered once and values only when they change
+        hud = Hud([["Altitude: ", " m"],
+                   ["Nearest Planet: ", ""],
+                   ["Throttle: ", " %"],
+                   ["Velocity: ", " m/s"],
+                   ["Velocity Towards Planet: ", " m/s"],
+                   ["Velocity Tangent Planet: ", " m/s"],
+                   ["Angular Velocity: ", " degrees/s"],
+                   ["Fuel and Oxidizer: ", " %"],
+                   ["Time Warp: ", "X"]], assets.get("tinyFont"), WHITE)
+        hud.resize(width, height)
+
+        # quicksaves are kept in memory and written to SAVE_FILE in the background
+        lastSnapshot = None
+
+        # the simulation ticks on its own thread from here on, the game loop queues input and draws
+        simThread = SimThread(sim, simClock, inputLog, recorder, predictor)
 
         gameMode = "game"
     
     while gameMode == "game":       # game uses nested loop since game has different event loop, calculates dt, etc.
+        profiler.beginFrame()
         pygame.display.update()
         mousePos = pygame.mouse.get_pos()
         gameWindow.blit(bg, (0,0))
+        profiler.mark("display")
 
-        dt = clock.get_time()/1000  # time since last tick in seconds
         clock.tick(FPS)
-            
+        profiler.mark("wait")
+
+        # the rocket as it was one physics tick ago, in between the last two ticks
+        view = simThread.interpolated()
+        simThread.drainPath()
+        predictor.poll()
+        profiler.mark("sim")
+
         # Drawing objects on screen
-        rocket.path.draw(gameWindow, camera)
-        earth.draw(gameWindow, camera)
-        moon.draw(gameWindow, camera)
-        rocket.draw(gameWindow, camera)       
+        predictedPath.draw(gameWindow, camera)
+        impact = predictor.impact   # read once, the physics thread may cancel the prediction meanwhile
+        if impact != None:
+            pygame.draw.circle(gameWindow, RED, (round((impact[0] - camera.x)/camera.zoom),
+                                                 round((impact[1] - camera.y)/camera.zoom)), 5, 1)
+        simThread.path.draw(gameWindow, camera)
+        profiler.mark("path")
+        for planet in planets:
+            planet.draw(gameWindow, camera)
+        profiler.mark("planets")
+        rocket.draw(gameWindow, camera, view)
+        profiler.mark("rocket")
 
         # displaying numbers
-        infoText = ["Altitude: " + str(round(rocket.altitude)) + " m",
-                    "Nearest Planet: " + str(rocket.nearestPlanet.name),
-                    "Throttle: " + str(round(rocket.throttle*100)) + " %",
-                    "Velocity: " + str(round(rocket.v.length())) + " m/s",
-                    "Velocity Towards Planet: " + str(round(rocket.vToPlanet)) + " m/s",
-                    "Velocity Tangent Planet: " + str(round(rocket.vTanPlanet)) + " m/s",
-                    "Angular Velocity: " + str(round(rocket.angV)) + " degrees/s",
-                    "Fuel and Oxidizer: " + str(round(rocket.fuelPercent)) + " %",
-                    "Time Warp: " + str(round(timeWarp, 1)) + "X"]
-        for i in range(len(infoText)):
-            textLineSurf = ScalableText(infoText[i], tinyFont, WHITE)
-            textLineSurf.resizeFromTopLeft((width//20, height*(i+1)//30), (width, height), DEFAULT_RES)
-            textLineSurf.draw(gameWindow)
+        hud.update([str(round(view.altitude)),
+                    str(view.nearestPlanet.name),
+                    str(round(view.throttle*100)),
+                    str(round(view.v.length())),
+                    str(round(view.vToPlanet)),
+                    str(round(view.vTanPlanet)),
+                    str(round(view.angV)),
+                    str(round(view.fuelPercent)),
+                    str(round(timeWarp, 1))])
+        hud.draw(gameWindow)
+        profiler.mark("hud")
 
         # Showing dev stuff
-        if drawDev and not rocket.crashed:
+        if drawDev and not view.crashed:
             rocket.drawDevInfo(gameWindow, camera)
         if printDev:
             print("\nROCKET\n̅̅̅̅̅̅̅̅\n" + str(rocket))
@@ -278,52 +382,47 @@ while inPlay:
             for planet in planets:
                 print("\nPLANET\n̅̅̅̅̅̅̅̅\n" + str(planet))
             print("Timewarp: " + str(timeWarp) + "\n")
+            print(str(spriteCache) + "\n")
+            print(str(assets) + "\n")
+            print(str(audio) + "\n")
         if showFps:
             pygame.display.set_caption(str(clock.get_fps()))
+        profiler.mark("dev")
 
-        # updating rocket variables
-        if not rocket.crashed and rocket.launched:
-            rocket.update(planets, dt, timeWarp)
-            
         # dealing with rocket crashing        
-        if rocket.crashed:
-            rocket.freeze()
+        if view.crashed:
             rcs = False
             if not explosionPlayed:
-                pygame.mixer.stop()
-                explosionSound.set_volume((1/sqrt(camera.zoom))*explosionVolume)  # sets volume based on zoom level
-                explosionChannel.play(explosionSound, loops = -1)
+                audio.stopAll()
+                audio["explosion"].play(1/sqrt(camera.zoom), loops = -1)   # sets volume based on zoom level
                 explosionPlayed = True
             if crashedTime == None:
                 crashedTime = time.time()
             if not explosionSprite.finished:
                 explosionSprite.loadNextImg()
                 explosionSprite.transform(camera)
-                explosionSprite.draw(gameWindow, rocket.center, camera)
+                explosionSprite.draw(gameWindow, view.center, camera)
             if time.time() - crashedTime > crashedDelay:
-                pygame.mixer.stop()
+                audio.stopAll()
                 gameMode = "crashedLoad"
+        profiler.mark("crash")
             
         # rocket launching
         if countdownStart != None:
             if time.time() - countdownStart > countdownLength:
-                rocket.throttleMax()
-                rocket.launched = True
+                simThread.command("launch")
                 countdownStart = None
 
-        # rocket engine sounds
-        if rocket.throttle > 0:
-            engineSound.set_volume((1/sqrt(camera.zoom))*engineVolume*rocket.throttle)
-            if not engineChannel.get_busy():
-                engineChannel.play(engineSound, loops = -1)
-        if rocket.throttle <= 0:
-            engineChannel.stop()
+        # rocket engine sounds, the mixer is only called when one starts, stops or audibly changes
+        if view.throttle > 0:
+            audio["engine"].loop((1/sqrt(camera.zoom))*view.throttle)
+        else:
+            audio["engine"].stop()
         if rcs:
-            rcsSound.set_volume((1/sqrt(camera.zoom))*rcsVolume)
-            if rcsSound.get_num_channels() == 0:
-                rcsChannel.play(rcsSound, loops = -1)
-        if not rcs:
-            rcsChannel.stop()
+            audio["rcs"].loop(1/sqrt(camera.zoom))
+        else:
+            audio["rcs"].stop()
+        profiler.mark("audio")
 
         # Event loop
         for event in pygame.event.get():
@@ -331,23 +430,65 @@ while inPlay:
                 gameMode = None
                 inPlay = False
 
+            # profiling
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:
+                    if profilerOverlay == None:
+                        profilerOverlay = ProfilerOverlay(profiler, assets.get("tinyFont"))
+                    profilerOverlay.visible = not profilerOverlay.visible
+                elif event.key == pygame.K_F4:
+                    profiler.exportChromeTrace("profile.json")
+                    profiler.exportCsv("profile.csv")
+
+            # quicksave and quickload
+                elif event.key == pygame.K_F5:
+                    with simThread.paused():
+                        lastSnapshot = Snapshot.capture(sim, simClock, simThread.path, camera, timeWarp,
+                                                        chosenRocketData[0], SYSTEM_FILE)
+                    saveWriter.write(lastSnapshot, SAVE_FILE)
+                elif event.key == pygame.K_F9:
+                    snapshot = lastSnapshot
+                    if snapshot == None and os.path.exists(SAVE_FILE):
+                        try:
+                            snapshot = loadSnapshot(SAVE_FILE)
+                        except (OSError, ValueError, KeyError):
+                            snapshot = None     # a save from another version of the game
+                    if snapshot != None and snapshot.fits(sim, simClock, SYSTEM_FILE) and \
+                       snapshot.header["rocketName"] == chosenRocketData[0]:
+                        simThread.close()
+                        recorder.close()
+                        inputLog.close()
+                        predictor.reset()
+                        timeWarp = snapshot.restore(sim, simClock, simThread.path, camera)
+                        lastSnapshot = snapshot
+
+                        # the logs start over from the snapshot
+                        recorder = TelemetryRecorder(FLIGHT_FILE, planets, chosenRocketData[0])
+                        saveWriter.write(snapshot, INPUT_SNAPSHOT_FILE)
+                        inputLog = InputLog(INPUT_FILE, sim, simClock, chosenRocketData[0], SYSTEM_FILE,
+                                            INPUT_SNAPSHOT_FILE)
+                        countdownStart = None
+                        crashedTime = None
+                        explosionPlayed = False
+                        explosionSprite = ExplosionSprite("explosion.png", 8, 8)
+                        audio.stopAll()
+                        simThread = SimThread(sim, simClock, inputLog, recorder, predictor)
+                        view = simThread.interpolated()
+
             # window resizing
             if event.type == pygame.VIDEORESIZE:
-                width, height = event.w, event.h
-                gameWindow = pygame.display.set_mode((width, height), pygame.RESIZABLE)
-                bg = pygame.transform.scale(originalBg, (width, height))
-                camera.resize(width, height)
+                resizer.push((event.w, event.h))
 
             # rocket controls (engines disabled when time sped up)
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE and timeWarp <= 1:
-                    if not rocket.launched:
-                        countdownSound.play() # does not immediately launch rocket, waits until countdown is over
+                    if not view.launched:
+                        audio["countdown"].play() # does not immediately launch rocket, waits until countdown is over
                         countdownStart = time.time()
                     else:
-                        rocket.throttleMax()                    
+                        simThread.command("throttleMax")
                 elif event.key == pygame.K_x:
-                    rocket.throttleZero()
+                    simThread.command("throttleZero")
 
             # Camera controls
                 if event.key == pygame.K_t:
@@ -368,69 +509,234 @@ while inPlay:
                 if mouseHeld:
                     camera.move(-mouseMovedX, -mouseMovedY)
 
+        # window resizing, laid out quickly while an edge is dragged and properly once it stops
+        resized = resizer.poll()
+        if resized != None:
+            (width, height), smoothScaling = resized
+            if gameWindow.get_size() != (width, height):
+                gameWindow = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+            if smoothScaling:
+                bg = assets.getScaled("space", (width, height), False)
+            else:
+                bg = scaleImage(bg, (width, height), False)
+            camera.resize(width, height)
+            hud.resize(width, height, smoothScaling)
+
         # pressed keys
         keys = pygame.key.get_pressed()
         if keys[pygame.K_ESCAPE]:
-            pygame.mixer.stop()
+            audio.stopAll()
             gameMode = "menuLoad"
             
         # rocket controls (engines disabled when time sped up)
         rcs = False
-        if timeWarp <= 1 and rocket.launched and not rocket.crashed:   
+        if timeWarp <= 1 and view.launched and not view.crashed:   
             if keys[pygame.K_w]:
-                rocket.throttleUp()
+                simThread.command("throttleUp")
             elif keys[pygame.K_s]:
-                rocket.throttleDown()
+                simThread.command("throttleDown")
             if keys[pygame.K_a]:
-                rocket.rotCCW()
+                simThread.command("rotCCW")
                 rcs = True
             elif keys[pygame.K_d]:
-                rocket.rotCW()
+                simThread.command("rotCW")
                 rcs = True
             elif keys[pygame.K_m]:
-                rocket.stabilize()
+                simThread.command("stabilize")
                 rcs = True
 
         # time warping (engines must be off to speed up time, but not to slow down time)
-        if rocket.launched and not rocket.crashed:
+        if view.launched and not view.crashed:
             if keys[pygame.K_2]:
                 timeWarp = 1
             elif keys[pygame.K_1] and timeWarp > 0.5:    
-                timeWarp -= 0.2
-            elif keys[pygame.K_3] and timeWarp < 50:
-                if timeWarp < 1 or (not rcs and rocket.throttle == 0):
+                if timeWarp > 1.2:
+                    timeWarp = max(1, timeWarp/1.1)     # warp changes geometrically above 1x so high warps are reachable
+                else:
+                    timeWarp -= 0.2
+            elif keys[pygame.K_3] and timeWarp < MAX_TIME_WARP:
+                if timeWarp < 1:
                     timeWarp += 0.2
+                elif not rcs and view.throttle == 0:
+                    timeWarp = min(MAX_TIME_WARP, max(timeWarp + 0.2, timeWarp*1.1))
+
+        simThread.setControls(timeWarp, rcs)
 
         # updating camera position if it is tethered 
         if camera.tether:
-            camera.followRocket(rocket)
+            camera.followRocket(view)
+        profiler.mark("events")
+
+        if profilerOverlay != None:
+            profilerOverlay.draw(gameWindow)
+        profiler.mark("overlay")
+
+        if gameMode != "game":
+            simThread.close()
+            predictor.close()
+            recorder.close()
+            inputLog.close()
 
     if gameMode == "crashedLoad":
-        crashedTitle = ScalableText("YOU CRASHED", titleFont, WHITE)
-        backButton = TextButton("Back to Menu", largeFont, WHITE)
-        quitButton = TextButton("Quit", largeFont, WHITE)
+        crashedTitle = ScalableText("YOU CRASHED", assets.get("titleFont"), WHITE)
+        backButton = TextButton("Back to Menu", assets.get("largeFont"), WHITE)
+        replayButton = TextButton("Watch Replay", assets.get("largeFont"), WHITE)
+        quitButton = TextButton("Quit", assets.get("largeFont"), WHITE)
+        crashedScreen = StaticScreen([crashedTitle, backButton, replayButton, quitButton])
         gameMode = "crashedResize"
 
     if gameMode == "crashedResize":
-        crashedTitle.resize((width//2, height//3), (width, height), DEFAULT_RES)
-        backButton.resize((width//2, height*8/15), (width, height), DEFAULT_RES)
-        quitButton.resize((width//2, height*2//3), (width, height), DEFAULT_RES)
+        crashedTitle.resize((width//2, height//3), (width, height), DEFAULT_RES, smoothScaling)
+        backButton.resize((width//2, height*8/15), (width, height), DEFAULT_RES, smoothScaling)
+        replayButton.resize((width//2, height*2//3), (width, height), DEFAULT_RES, smoothScaling)
+        quitButton.resize((width//2, height*4//5), (width, height), DEFAULT_RES, smoothScaling)
+        redrawAll = True
         gameMode = "crashed"
 
     if gameMode == "crashed":
-        crashedTitle.draw(gameWindow)
-        backButton.draw(gameWindow)
-        quitButton.draw(gameWindow)
-
-        backButton.detectMouseHover(mousePos)
-        quitButton.detectMouseHover(mousePos)
+        dirtyRects += crashedScreen.update(gameWindow, bg, mousePos, redrawAll)
+        redrawAll = False
 
         if mouseClick:
             if backButton.selected:
                 gameMode = "menuLoad"
+            if replayButton.selected and recordedRows(FLIGHT_FILE) > 0:
+                gameMode = "replayLoad"
             if quitButton.selected:
                 inPlay = False        
+
+    if gameMode == "replayLoad":
+        mouseHeld = False
+        replay = TelemetryReader(FLIGHT_FILE)
+        if len(replay) == 0:
+            replay.close()
+            gameMode = "menuLoad"
+
+    if gameMode == "replayLoad":
+        if SYSTEM_FILE == None:
+            planets = makePlanets(Planet, [DARK_BLUE, GREY])
+        else:
+            planets = loadSystem(SYSTEM_FILE, Planet, GREY)
+        replayRocketData = [rocketData for rocketData in rockets if rocketData[0] == replay.rocket][0]
+        rocketImg = assets.getScaledMaintainAspect(replayRocketData[0], newH=replayRocketData[1])
+        rocket = Rocket(200, [rocketImg] + replayRocketData[1:], planets[0], planets)
+        rocket.launched = True
+        trail = replay.sample(["time", "x", "y"], 4000)     # a few rows of the whole flight, read from the file
+        trailPoints = np.column_stack((trail["x"], trail["y"]))
+        replayTime = replay.startTime
+        replaySpeed = 1
+        paused = False
+        camera = Camera(round(trail["x"][0] - width/2), round(trail["y"][0] - height/2), width, height, 1)
+        hud = Hud([["Time: ", " s"],
+                   ["Altitude: ", " m"],
+                   ["Nearest Planet: ", ""],
+                   ["Throttle: ", " %"],
+                   ["Velocity: ", " m/s"],
+                   ["Fuel and Oxidizer: ", " %"],
+                   ["Replay Speed: ", "X"],
+                   ["SPACE pause, 1/2/3 speed, click the bar to seek", ""]], assets.get("tinyFont"), WHITE)
+        hud.resize(width, height)
+        gameMode = "replay"
+
+    while gameMode == "replay":
+        pygame.display.update()
+        mousePos = pygame.mouse.get_pos()
+        gameWindow.blit(bg, (0,0))
+        dt = clock.get_time()/1000
+        clock.tick(FPS)
+
+        if not paused:
+            replayTime = min(replay.endTime, replayTime + dt*replaySpeed)
+        state = replay.stateAt(replayTime)
+        rocket.center.update(state["x"], state["y"])
+        rocket.v.update(state["vx"], state["vy"])
+        rocket.angle = state["angle"]
+        rocket.throttle = state["throttle"]
+        rocket.fuelPercent = state["fuel"]
+        rocket.altitude = state["altitude"]
+        rocket.nearestPlanet = planets[min(state["planet"], len(planets) - 1)]
+
+        # flown part of the trajectory, then the planets and rocket
+        flown = int(np.searchsorted(trail["time"], replayTime, side="right"))
+        rocket.path.drawPolyline(gameWindow, camera, np.concatenate((trailPoints[:flown], [(state["x"], state["y"])])))
+        for planet in planets:
+            planet.draw(gameWindow, camera)
+        rocket.draw(gameWindow, camera)
+
+        hud.update([str(round(replayTime, 1)),
+                    str(round(rocket.altitude)),
+                    str(rocket.nearestPlanet.name),
+                    str(round(rocket.throttle*100)),
+                    str(round(rocket.v.length())),
+                    str(round(rocket.fuelPercent)),
+                    str(replaySpeed),
+                    ""])
+        hud.draw(gameWindow)
+
+        # timeline, clicking or dragging on it seeks
+        timeline = pygame.Rect(width//20, height*14//15, width*18//20, max(4, height//100))
+        duration = max(replay.endTime - replay.startTime, 1e-9)
+        pygame.draw.rect(gameWindow, GREY, timeline)
+        pygame.draw.rect(gameWindow, WHITE, (timeline.x, timeline.y,
+                                             round(timeline.w*(replayTime - replay.startTime)/duration), timeline.h))
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                gameMode = None
+                inPlay = False
+            if event.type == pygame.VIDEORESIZE:
+                resizer.push((event.w, event.h))
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_1:
+                    replaySpeed = max(0.25, replaySpeed/2)
+                elif event.key == pygame.K_2:
+                    replaySpeed = 1
+                elif event.key == pygame.K_3:
+                    replaySpeed = min(MAX_TIME_WARP, replaySpeed*2)
+                elif event.key == pygame.K_t:
+                    camera.tether = not camera.tether
+                elif event.key == pygame.K_ESCAPE:
+                    gameMode = "menuLoad"
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:
+                    mouseHeld = True
+                    if not timeline.inflate(0, 20).collidepoint(mousePos):
+                        camera.tether = False
+                if event.button == 4:
+                    camera.changeZoom("in", mousePos)
+                if event.button == 5:
+                    camera.changeZoom("out", mousePos)
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                mouseHeld = False
+            if event.type == pygame.MOUSEMOTION:
+                mouseMovedX, mouseMovedY = pygame.mouse.get_rel()
+                if mouseHeld and not camera.tether:
+                    camera.move(-mouseMovedX, -mouseMovedY)
+
+        # window resizing, laid out quickly while an edge is dragged and properly once it stops
+        resized = resizer.poll()
+        if resized != None:
+            (width, height), smoothScaling = resized
+            if gameWindow.get_size() != (width, height):
+                gameWindow = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+            if smoothScaling:
+                bg = assets.getScaled("space", (width, height), False)
+            else:
+                bg = scaleImage(bg, (width, height), False)
+            camera.resize(width, height)
+            hud.resize(width, height, smoothScaling)
+
+        if mouseHeld and timeline.inflate(0, 20).collidepoint(mousePos):
+            replayTime = replay.startTime + duration*min(1, max(0, (mousePos[0] - timeline.x)/timeline.w))
+        if camera.tether:
+            camera.followRocket(rocket)
+
+        if gameMode != "replay":
+            replay.close()
     
+saveWriter.close()
 pygame.quit()
         
         
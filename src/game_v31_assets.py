@@ -0,0 +1,358 @@
+#########################################
+# File Name: game_v31_assets.py
+# Description: Lazy, cached images, sounds and fonts for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import pygame, os, threading, hashlib, json, mmap
+from collections import OrderedDict
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+IMAGE = "image"
+SOUND = "sound"
+FONT = "font"
+
+FOLDERS = {IMAGE: "images", SOUND: "audio", FONT: "fonts"}
+CACHE_FOLDER = "cache"
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def scaleImage(surf, size, smooth=True):
+    """ Smooth (filtered) scaling where the pixel format allows it, nearest neighbour otherwise or if
+        smooth is False, which is several times faster. """
+    if smooth and surf.get_bitsize() >= 24:
+        return pygame.transform.smoothscale(surf, size)
+    return pygame.transform.scale(surf, size)
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class Asset():
+    """ A registered file: its kind, how to load it, and the loaded value once it has been used. """
+    def __init__(self, kind, filename, options, source=None, size=None, bake=True):
+        self.kind = kind
+        self.filename = filename
+        self.options = options      # alpha for images, volume for sounds, size for fonts
+        self.source = source        # for a scaled image, the name of the image it is scaled from
+        self.size = size            # scaled size, None for the image as it is
+        self.bake = bake            # keep a copy in the BakedCache
+        self.value = None           # ready to use
+        self.decoded = None         # decoded by the preload thread, images still need converting
+        self.refs = 0
+        self.bytes = 0
+        self.lock = threading.Lock()    # held while decoding, so the file is only read once
+
+    def path(self):
+        return os.path.join(FOLDERS[self.kind], self.filename)
+
+class BakedCache():
+    """ Converted (and scaled) image pixels kept on disk, so warm starts skip decoding and scaling.
+
+    Each entry is a raw pixel buffer named by a hash of the source file's contents, the size
+    and the pixel format, and is memory-mapped straight into a surface. index.json remembers
+    the hash of every source with its modification time and size, so a file is only hashed
+    again after it changes, and the entries of its old contents are deleted then.
+    """
+    def __init__(self, directory=CACHE_FOLDER):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.index = None       # source path: {"mtime", "bytes", "hash", "size"}
+
+    def loadIndex(self):
+        if self.index == None:
+            try:
+                with open(os.path.join(self.directory, "index.json")) as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                self.index = {}
+        return self.index
+
+    def saveIndex(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tempPath = os.path.join(self.directory, "index.json.tmp")
+            with open(tempPath, "w") as f:
+                json.dump(self.index, f)
+            os.replace(tempPath, os.path.join(self.directory, "index.json"))
+        except OSError:
+            pass    # a read-only install still runs, just without the cache
+
+    def sourceHash(self, path):
+        """ Hash of the file's contents, recomputed only when its modification time or size changes. """
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.loadIndex().get(path)
+            if entry != None and entry["mtime"] == stat.st_mtime_ns and entry["bytes"] == stat.st_size:
+                return entry["hash"]
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        with self.lock:
+            entry = self.index.get(path)
+            size = None
+            if entry != None and entry["hash"] == digest:
+                size = entry["size"]    # only touched, the entries are still good
+            elif entry != None:
+                self.prune(entry["hash"])
+            self.index[path] = {"mtime": stat.st_mtime_ns, "bytes": stat.st_size, "hash": digest, "size": size}
+            self.saveIndex()
+        return digest
+
+    def prune(self, digest):
+        """ Delete every entry of an old version of a source. """
+        try:
+            for filename in os.listdir(self.directory):
+                if filename.startswith(digest):
+                    os.remove(os.path.join(self.directory, filename))
+        except OSError:
+            pass
+
+    def entryPath(self, path, size, alpha):
+        """ Where the entry would be, or None if the native size of the image is not known yet. """
+        digest = self.sourceHash(path)
+        if size == None:
+            size = self.index[path]["size"]
+            if size == None:
+                return None, None
+        pixelFormat = "BGRA" if alpha else "RGBX"
+        filename = digest + "_" + str(size[0]) + "x" + str(size[1]) + "_" + pixelFormat + ".raw"
+        return os.path.join(self.directory, filename), tuple(size)
+
+    def has(self, path, size, alpha):
+        try:
+            entryPath = self.entryPath(path, size, alpha)[0]
+        except OSError:
+            return False    # no source, decoding reports it
+        return entryPath != None and os.path.exists(entryPath)
+
+    def nativeSize(self, path):
+        try:
+            self.sourceHash(path)
+        except OSError:
+            return None
+        size = self.index[path]["size"]
+        return None if size == None else tuple(size)
+
+    def load(self, path, size, alpha):
+        """ The entry as a surface in the display format, or None if there is none. """
+        try:
+            entryPath, size = self.entryPath(path, size, alpha)
+        except OSError:
+            return None
+        if entryPath == None or not os.path.exists(entryPath):
+            return None
+        with open(entryPath, "rb") as f:
+            pixels = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)   # private, writable, lazily read
+        if len(pixels) != size[0]*size[1]*4:
+            return None
+        if alpha:
+            surf = pygame.image.frombuffer(pixels, size, "BGRA")     # shares the mapped pixels
+            if surf.get_masks() != pygame.Surface((1,1), pygame.SRCALPHA).convert_alpha().get_masks():
+                surf = surf.convert_alpha()     # the display uses another channel order
+            return surf
+        return pygame.image.frombuffer(pixels, size, "RGBX").convert()
+
+    def store(self, path, surf, alpha, native):
+        try:
+            digest = self.sourceHash(path)
+            if native:
+                with self.lock:
+                    self.index[path]["size"] = list(surf.get_size())
+                    self.saveIndex()
+            entryPath = self.entryPath(path, surf.get_size(), alpha)[0]
+            os.makedirs(self.directory, exist_ok=True)
+            with open(entryPath + ".tmp", "wb") as f:
+                f.write(pygame.image.tobytes(surf, "BGRA" if alpha else "RGBX"))
+            os.replace(entryPath + ".tmp", entryPath)
+        except OSError:
+            pass
+
+class AssetManager():
+    """ Typed registry of the game's images, sounds and fonts.
+
+    Nothing is read from disk until an asset is first asked for. Loaded assets are kept
+    in a shared cache; past maxBytes the least recently used ones are dropped, except
+    those held with acquire() until they are release()d. preload() decodes a list of
+    assets in a background thread (for while the menu shows); images are only converted
+    to the display format on the main thread, when they are first used. Images (and the
+    scaled copies asked for with getScaled()) are also kept in baked, if given, and read
+    back from there instead of being decoded again.
+    """
+    def __init__(self, maxBytes=48*1024*1024, baked=None):
+        self.maxBytes = maxBytes
+        self.baked = baked
+        self.assets = {}
+        self.loaded = OrderedDict()     # names of loaded assets, least recently used first
+        self.bytes = 0
+        self.preloadThread = None
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self.assets
+
+    def __str__(self):
+        return "assets: " + str(len(self.loaded)) + "/" + str(len(self.assets)) + " loaded, " + \
+               str(self.bytes//1024) + " KB, loads: " + str(self.loads) + ", hits: " + str(self.hits) + \
+               ", evictions: " + str(self.evictions)
+
+    def registerImage(self, name, filename=None, alpha=True):
+        self.assets[name] = Asset(IMAGE, filename or name, alpha)
+
+    def registerSound(self, name, filename=None, volume=1):
+        self.assets[name] = Asset(SOUND, filename or name, volume)
+
+    def registerFont(self, name, filename, size):
+        self.assets[name] = Asset(FONT, filename, size)
+
+    def scaledName(self, name, size, bake=True):
+        """ Register a copy of image name scaled to size, and return its name. """
+        scaled = name + "@" + str(size[0]) + "x" + str(size[1])
+        if scaled not in self.assets:
+            source = self.assets[name]
+            self.assets[scaled] = Asset(IMAGE, source.filename, source.options, name, tuple(size), bake)
+        return scaled
+
+    def getScaled(self, name, size, bake=True):
+        """ Image name scaled to size, from the baked cache if it was scaled before. """
+        return self.get(self.scaledName(name, size, bake))
+
+    def imageSize(self, name):
+        """ Unscaled size of an image, without decoding it if it is baked. """
+        asset = self.assets[name]
+        if asset.value == None and self.baked != None:
+            size = self.baked.nativeSize(asset.path())
+            if size != None:
+                return size
+        return self.get(name).get_size()
+
+    def getScaledMaintainAspect(self, name, newW=None, newH=None, bake=True):
+        """ getScaled() to a width or a height, the way scaleMaintainAspect() sizes it. """
+        w, h = self.imageSize(name)
+        if newW == None:
+            newW = int(newH*w/h)
+        else:
+            newH = int(newW*h/w)
+        return self.getScaled(name, (newW, newH), bake)
+
+    def decode(self, asset):
+        """ The part of loading that is safe off the main thread. """
+        if asset.kind == IMAGE:
+            if asset.source != None:
+                return scaleImage(self.get(asset.source), asset.size)
+            return pygame.image.load(asset.path())
+        elif asset.kind == SOUND:
+            sound = pygame.mixer.Sound(asset.path())
+            sound.set_volume(asset.options)
+            return sound
+        else:
+            return pygame.font.Font(asset.path(), asset.options)
+
+    def finish(self, asset, decoded):
+        """ Main thread part: convert images to the display format and account for the memory. """
+        if asset.kind == IMAGE:
+            if asset.source != None:
+                value = decoded     # scaled from an already converted image
+            else:
+                value = decoded.convert_alpha() if asset.options else decoded.convert()
+            if self.baked != None and asset.bake:
+                self.baked.store(asset.path(), value, asset.options, asset.source == None)
+            asset.bytes = value.get_width()*value.get_height()*value.get_bytesize()
+        elif asset.kind == SOUND:
+            value = decoded
+            frequency, size, channels = pygame.mixer.get_init()
+            asset.bytes = int(value.get_length()*frequency*channels*abs(size)//8)
+        else:
+            value = decoded
+            asset.bytes = os.path.getsize(asset.path())
+        return value
+
+    def isReady(self, name):
+        """ True if get(name) would not have to read the file. """
+        asset = self.assets[name]
+        return asset.value != None or asset.decoded != None or self.isBaked(asset)
+
+    def isBaked(self, asset):
+        return asset.kind == IMAGE and self.baked != None and asset.bake and \
+               self.baked.has(asset.path(), asset.size, asset.options)
+
+    def loadBaked(self, asset):
+        """ The asset from the baked cache, or None if it is not in there. """
+        if asset.kind != IMAGE or self.baked == None or not asset.bake:
+            return None
+        value = self.baked.load(asset.path(), asset.size, asset.options)
+        if value != None:
+            asset.bytes = value.get_width()*value.get_height()*value.get_bytesize()
+        return value
+
+    def get(self, name):
+        """ The loaded asset, reading it now if it has not been used or preloaded yet. """
+        asset = self.assets[name]
+        if asset.value != None:
+            self.loaded.move_to_end(name)
+            self.hits += 1
+            return asset.value
+        with asset.lock:
+            decoded, asset.decoded = asset.decoded, None
+            value = None
+            if decoded == None:
+                value = self.loadBaked(asset)
+            if value == None:
+                if decoded == None:
+                    decoded = self.decode(asset)
+                value = self.finish(asset, decoded)
+            asset.value = value
+        self.loads += 1
+        self.loaded[name] = None
+        self.bytes += asset.bytes
+        asset.refs += 1     # never evict what is being returned
+        self.trim(self.maxBytes)
+        asset.refs -= 1
+        return asset.value
+
+    def acquire(self, name):
+        """ get() and keep the asset cached until release(). """
+        value = self.get(name)
+        self.assets[name].refs += 1
+        return value
+
+    def release(self, name):
+        asset = self.assets[name]
+        asset.refs = max(0, asset.refs - 1)
+
+    def trim(self, maxBytes=0, kind=None):
+        """ Drop least recently used assets (of one kind, if given) that nothing holds
+            until the cache fits in maxBytes. """
+        for name in list(self.loaded):
+            if self.bytes <= maxBytes:
+                break
+            asset = self.assets[name]
+            if asset.refs == 0 and kind in (None, asset.kind):
+                del self.loaded[name]
+                self.bytes -= asset.bytes
+                asset.value = None
+                self.evictions += 1
+
+    def preload(self, names):
+        """ Decode names in a background thread, in order. Returns the thread. """
+        def run():
+            for name in names:
+                asset = self.assets[name]
+                with asset.lock:
+                    if asset.value == None and asset.decoded == None:
+                        try:
+                            if self.isBaked(asset):
+                                continue    # get() maps it in, faster than decoding
+                            asset.decoded = self.decode(asset)
+                        except (pygame.error, OSError):
+                            continue    # missing file or pygame shutting down, get() reports it
+        self.preloadThread = threading.Thread(target=run, daemon=True)
+        self.preloadThread.start()
+        return self.preloadThread
+
+assets = AssetManager(baked=BakedCache())     # shared by the game and the classes that load files
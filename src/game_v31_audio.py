@@ -0,0 +1,250 @@
+#########################################
+# File Name: game_v31_audio.py
+# Description: Mixer channels with shared sounds, change-only volume updates and streamed clips for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import pygame, threading, wave, time
+import numpy as np
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+MIXER_STEPS = 128       # the mixer's volume resolution, finer changes are not pushed to it
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def mixerVolume(volume):
+    """ volume as the mixer stores it, 0 to MIXER_STEPS. """
+    return round(min(1, max(0, volume))*MIXER_STEPS)
+
+def wavLength(filename):
+    """ Length of a wav file in seconds, from its header only. None if it is not a 16 bit wav. """
+    try:
+        with wave.open(filename) as f:
+            if f.getsampwidth() != 2:
+                return None
+            return f.getnframes()/f.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class SoundChannel():
+    """ A mixer channel playing one asset at a base volume times a level.
+
+    The sound is only decoded the first time it plays, and channels naming the same asset
+    share its buffer, since volumes are set on the channel. Whether a looping sound is
+    playing is tracked here instead of asked of the mixer, and a new level is only pushed
+    to the mixer when it changes the mixer's volume, so calling loop() and stop() every
+    frame costs no mixer calls while nothing audible changes.
+    """
+    def __init__(self, audio, channelId, soundName, volume=1):
+        self.audio = audio
+        self.channel = pygame.mixer.Channel(channelId)
+        self.soundName = soundName
+        self.volume = volume
+        self.sound = None
+        self.looping = False
+        self.mixerVolume = None     # last volume pushed to the mixer
+
+    def length(self):
+        return self.getSound().get_length()
+
+    def getSound(self):
+        if self.sound == None:
+            self.sound = self.audio.assets.acquire(self.soundName)
+        return self.sound
+
+    def setLevel(self, level):
+        volume = mixerVolume(self.volume*level)
+        if volume != self.mixerVolume:
+            self.channel.set_volume(volume/MIXER_STEPS)
+            self.mixerVolume = volume
+            self.audio.mixerCalls += 1
+
+    def play(self, level=1, loops=0):
+        self.setLevel(level)
+        self.channel.play(self.getSound(), loops)
+        self.looping = loops != 0
+        self.audio.mixerCalls += 1
+
+    def loop(self, level=1):
+        """ Keep the sound looping at level, starting it if it is not. """
+        if self.looping:
+            self.setLevel(level)
+        else:
+            self.play(level, -1)
+
+    def stop(self):
+        if self.looping:
+            self.channel.stop()
+            self.looping = False
+            self.audio.mixerCalls += 1
+
+    def stopped(self):
+        """ The mixer was stopped as a whole. """
+        self.looping = False
+
+class StreamChannel(SoundChannel):
+    """ A SoundChannel for long clips, read from disk in chunks instead of decoded whole.
+
+    While playing, the channel has the chunk it is playing and the next one queued; the
+    audio thread reads another once the queued one has started. Chunks are converted to
+    the mixer's rate and channels as they are read, so only about two chunks are ever held.
+    """
+    def __init__(self, audio, channelId, soundName, volume=1, chunkSeconds=0.5):
+        SoundChannel.__init__(self, audio, channelId, soundName, volume)
+        self.path = audio.assets.assets[soundName].path()
+        self.chunkSeconds = chunkSeconds
+        self.lock = threading.Lock()    # the audio thread refills while the game starts and stops
+        self.file = None
+        self.playing = False
+        self.loops = 0
+
+    def length(self):
+        return wavLength(self.path)
+
+    def play(self, level=1, loops=0):
+        with self.lock:
+            self.setLevel(level)
+            self.closeFile()
+            self.file = wave.open(self.path)
+            self.srcPos = 0.0       # position in source frames of the next output frame
+            self.loops = loops
+            chunk = self.readChunk()
+            if chunk == None:
+                return      # an empty file
+            self.channel.play(chunk)
+            self.audio.mixerCalls += 1
+            chunk = self.readChunk()
+            if chunk != None:
+                self.channel.queue(chunk)
+            self.playing = True
+            self.looping = loops != 0
+        self.audio.wakeStreams()
+
+    def readChunk(self):
+        """ The next chunk as a Sound in the mixer's format, or None at the end of the clip. """
+        frequency, size, channels = pygame.mixer.get_init()
+        f = self.file
+        srcRate, srcChannels, srcFrames = f.getframerate(), f.getnchannels(), f.getnframes()
+        if self.srcPos >= srcFrames - 1:
+            if self.loops == 0:
+                return None
+            if self.loops > 0:
+                self.loops -= 1
+            self.srcPos = 0.0
+        step = srcRate/frequency
+        count = max(1, min(int(self.chunkSeconds*frequency), int((srcFrames - 1 - self.srcPos)/step) + 1))
+        positions = self.srcPos + np.arange(count)*step
+        first = int(positions[0])
+        last = min(srcFrames - 1, int(positions[-1]) + 1)
+        f.setpos(first)
+        src = np.frombuffer(f.readframes(last - first + 1), np.int16).reshape(-1, srcChannels).astype(np.float32)
+        index = np.arange(first, first + len(src))
+        out = np.empty((count, channels), np.int16)
+        for c in range(channels):
+            out[:,c] = np.interp(positions, index, src[:,c % srcChannels])    # mono spreads to every speaker
+        self.srcPos = positions[-1] + step
+        return pygame.mixer.Sound(buffer=out.tobytes())
+
+    def refill(self):
+        """ Queue the next chunk once the queued one has started. Returns whether still streaming. """
+        with self.lock:
+            if not self.playing:
+                return False
+            if self.channel.get_queue() == None:
+                chunk = self.readChunk()
+                if chunk == None:
+                    self.playing = self.looping = False
+                    self.closeFile()
+                    return False
+                self.channel.queue(chunk)
+            return True
+
+    def closeFile(self):
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+    def stop(self):
+        with self.lock:
+            if self.playing:
+                self.channel.stop()
+                self.audio.mixerCalls += 1
+            self.playing = self.looping = False
+            self.closeFile()
+
+    def stopped(self):
+        with self.lock:
+            self.playing = self.looping = False
+            self.closeFile()
+
+class Audio():
+    """ The game's sound channels by name, with a thread that keeps streamed clips fed.
+
+    channel() gives clips longer than streamSeconds a StreamChannel and everything else a
+    SoundChannel. The thread only runs while something streams, every refillInterval seconds.
+    """
+    def __init__(self, assets, streamSeconds=5, refillInterval=0.05):
+        self.assets = assets
+        self.streamSeconds = streamSeconds
+        self.refillInterval = refillInterval
+        self.channels = {}
+        self.mixerCalls = 0
+        self.wake = threading.Event()
+        self.thread = None
+
+    def __getitem__(self, name):
+        return self.channels[name]
+
+    def __str__(self):
+        return "audio: " + str(len(self.channels)) + " channels, " + \
+               str(sum(isinstance(channel, StreamChannel) for channel in self.channels.values())) + \
+               " streamed, mixer calls: " + str(self.mixerCalls)
+
+    def channel(self, name, channelId, soundName, volume=1):
+        """ Add a channel called name playing the registered sound soundName at volume. """
+        length = wavLength(self.assets.assets[soundName].path())
+        if length != None and length > self.streamSeconds and pygame.mixer.get_init()[1] == -16:
+            channel = StreamChannel(self, channelId, soundName, volume)
+        else:
+            channel = SoundChannel(self, channelId, soundName, volume)
+        self.channels[name] = channel
+        return channel
+
+    def streamed(self):
+        """ Names of the sounds streamed instead of decoded, for leaving out of preloading. """
+        return [channel.soundName for channel in self.channels.values() if isinstance(channel, StreamChannel)]
+
+    def stopAll(self):
+        pygame.mixer.stop()
+        self.mixerCalls += 1
+        for channel in self.channels.values():
+            channel.stopped()
+
+    def wakeStreams(self):
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()   # before refilling, so a stream started meanwhile sets it again
+            streaming = False
+            for channel in list(self.channels.values()):
+                if isinstance(channel, StreamChannel):
+                    try:
+                        streaming |= channel.refill()
+                    except pygame.error:
+                        return      # the mixer has been shut down
+            if streaming:
+                self.wake.set()
+                time.sleep(self.refillInterval)
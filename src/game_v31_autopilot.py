@@ -0,0 +1,274 @@
+#########################################
+# File Name: game_v31_autopilot.py
+# Description: Fuel-optimal ascent profile search on a process pool for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import os, sys, json, hashlib, argparse
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")    # once per worker process is plenty
+import numpy as np
+from time import perf_counter
+from math import degrees, atan2, inf
+from concurrent.futures import ProcessPoolExecutor
+from game_v31_physics import ROCKET_SPECS, RocketPhysics, Simulation, makePlanets
+from game_v31_kepler import KeplerCoast
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+VERSION = 1     # bump when the physics or the flight plan changes, cached profiles are searched again
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "autopilot")
+
+STEP = 1/60             # simulation seconds per step, as SimClock takes them
+MAX_TURN_RATE = 20      # degrees per second the autopilot turns the rocket at most
+MAX_ASCENT_TIME = 600   # seconds before an ascent that has not reached its apoapsis is given up
+FAILED = 1000           # score of a flight that does not make orbit, lowered by how close it came
+
+## profile parameters: [name, lower bound, upper bound]
+## the rocket pitches from straight up through angle1..3 (degrees from the horizon) between
+## pitchStart and pitchStart + pitchTime, while the throttle follows throttle0..3 over the same time
+PARAMS = [["pitchStart", 0, 30], ["pitchTime", 10, 300],
+          ["angle1", 0, 90], ["angle2", 0, 90], ["angle3", 0, 90],
+          ["throttle0", 0.2, 1], ["throttle1", 0.2, 1], ["throttle2", 0.2, 1], ["throttle3", 0.2, 1]]
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def angleDiff(a, b):
+    """ a - b in degrees, the short way round. """
+    return (a - b + 180) % 360 - 180
+
+def profileSchedule(profile, t):
+    """ Target angle and throttle of a profile (a dict of PARAMS) at t seconds after launch. """
+    progress = min(1, max(0, (t - profile["pitchStart"])/profile["pitchTime"]))*3
+    angles = [90, profile["angle1"], profile["angle2"], profile["angle3"]]
+    throttles = [profile["throttle" + str(i)] for i in range(4)]
+    i = min(2, int(progress))
+    f = progress - i
+    return angles[i] + (angles[i + 1] - angles[i])*f, throttles[i] + (throttles[i + 1] - throttles[i])*f
+
+def orbitOf(sim, coast):
+    """ Orbit of the rocket around its dominant planet, and that planet. """
+    rocket = sim.rocket
+    planet = coast.dominantPlanet(rocket.center)
+    return coast.makeOrbit(planet, rocket.center, rocket.v), planet
+
+def apoapsis(orbit):
+    """ Farthest distance from the planet's center, None on an escape trajectory. """
+    if orbit.alpha <= 0:
+        return None
+    return (1 + orbit.e)/orbit.alpha
+
+def steer(rocket, pitch):
+    """ Turn towards pitch degrees above the local horizon, heading for +x over the top of the
+        planet, no faster than MAX_TURN_RATE. """
+    angle = rocket.angFromPlanet - 90 + pitch
+    rocket.angV = max(-MAX_TURN_RATE, min(MAX_TURN_RATE, angleDiff(angle, rocket.angle)/STEP))
+
+def fly(rocketName, planetName, profile, altitude, bound=inf):
+    """ Fly a profile to a circular orbit altitude above the planet. Returns (score, summary).
+
+    The ascent follows the profile until the apoapsis reaches altitude, the rocket then coasts
+    there on its Kepler orbit and burns prograde at full throttle until the periapsis is up
+    too. The score is the fuel used in percent, or FAILED and more for a flight that crashes
+    (it is stopped as soon as detectCrash() says so), runs dry or never gets high enough.
+    A flight is also stopped once it has used more than bound, scoring the fuel used so far.
+    """
+    planets = makePlanets()
+    startPlanet = [planet for planet in planets if planet.name == planetName][0]
+    rocket = RocketPhysics.fromSpec(ROCKET_SPECS[rocketName], startPlanet, planets)
+    coast = KeplerCoast(planets)
+    sim = Simulation(rocket, planets, "verlet", coast)
+    target = startPlanet.r + altitude
+    sim.launch()
+
+    highest = 0     # apoapsis altitude reached, for scoring failures
+    while True:
+        pitch, throttle = profileSchedule(profile, sim.time)
+        steer(rocket, pitch)
+        rocket.throttle = throttle
+        sim.step(STEP)
+        if rocket.crashed or rocket.fuelPercent <= 0 or sim.time > MAX_ASCENT_TIME or \
+           (sim.time > 20 and rocket.altitude < 1):
+            result = "crashed" if rocket.crashed else "failed"
+            return FAILED*(2 - min(1, highest/altitude)), {"result": result}
+        if 100 - rocket.fuelPercent > bound:
+            return 100 - rocket.fuelPercent, {"result": "pruned"}
+        if rocket.altitude <= 0:
+            continue
+        orbit, planet = orbitOf(sim, coast)
+        apo = apoapsis(orbit)
+        if apo == None or apo >= target:
+            break   # main engine cut off
+        highest = max(highest, apo - planet.r)
+
+    rocket.throttle = 0
+    rocket.angV = 0
+    tPeri = orbit.timeToPeriapsis()
+    if orbit.period != None and tPeri != None:
+        sim.coastFor((tPeri - orbit.period/2) % orbit.period)     # to the apoapsis
+
+    while True:
+        orbit, planet = orbitOf(sim, coast)
+        if orbit.periapsis >= target*0.99 or apoapsis(orbit) == None:
+            break
+        rocket.angle = degrees(atan2(-rocket.v.y, rocket.v.x))   # prograde, turned while coasting
+        rocket.angV = 0
+        rocket.throttle = 1
+        sim.step(STEP)
+        if rocket.crashed or rocket.fuelPercent <= 0:
+            return FAILED, {"result": "crashed" if rocket.crashed else "out of fuel"}
+        if 100 - rocket.fuelPercent > bound:
+            return 100 - rocket.fuelPercent, {"result": "pruned"}
+    rocket.throttle = 0
+
+    if apoapsis(orbit) == None or planet != startPlanet:
+        return FAILED, {"result": "escaped"}
+    return 100 - rocket.fuelPercent, {"result": "orbit", "fuel": 100 - rocket.fuelPercent, "time": sim.time,
+                                      "periapsis": orbit.periapsis - planet.r,
+                                      "apoapsis": apoapsis(orbit) - planet.r}
+
+def evaluate(job):
+    """ fly() for a pool worker: job is (rocketName, planetName, parameter vector, altitude, bound). """
+    rocketName, planetName, x, altitude, bound = job
+    profile = {name: float(value) for (name, lo, hi), value in zip(PARAMS, x)}
+    return fly(rocketName, planetName, profile, altitude, bound)
+
+def cacheKey(rocketName, planetName, altitude):
+    """ Changes whenever anything a cached profile was optimized for does. """
+    planet = [planet for planet in makePlanets() if planet.name == planetName][0]
+    data = [VERSION, ROCKET_SPECS[rocketName], planetName, planet.r, planet.mass, altitude, STEP, PARAMS]
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()
+
+def cachePath(rocketName, planetName):
+    return os.path.join(CACHE_FOLDER, rocketName + "_" + planetName + ".json")
+
+def loadProfile(rocketName, planetName="earth", altitude=2000):
+    """ The cached best profile for a rocket and planet, or None if it has to be searched for. """
+    try:
+        with open(cachePath(rocketName, planetName)) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("key") != cacheKey(rocketName, planetName, altitude) or \
+       cached.get("summary", {}).get("result") != "orbit":
+        return None
+    return cached
+
+def optimize(rocketName, planetName="earth", altitude=2000, pool=None, population=48, eliteFraction=0.2,
+             generations=40, patience=6, seed=0, log=None):
+    """ Cross-entropy search for the profile that makes orbit on the least fuel.
+
+    Each generation samples population profiles from a normal distribution over the
+    parameter box (scaled to 0..1), flies them all on pool and refits the distribution to
+    the best eliteFraction of them. Flights using more fuel than the last elite of the
+    generation before are cut short, they would not make this one's elite either. Stops
+    after generations, or patience generations without a better profile. Returns the cache
+    record of the best one; its profile is None if no generation was flown.
+    """
+    rng = np.random.default_rng(seed)
+    lo = np.array([p[1] for p in PARAMS], dtype=float)
+    hi = np.array([p[2] for p in PARAMS], dtype=float)
+    mean = np.full(len(PARAMS), 0.5)
+    std = np.full(len(PARAMS), 0.3)
+    numElite = max(2, int(population*eliteFraction))
+    best = (inf, None, None)
+    bound = inf
+    stale = 0
+    evaluations = 0
+    start = perf_counter()
+
+    for generation in range(generations):
+        unit = np.clip(rng.normal(mean, std, (population, len(PARAMS))), 0, 1)
+        xs = lo + unit*(hi - lo)
+        jobs = [(rocketName, planetName, x, altitude, bound) for x in xs]
+        if pool != None:
+            results = list(pool.map(evaluate, jobs, chunksize=4))
+        else:
+            results = list(map(evaluate, jobs))
+        evaluations += population
+        scores = np.array([score for score, summary in results])
+        order = np.argsort(scores)
+        if scores[order[numElite - 1]] < FAILED:
+            bound = scores[order[numElite - 1]]
+        if scores[order[0]] < best[0] - 1e-6:
+            best = (scores[order[0]], xs[order[0]], results[order[0]][1])
+            stale = 0
+        else:
+            stale += 1
+        elite = unit[order[:numElite]]
+        mean = elite.mean(axis=0)
+        std = np.maximum(elite.std(axis=0), 0.01)   # keep searching a little around the elite
+        if log != None:
+            made = sum(summary["result"] == "orbit" for score, summary in results)
+            log("  generation " + str(generation) + ": " + str(made) + "/" + str(population) + " made orbit, " +
+                ("best " + str(round(best[0], 3)) + " % fuel" if best[0] < FAILED else "none so far"))
+        if stale >= patience:
+            break
+
+    score, x, summary = best
+    profile = None
+    if x is not None:
+        profile = {p[0]: float(value) for p, value in zip(PARAMS, x)}
+    return {"key": cacheKey(rocketName, planetName, altitude), "rocket": rocketName, "planet": planetName,
+            "altitude": altitude, "profile": profile, "summary": summary or {"result": "not flown"},
+            "evaluations": evaluations, "seconds": perf_counter() - start}
+
+def bestProfile(rocketName, planetName="earth", altitude=2000, pool=None, **options):
+    """ The cached profile for a rocket and planet, optimizing and caching it first if there is none.
+        Only profiles that make orbit are cached, a failed search is tried again next time. """
+    cached = loadProfile(rocketName, planetName, altitude)
+    if cached != None:
+        return cached
+    record = optimize(rocketName, planetName, altitude, pool, **options)
+    if record["summary"]["result"] != "orbit":
+        return record
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    tempPath = cachePath(rocketName, planetName) + ".tmp"
+    with open(tempPath, "w") as f:
+        json.dump(record, f, indent=1)
+    os.replace(tempPath, cachePath(rocketName, planetName))
+    return record
+
+#-----------------------------#
+# Main Program                #
+#-----------------------------#
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Search fuel-optimal ascent profiles for each rocket.")
+    parser.add_argument("rockets", nargs="*", help="rockets to plan for, all if none: " + ", ".join(ROCKET_SPECS))
+    parser.add_argument("--planet", default="earth", help="planet to launch from")
+    parser.add_argument("--altitude", type=float, default=2000, help="altitude of the circular orbit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="simulation processes")
+    parser.add_argument("--population", type=int, default=48, help="profiles flown per generation")
+    parser.add_argument("--generations", type=int, default=40, help="generations at most")
+    parser.add_argument("--force", action="store_true", help="search again even if a profile is cached")
+    args = parser.parse_args(args)
+    for rocketName in args.rockets:     # not choices=, which rejects no rockets at all before Python 3.13
+        if rocketName not in ROCKET_SPECS:
+            parser.error("unknown rocket " + repr(rocketName) + " (choose from " + ", ".join(ROCKET_SPECS) + ")")
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        for rocketName in args.rockets or ROCKET_SPECS:
+            if args.force:
+                try:
+                    os.remove(cachePath(rocketName, args.planet))
+                except OSError:
+                    pass
+            start = perf_counter()
+            cached = loadProfile(rocketName, args.planet, args.altitude)
+            if cached == None:
+                print(rocketName + " from " + args.planet + ":")
+            record = cached or bestProfile(rocketName, args.planet, args.altitude, pool,
+                                           population=args.population, generations=args.generations, log=print)
+            summary = record["summary"]
+            print(rocketName + ": " + summary["result"] + " on " + str(round(summary.get("fuel", 0), 2)) +
+                  " % fuel, " + ("cached" if cached != None else str(record["evaluations"]) + " flights") +
+                  ", " + str(round((perf_counter() - start)*1000, 1)) + " ms")
+            if record["profile"] != None:
+                print("  " + ", ".join(name + " " + str(round(value, 3)) for name, value in record["profile"].items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+#########################################
+# File Name: game_v31_batch.py
+# Description: Vectorized rocket physics for many rockets at once
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import numpy as np
+from game_v31_physics import G, makePlanets
+from game_v31_gravity import BodySystem
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def pyMod(x, y):
+    """ Python's float % (result takes the sign of y), faster than np.mod. """
+    r = np.fmod(x, y)
+    r[r < 0] += y
+    return r
+
+def blend(mask, new, old, rows=False):
+    """ new where mask is set, old elsewhere. mask=None means every element takes new. """
+    if mask is None:
+        return new
+    if rows:
+        mask = mask[:,None]
+    return np.where(mask, new, old)
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class RocketBatch():
+    """ N rockets stored as arrays and stepped together, matching RocketPhysics.update.
+
+    With a BodySystem for planets, gravity and nearest planets come from its Barnes-Hut
+    tree instead of one pass per planet, and the batch steps the bodies along with it.
+    """
+    def __init__(self, w, h, mass, maxThrust, startPlanet, planets):
+        self.planets = planets
+        if isinstance(planets, BodySystem):
+            self.bodies = planets
+            self.planetPos = planets.pos        # (P, 2), moved in place by the system
+            self.planetR = planets.r
+            self.planetGM = planets.gm
+            self.planetV = planets.v
+        else:
+            self.bodies = None
+            self.planetPos = np.array([planet.pos for planet in planets], dtype=np.float64)    # (P, 2)
+            self.planetR = np.array([planet.r for planet in planets], dtype=np.float64)
+            self.planetGM = np.array([G*planet.mass for planet in planets], dtype=np.float64)
+            self.planetV = np.zeros((len(planets), 2))
+
+        self.w = np.asarray(w, dtype=np.float64)
+        self.h = np.asarray(h, dtype=np.float64)
+        self.mass = np.asarray(mass, dtype=np.float64)
+        self.maxThrust = np.asarray(maxThrust, dtype=np.float64)
+        n = len(self.h)
+        self.n = n
+
+        self.startIndex = planets.index(startPlanet)
+        self.center = np.empty((n, 2))
+        self.angle = np.empty(n)
+        self.fuelPercent = np.empty(n)
+        self.throttle = np.empty(n)
+        self.thrust = np.empty(n)
+        self.v = np.empty((n, 2))
+        self.angV = np.empty(n)
+        self.cosAngle = np.empty(n)
+        self.sinAngle = np.empty(n)
+
+        self.nearest = np.empty(n, dtype=np.intp)     # index into planets
+        self.altitude = np.empty(n)
+
+        self.crashed = np.empty(n, dtype=bool)
+        self.launched = np.empty(n, dtype=bool)
+        self.reset()
+        self.time = 0
+
+    @classmethod
+    def fromSpec(cls, spec, n, planets=None):
+        """ n copies of one rocket spec, all standing on the first planet. """
+        if planets == None:
+            planets = makePlanets()
+        height, mass, maxThrust, width = spec
+        return cls(np.full(n, width), np.full(n, height), np.full(n, mass),
+                   np.full(n, maxThrust), planets[0], planets)
+
+    @classmethod
+    def fromRockets(cls, rockets, planets):
+        """ Copy the current state of a list of RocketPhysics into a batch. """
+        batch = cls([r.w for r in rockets], [r.h for r in rockets], [r.mass for r in rockets],
+                    [r.maxThrust for r in rockets], planets[0], planets)
+        batch.center[:] = [tuple(r.center) for r in rockets]
+        batch.v[:] = [tuple(r.v) for r in rockets]
+        for name in ["angle", "fuelPercent", "throttle", "thrust", "angV", "altitude",
+                     "crashed", "launched"]:
+            getattr(batch, name)[:] = [getattr(r, name) for r in rockets]
+        batch.nearest[:] = [planets.index(r.nearestPlanet) for r in rockets]
+        angle = np.radians(batch.angle)
+        batch.cosAngle, batch.sinAngle = np.cos(angle), np.sin(angle)
+        return batch
+
+    def reset(self, mask=None):
+        """ Put rockets back on the start planet with a full tank, unlaunched. mask=None means every rocket. """
+        rows = slice(None) if mask is None else mask
+        start = self.startIndex
+        self.center[rows,0] = int(self.planetPos[start,0])
+        self.center[rows,1] = np.trunc(self.planetPos[start,1] - self.planetR[start] - self.h[rows]/2)
+        self.angle[rows] = 90
+        self.fuelPercent[rows] = 100
+        self.throttle[rows] = 0
+        self.thrust[rows] = 0
+        self.v[rows] = 0
+        self.angV[rows] = 0
+        self.cosAngle[rows] = 0
+        self.sinAngle[rows] = 1
+        self.nearest[rows] = start
+        self.altitude[rows] = 0
+        self.crashed[rows] = False
+        self.launched[rows] = False
+
+    def nearestPlanets(self):
+        return [self.planets[i] for i in self.nearest]
+
+    def launch(self, mask=None):
+        if mask is None:
+            mask = slice(None)
+        self.throttle[mask] = 1
+        self.launched[mask] = True
+
+    def detectCrash(self, active):
+        grounded = np.flatnonzero(active & (self.altitude <= 0))
+        if len(grounded) > 0:
+            angFromPlanet = self.relativeAngle(grounded)
+            vToPlanet, vTanPlanet = self.relativeVelocity(grounded, angFromPlanet)
+            self.v[grounded] = self.planetV[self.nearest[grounded]]
+            self.angV[grounded] *= 0.3
+            self.crashed[grounded] |= (np.abs(self.angle[grounded] - angFromPlanet) > 5) & \
+                                      (vToPlanet < 7) & (vTanPlanet < 5)
+
+    def gravity(self, center):
+        """ Summed gravity acceleration (x, y) of all planets, zero from the planet a grounded rocket sits on. """
+        cx, cy = center[:,0], center[:,1]
+        grounded = self.altitude <= 0
+        if self.bodies is not None:
+            a = self.bodies.gravityAt(center, np.where(grounded, self.nearest, -1))
+            return a[:,0], a[:,1]
+        anyGrounded = grounded.any()
+        ax, ay = 0, 0
+        for i in range(len(self.planets)):
+            dx = self.planetPos[i,0] - cx
+            dy = self.planetPos[i,1] - cy
+            dSquared = dx*dx + dy*dy
+            scale = self.planetGM[i]/(dSquared*np.sqrt(dSquared))
+            if anyGrounded:
+                scale[grounded & (self.nearest == i)] = 0
+            ax = ax + dx*scale
+            ay = ay + dy*scale
+        return ax, ay
+
+    def step(self, dt, timeWarp=1):
+        """ Advance every launched rocket that has not crashed; the rest keep their state. """
+        active = self.launched & ~self.crashed
+        if active.all():
+            active = None   # skip masking in the common case where everything is flying
+        elif not active.any():
+            return
+        h = dt*timeWarp
+        if self.bodies is not None:
+            self.bodies.step(h)
+        self.detectCrash(self.launched if active is None else active)
+
+        hasFuel = self.fuelPercent > 0
+        self.fuelPercent -= blend(active, hasFuel*self.throttle*h*0.2, 0)
+
+        self.angle += blend(active, pyMod(self.angV*h, 360), 0)
+
+        angle = np.radians(self.angle)
+        self.cosAngle, self.sinAngle = np.cos(angle), np.sin(angle)   # shared by thrust and corners
+
+        hasFuel = self.fuelPercent > 0
+        self.throttle = blend(active, self.throttle*hasFuel, self.throttle)
+        self.thrust = blend(active, self.throttle*self.maxThrust, self.thrust)
+        thrustMag = self.thrust/self.mass
+
+        gravityX, gravityY = self.gravity(self.center)
+        self.v[:,0] += blend(active, (thrustMag*self.cosAngle + gravityX)*h, 0)
+        self.v[:,1] += blend(active, (gravityY - thrustMag*self.sinAngle)*h, 0)
+        self.center += blend(active, self.v*h, 0, True)
+
+        self.updateSurroundings(active)
+        self.time += h
+
+    @property
+    def thrustA(self):
+        thrustMag = self.thrust/self.mass
+        return np.stack((thrustMag*self.cosAngle, -thrustMag*self.sinAngle), axis=1)
+
+    def updateSurroundings(self, active=None):
+        """ Recompute nearest planet and altitude; active=None means every rocket. """
+        cx, cy = self.center[:,0], self.center[:,1]
+
+        planetX, planetY = self.planetPos[:,0], self.planetPos[:,1]
+        if self.bodies is not None:
+            nearest = blend(active, self.bodies.nearest(self.center)[0], self.nearest)
+            nearestDSquared = (planetX.take(nearest) - cx)**2 + (planetY.take(nearest) - cy)**2
+        else:
+            # same order of comparisons as RocketPhysics, one vectorized pass per planet
+            nearest = self.nearest
+            nearestDSquared = (planetX.take(nearest) - cx)**2 + (planetY.take(nearest) - cy)**2
+            for i in range(len(self.planets)):
+                dSquared = (planetX[i] - cx)**2 + (planetY[i] - cy)**2
+                closer = dSquared < nearestDSquared
+                if active is not None:
+                    closer &= active
+                if closer.any():
+                    nearest = np.where(closer, i, nearest)
+                    nearestDSquared = np.where(closer, dSquared, nearestDSquared)
+        self.nearest = nearest
+        offX, offY = cx - planetX.take(nearest), cy - planetY.take(nearest)
+
+        # the closest corner is center + along + across with both signs chosen against the offset,
+        # and since along and across are perpendicular its squared distance expands to:
+        halfH, halfW = self.h/2, self.w/2
+        alongDot = np.abs(offX*self.cosAngle - offY*self.sinAngle)*halfH
+        acrossDot = np.abs(offX*self.sinAngle + offY*self.cosAngle)*halfW
+        closestCorner = nearestDSquared + halfH*halfH + halfW*halfW - 2*(alongDot + acrossDot)
+        self.altitude = blend(active, np.sqrt(closestCorner) - self.planetR.take(nearest), self.altitude)
+
+    def relativeAngle(self, rows=slice(None)):
+        """ Angle of the rocket around its nearest planet in degrees, computed on demand. """
+        nearest = self.nearest[rows]
+        offX = self.center[rows,0] - self.planetPos[nearest,0]
+        offY = self.center[rows,1] - self.planetPos[nearest,1]
+        return pyMod(np.degrees(np.arctan2(-offY, offX)), 360)
+
+    def relativeVelocity(self, rows=slice(None), angFromPlanet=None):
+        """ Velocity towards and tangent to the nearest planet, computed on demand since only crashes need it. """
+        if angFromPlanet is None:
+            angFromPlanet = self.relativeAngle(rows)
+        planetV = self.planetV[self.nearest[rows]]      # relative to the planet, which may be moving
+        vx, vy = self.v[rows,0] - planetV[:,0], self.v[rows,1] - planetV[:,1]
+        speed = np.sqrt(vx*vx + vy*vy)
+        # same (degree valued) argument as RocketPhysics.updateSurroundings so both paths agree
+        relAngle = np.degrees(np.arctan2(vy, vx)) - angFromPlanet + 180
+        return np.cos(relAngle)*speed, np.abs(np.sin(relAngle)*speed)
+
+    @property
+    def angFromPlanet(self):
+        return self.relativeAngle()
+
+    @property
+    def vToPlanet(self):
+        return self.relativeVelocity()[0]
+
+    @property
+    def vTanPlanet(self):
+        return self.relativeVelocity()[1]
+
+    def run(self, duration, dt=1/60, timeWarp=1):
+        """ Step until duration simulation seconds have passed or every rocket has crashed. """
+        while self.time < duration and (self.launched & ~self.crashed).any():
+            self.step(dt, timeWarp)
+        return self
@@ -0,0 +1,255 @@
+#########################################
+# File Name: game_v31_bench.py
+# Description: Headless benchmarks of the simulation and drawing hot paths for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import os, sys, json, argparse, platform
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")   # drawing benchmarks need no window
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import pygame
+import numpy as np
+from time import perf_counter
+from math import sqrt, pi, sin, cos, degrees, atan2
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+MODULE_FOLDER = os.path.dirname(os.path.abspath(__file__))     # fonts are found from here, not the caller's directory
+
+## ascent of the launch benchmark, a falcon9 profile found by game_v31_autopilot.py
+LAUNCH_PROFILE = {"pitchStart": 0.39, "pitchTime": 142.03, "angle1": 5.96, "angle2": 66.74, "angle3": 28.24,
+                  "throttle0": 1, "throttle1": 0.957, "throttle2": 0.572, "throttle3": 0.637}
+LAUNCH_ALTITUDE = 2000
+
+pygame.init()
+screen = pygame.display.set_mode((800,600))
+
+from game_v31_classes import *
+from game_v31_kepler import KeplerCoast
+from game_v31_hud import Hud
+from game_v31_autopilot import STEP, profileSchedule, steer, orbitOf, apoapsis
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def measure(fn, calls, opsPerCall=1, warmup=3):
+    """ Time calls of fn(i). Returns latency percentiles in ms and operations per second. """
+    for i in range(warmup):
+        fn(i)
+    times = np.empty(calls)
+    for i in range(calls):
+        start = perf_counter()
+        fn(i)
+        times[i] = perf_counter() - start
+    return {"calls": calls,
+            "p50": float(np.percentile(times, 50))*1000,
+            "p90": float(np.percentile(times, 90))*1000,
+            "p99": float(np.percentile(times, 99))*1000,
+            "max": float(times.max())*1000,
+            "opsPerSec": opsPerCall*calls/float(times.sum())}
+
+def stateCheck(rocket):
+    """ Rounded final state, so a changed result shows up next to the changed timings. """
+    return [round(rocket.center.x, 3), round(rocket.center.y, 3), round(rocket.v.x, 5), round(rocket.v.y, 5)]
+
+def makeRocket(planets, spec="falcon9"):
+    return Rocket(200, [None] + ROCKET_SPECS[spec], planets[0], planets)     # no image, drawn as a rectangle
+
+def benchLaunch(scale):
+    """ Rocket.update through a launch to a 2000 m orbit, one call per 1/60 s step: the ascent
+        flies LAUNCH_PROFILE, a call coasts to the apoapsis, then a prograde burn circularizes
+        and the rocket stays in orbit for the calls left. """
+    planets = makePlanets()
+    earth = planets[0]
+    rocket = makeRocket(planets)
+    coast = KeplerCoast(planets)
+    sim = Simulation(rocket, planets, "verlet", coast)
+    target = earth.r + LAUNCH_ALTITUDE
+    sim.launch()
+    phase = ["ascent"]
+    def step(i):
+        if phase[0] == "ascent":
+            pitch, rocket.throttle = profileSchedule(LAUNCH_PROFILE, sim.time)
+            steer(rocket, pitch)
+            sim.step(STEP)
+            if rocket.altitude > 0 and apoapsis(orbitOf(sim, coast)[0]) >= target:
+                rocket.throttle = 0     # main engine cut off
+                rocket.angV = 0
+                phase[0] = "coast"
+        elif phase[0] == "coast":
+            orbit = orbitOf(sim, coast)[0]
+            sim.coastFor((orbit.timeToPeriapsis() - orbit.period/2) % orbit.period)
+            phase[0] = "circularize"
+        elif phase[0] == "circularize":
+            rocket.angle = degrees(atan2(-rocket.v.y, rocket.v.x))   # prograde
+            rocket.throttle = 1
+            sim.step(STEP)
+            if orbitOf(sim, coast)[0].periapsis >= target*0.99:
+                rocket.throttle = 0
+                phase[0] = "orbit"
+        else:
+            sim.step(STEP)
+    result = measure(step, int(12000*scale), warmup=0)
+    orbit, planet = orbitOf(sim, coast)
+    result["check"] = stateCheck(rocket) + [phase[0], round(orbit.periapsis - planet.r, 1)]    # periapsis altitude
+    return result
+
+def benchTransfer(scale):
+    """ Earth to Moon transfer orbit and lunar flyby at 1000x time warp, one call per frame
+        (coasting and the sphere of influence changes included). """
+    planets = makePlanets()
+    earth, moon = planets
+    rocket = makeRocket(planets)
+    sim = Simulation(rocket, planets, "verlet", KeplerCoast(planets))
+    sim.launch()
+    rocket.throttleZero()
+    r1 = 15000
+    r2 = getDistance(earth.pos, moon.pos)
+    mu = G*earth.mass
+    v = sqrt(mu/r1)*sqrt(2*r2/(r1 + r2))    # just after a Hohmann transfer burn
+    aim = 0.3       # radians off the moon, so the rocket flies past it instead of landing
+    rocket.center.update(earth.pos[0] + r1*sin(aim), earth.pos[1] + r1*cos(aim))
+    rocket.v.update(v*cos(aim), -v*sin(aim))
+    rocket.updateSurroundings(planets)
+    simClock = SimClock()
+    result = measure(lambda i: simClock.advance(sim, 1/60, 1000), int(300*scale), warmup=0)
+    result["check"] = stateCheck(rocket)
+    return result
+
+def benchGravity(scale):
+    """ Planet.getGravityVec at 1000 positions per call. """
+    planets = makePlanets()
+    rocket = makeRocket(planets)
+    rng = np.random.default_rng(0)
+    positions = [Vector2(float(x), float(y)) for x, y in rng.uniform(-200000, 200000, (1000, 2))]
+    def gravity(i):
+        for pos in positions:
+            rocket.center = pos
+            for planet in planets:
+                planet.getGravityVec(rocket)
+    return measure(gravity, int(100*scale), 1000*len(planets))
+
+def benchWorldToScreen(scale):
+    """ Camera.worldToScreen, 10000 points per call. """
+    camera = Camera(-400, -300, 800, 600, 3)
+    points = [(i*7.5, -i*3.25) for i in range(10000)]
+    def convert(i):
+        for point in points:
+            camera.worldToScreen(point)
+    return measure(convert, int(100*scale), len(points))
+
+def benchRotate(scale):
+    """ rotate() of a 200 px rocket surface, one angle per call. """
+    rocket = makeRocket(makePlanets())
+    return measure(lambda i: rotate(rocket.surf, i % 360), int(720*scale))
+
+def benchHud(scale):
+    """ Hud.update and draw with every value changing each frame. """
+    hud = Hud([["Altitude: ", " m"], ["Nearest Planet: ", ""], ["Throttle: ", " %"],
+               ["Velocity: ", " m/s"], ["Velocity Towards Planet: ", " m/s"],
+               ["Velocity Tangent Planet: ", " m/s"], ["Angular Velocity: ", " degrees/s"],
+               ["Fuel and Oxidizer: ", " %"], ["Time Warp: ", "X"]],
+              pygame.font.Font(os.path.join(MODULE_FOLDER, "fonts", "font.ttf"), 18), WHITE)
+    hud.resize(800, 600)
+    def frame(i):
+        hud.update([str(i*3), "earth" if i % 200 < 100 else "moon", str(i % 101), str(i*2), str(-i),
+                    str(i//2), str(i % 7), str(100 - i % 100), str(round(1 + i/10, 1))])
+        hud.draw(screen)
+    return measure(frame, int(1000*scale))
+
+def makeLongPath(n):
+    """ A spiral of n points, like a very long flight of many orbits. """
+    t = np.arange(n)*0.002
+    radius = 15000 + t*20
+    return np.column_stack((radius*np.cos(t), radius*np.sin(t)))
+
+def benchPathExtend(scale):
+    """ Recording a 1M point path, 10000 points per call. """
+    points = makeLongPath(int(1000000*scale)).tolist()
+    path = Path(LIGHT_GREY)
+    chunk = 10000
+    def extend(i):
+        for point in points[i*chunk:(i + 1)*chunk]:
+            path.extend(point)
+    result = measure(extend, len(points)//chunk, chunk, warmup=0)
+    benchPathExtend.path = path     # drawn by benchPathDraw
+    return result
+
+def benchPathDraw(scale):
+    """ Path.draw of the 1M point path at zooms from close up to the whole system. """
+    path = getattr(benchPathExtend, "path", None)
+    if path == None:
+        benchPathExtend(scale)
+        path = benchPathExtend.path
+    zooms = [1, 10, 100, 500]
+    cameras = []
+    for zoom in zooms:
+        camera = Camera(0, 0, 800, 600, zoom)
+        camera.x, camera.y = 15000 - camera.worldSize[0]/2, -camera.worldSize[1]/2
+        cameras.append(camera)
+    return measure(lambda i: path.draw(screen, cameras[i % len(cameras)]), int(200*scale))
+
+BENCHMARKS = {"launch": benchLaunch,
+              "transfer": benchTransfer,
+              "gravity": benchGravity,
+              "worldToScreen": benchWorldToScreen,
+              "rotate": benchRotate,
+              "hud": benchHud,
+              "pathExtend": benchPathExtend,
+              "pathDraw": benchPathDraw}
+
+#-----------------------------#
+# Main Program                #
+#-----------------------------#
+
+def compare(results, baseline, threshold):
+    """ Print results next to baseline. Returns the names whose median got slower than threshold allows. """
+    regressions = []
+    print("%-14s %10s %10s %10s %14s %9s" % ("benchmark", "p50 ms", "p90 ms", "p99 ms", "ops/s", "vs base"))
+    for name, result in results.items():
+        change = ""
+        base = baseline.get(name)
+        if base != None:
+            ratio = result["p50"]/base["p50"] - 1
+            change = "%+.1f%%" % (ratio*100)
+            if ratio > threshold:
+                regressions.append(name)
+                change += " SLOW"
+            if "check" in result and result["check"] != base.get("check"):
+                change += " CHANGED"    # simulation result differs, the timings are of different work
+        print("%-14s %10.3f %10.3f %10.3f %14.0f %9s" % (name, result["p50"], result["p90"], result["p99"],
+                                                         result["opsPerSec"], change))
+    return regressions
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and drawing hot paths.")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all if none: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--baseline", help="json results to compare against")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed median slowdown, 0.25 is 25%%")
+    parser.add_argument("--scale", type=float, default=1, help="work per benchmark, below 1 for a quick run")
+    args = parser.parse_args(args)
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        results[name] = BENCHMARKS[name](args.scale)
+
+    baseline = {}
+    if args.baseline != None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save != None:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "pygame": pygame.version.ver,
+                       "machine": platform.machine(), "scale": args.scale, "results": results}, f, indent=1)
+    if regressions:
+        print("regressions over " + str(round(args.threshold*100)) + "%: " + ", ".join(regressions))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
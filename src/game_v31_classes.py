@@ -5,8 +5,15 @@
 # Date: 06/03/2020
 #########################################
 import pygame
+import numpy as np
 from random import randint
+from collections import OrderedDict
+from time import perf_counter
 from math import sqrt, degrees, radians, sin, cos, atan2, pi
+from game_v31_physics import *
+import game_v31_physics as physics
+from game_v31_path import PathBuffer
+from game_v31_assets import *
 
 #-----------------------------#
 # Constants                   #
@@ -25,9 +32,6 @@ CYAN    = (  0,255,255)
 LIGHT_GREY = (200,200,200)
 DARK_BLUE =  (  9, 12,189)
 
-
-G = 6.674e-11 # Gravitational constant
-
 #-----------------------------#
 # Functions                   #
 #-----------------------------#
@@ -43,6 +47,24 @@ def loadSound(filename, volume):
     sound.set_volume(volume)
     return sound
 
+spriteSheets = {}   # (filename, cols, rows): (frames, column width, row height), sliced once per process
+
+def loadSpriteSheet(filename, cols, rows):
+    key = (filename, cols, rows)
+    if key not in spriteSheets:
+        if filename not in assets:
+            assets.registerImage(filename)
+        sheet = assets.get(filename)    # only the frames are kept, the sheet can be evicted
+        colW = sheet.get_width()/cols
+        rowH = sheet.get_height()/rows
+        frames = []
+        for row in range(rows):
+            for col in range(cols):
+                frames.append(sheet.subsurface((col*colW, row*rowH,
+                                                int(colW - 1), int(rowH - 1))).copy()) # -1 to account for rounding error
+        spriteSheets[key] = (frames, colW, rowH)
+    return spriteSheets[key]
+
 def rotate(surface,angle):
     originalRect = surface.get_rect()
     rotatedSurface = pygame.transform.rotate(surface,angle)
@@ -51,17 +73,11 @@ def rotate(surface,angle):
     rotatedSurface = rotatedSurface.subsurface(rotatedRect).copy()
     return rotatedSurface
 
-def getDistance(p1,p2):
-    return sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
-
-def getDistSquared(p1, p2):
-    return (p1[0]-p2[0])**2 + (p1[1]-p2[1])**2
-
-def scaleSurface(surf, surfSize, screenSize, defaultScrenRes):
+def scaleSurface(surf, surfSize, screenSize, defaultScrenRes, smooth=False):
     wScaleFactor = surfSize[0]/sqrt(defaultScrenRes[0]*defaultScrenRes[1])
     hScaleFactor = surfSize[1]/sqrt(defaultScrenRes[0]*defaultScrenRes[1])
-    scaled = pygame.transform.scale(surf, (int(sqrt(screenSize[0]*screenSize[1])*wScaleFactor),
-                                           int(sqrt(screenSize[0]*screenSize[1])*hScaleFactor)))
+    scaled = scaleImage(surf, (int(sqrt(screenSize[0]*screenSize[1])*wScaleFactor),
+                               int(sqrt(screenSize[0]*screenSize[1])*hScaleFactor)), smooth)
     return scaled
 
 def scaleMaintainAspect(surf, newW=None, newH=None, returnNewSize=False):
@@ -76,33 +92,91 @@ def scaleMaintainAspect(surf, newW=None, newH=None, returnNewSize=False):
     else:
         return newSurf
 
+def clipPolygon(points, left, top, right, bottom):
+    """ Sutherland-Hodgman: the part of a convex polygon inside the rect, as a list of (x, y). """
+    def clipEdge(points, inside, intersect):
+        clipped = []
+        for i in range(len(points)):
+            current, previous = points[i], points[i - 1]
+            if inside(current):
+                if not inside(previous):
+                    clipped.append(intersect(previous, current))
+                clipped.append(current)
+            elif inside(previous):
+                clipped.append(intersect(previous, current))
+        return clipped
+
+    def atX(x):
+        return lambda p, q: (x, p[1] + (q[1] - p[1])*(x - p[0])/(q[0] - p[0]))
+    def atY(y):
+        return lambda p, q: (p[0] + (q[0] - p[0])*(y - p[1])/(q[1] - p[1]), y)
+
+    for inside, intersect in [(lambda p: p[0] >= left, atX(left)),
+                              (lambda p: p[0] <= right, atX(right)),
+                              (lambda p: p[1] >= top, atY(top)),
+                              (lambda p: p[1] <= bottom, atY(bottom))]:
+        if len(points) == 0:
+            break
+        points = clipEdge(points, inside, intersect)
+    return points
+
 def centerHorizontally(screenW, surfaceW):
     x = round((screenW - surfaceW)/2)
     return x
 
+def drawBackground(screen, bg):
+    if bg == None:
+        screen.fill(BLACK)     # not loaded yet
+    else:
+        screen.blit(bg, (0,0))
+
+def waitForEvents(timeout=0):
+    """ Sleep until there is an event, or timeout ms have passed (0 waits for ever), then
+        return every queued event. """
+    event = pygame.event.wait(timeout)
+    events = pygame.event.get()
+    if event.type != pygame.NOEVENT:
+        events.insert(0, event)
+    return events
+
 #-------------------------------#
 # Classes                       #
 #-------------------------------#
 
 class ScalableSurf():
+    """ A surface scaled with the window. Smoothly scaled copies are kept for every screen size
+        they were made for, so going back to a size costs nothing; fast ones (smooth=False,
+        while the window is being dragged) are not kept. """
     def __init__(self, surf, center=(0,0)):
         self.surf = surf
         self.surfSize = self.surf.get_size()
         self.scaledSurf = self.surf
         self.scaledRect = self.scaledSurf.get_rect()
         self.scaledRect.center = center
-
-    def scale(self, screenSize, defaultScreenSize):
-        self.scaledSurf = scaleSurface(self.surf, self.surfSize, screenSize, defaultScreenSize)
+        self.scaledCache = {}   # (screen size, default screen size): smoothly scaled surf
+
+    def scale(self, screenSize, defaultScreenSize, smooth=True):
+        key = (tuple(screenSize), tuple(defaultScreenSize))
+        if key in self.scaledCache:
+            self.scaledSurf = self.scaledCache[key]
+        elif smooth:
+            self.scaledSurf = scaleSurface(self.surf, self.surfSize, screenSize, defaultScreenSize, True)
+            self.scaledCache[key] = self.scaledSurf
+        else:
+            self.scaledSurf = scaleSurface(self.surf, self.surfSize, screenSize, defaultScreenSize)
         self.scaledRect = self.scaledSurf.get_rect()
 
-    def resize(self, center, screenSize, defaultScreenSize):
-        self.scale(screenSize, defaultScreenSize)
+    def resize(self, center, screenSize, defaultScreenSize, smooth=True):
+        self.scale(screenSize, defaultScreenSize, smooth)
         self.scaledRect.center = center
 
-    def resizeFromTopLeft(self, topLeft, screenSize, defaultScreenSize):
-        self.scale(screenSize, defaultScreenSize)
+    def resizeFromTopLeft(self, topLeft, screenSize, defaultScreenSize, smooth=True):
+        self.scale(screenSize, defaultScreenSize, smooth)
         self.scaledRect.topleft = topLeft
+
+    @property
+    def rect(self):
+        return self.scaledRect
         
     def draw(self, screen):
         screen.blit(self.scaledSurf, self.scaledRect.topleft)
@@ -117,9 +191,14 @@ class Button():
         self.selectedSurf = ScalableSurf(selectedSurf, center)
         self.selected = False
 
-    def resize(self, center, screenSize, defaultScreenSize):
-        self.surf.resize(center, screenSize, defaultScreenSize)
-        self.selectedSurf.resize(center, screenSize, defaultScreenSize)
+    def resize(self, center, screenSize, defaultScreenSize, smooth=True):
+        self.surf.resize(center, screenSize, defaultScreenSize, smooth)
+        self.selectedSurf.resize(center, screenSize, defaultScreenSize, smooth)
+
+    @property
+    def rect(self):
+        """ Area covered when selected or not. """
+        return self.surf.scaledRect.union(self.selectedSurf.scaledRect)
 
     def draw(self, screen):
         if self.selected:
@@ -128,10 +207,13 @@ class Button():
             self.surf.draw(screen)
 
     def detectMouseHover(self, mousePos):
+        """ Returns whether selected changed. """
+        wasSelected = self.selected
         if self.surf.scaledRect.collidepoint(mousePos):
             self.selected = True
         else:
             self.selected = False
+        return self.selected != wasSelected
 
 class ImgButton(Button):
     def __init__(self, img,  center=(0,0)):
@@ -145,34 +227,135 @@ class TextButton(ImgButton):
     def __init__(self, text, font, clr, center=(0,0)):
         ImgButton.__init__(self, font.render(text, 1, clr), center)
 
+class StaticScreen():
+    """ Texts and buttons of a screen where nothing moves unless the player does something.
+
+    The whole screen is only drawn when asked to (it was just laid out, or the window was
+    uncovered); after that only the buttons whose hover state changed are drawn again,
+    together with the background and whatever else overlaps them.
+    """
+    def __init__(self, items):
+        self.items = items      # ScalableSurfs and Buttons, drawn in order
+        self.buttons = [item for item in items if isinstance(item, Button)]
+
+    def update(self, screen, bg, mousePos, redrawAll=False):
+        """ Draw what changed and return the rects to pass to pygame.display.update(). """
+        changed = [button.rect for button in self.buttons if button.detectMouseHover(mousePos)]
+        if redrawAll:
+            drawBackground(screen, bg)
+            for item in self.items:
+                item.draw(screen)
+            return [screen.get_rect()]
+
+        for rect in changed:
+            screen.set_clip(rect)
+            drawBackground(screen, bg)
+            for item in self.items:
+                if item.rect.colliderect(rect):
+                    item.draw(screen)
+        screen.set_clip(None)
+        return changed
+
+class ResizeDebouncer():
+    """ Coalesces the VIDEORESIZE events of a window edge being dragged.
+
+    push() every event; poll() once a frame gives the newest size at most once per frame,
+    to lay out quickly (smooth False), and gives it again with smooth True once no event
+    has come for settleTime seconds, for the high quality pass.
+    """
+    def __init__(self, settleTime=0.2):
+        self.settleTime = settleTime
+        self.pending = None     # newest size not laid out yet
+        self.size = None
+        self.lastEvent = 0
+        self.settled = True
+
+    def push(self, size):
+        self.pending = tuple(size)
+        self.lastEvent = perf_counter()
+        self.settled = False
+
+    def poll(self):
+        """ (size, smooth) to lay the window out for, or None if nothing changed. """
+        if self.pending != None:
+            self.size, self.pending = self.pending, None
+            return self.size, False
+        if not self.settled and perf_counter() - self.lastEvent >= self.settleTime:
+            self.settled = True
+            return self.size, True
+        return None
+
+    def timeLeft(self):
+        """ ms until the size settles, None if it has. """
+        if self.settled:
+            return None
+        return max(1, round((self.lastEvent + self.settleTime - perf_counter())*1000))
+
+class SpriteCache():
+    """ Scaled and rotated copies of surfaces, keyed by source surface, size and angle rounded to
+        angleStep degrees. Least recently used entries are dropped past maxBytes. """
+    def __init__(self, maxBytes=32*1024*1024, angleStep=1):
+        self.maxBytes = maxBytes
+        self.angleStep = angleStep
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __str__(self):
+        return "sprite cache: " + str(len(self.entries)) + " entries, " + \
+               str(self.bytes//1024) + " KB, hits: " + str(self.hits) + \
+               ", misses: " + str(self.misses) + ", evictions: " + str(self.evictions)
+
+    def get(self, surf, size, angle):
+        angle = (round(angle/self.angleStep)*self.angleStep)%360
+        key = (surf, size, angle)
+        transformed = self.entries.get(key)
+        if transformed != None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return transformed
+
+        self.misses += 1
+        transformed = rotate(pygame.transform.scale(surf, size), angle)
+        self.entries[key] = transformed
+        self.bytes += transformed.get_width()*transformed.get_height()*transformed.get_bytesize()
+        while self.bytes > self.maxBytes and len(self.entries) > 1:
+            oldKey, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_width()*old.get_height()*old.get_bytesize()
+            self.evictions += 1
+        return transformed
+
+    def invalidate(self, surf):
+        """ Forget every copy of surf, for when it has been drawn on. """
+        for key in [key for key in self.entries if key[0] is surf]:
+            old = self.entries.pop(key)
+            self.bytes -= old.get_width()*old.get_height()*old.get_bytesize()
+
+spriteCache = SpriteCache()    # shared by rockets and animated sprites
+
 class AnimatedSprite():
     def __init__(self, spritesheetImg, cols, rows):
-        self.sheet = loadImg(spritesheetImg)
+        self.frames, self.colW, self.rowH = loadSpriteSheet(spritesheetImg, cols, rows)
         self.cols = cols
         self.rows = rows
-        self.colW = self.sheet.get_width()/cols
-        self.rowH = self.sheet.get_height()/rows
-        self.currentCol = 0
-        self.currentRow = 0
-        self.currentSprite = self.sheet.subsurface((0, 0, self.colW, self.rowH))
+        self.frameIndex = 0
+        self.currentSprite = self.frames[0]
         self.transformedCurrentSprite = self.currentSprite
         self.angle = 0
         self.finished = False
 
     def transform(self, camera):
-        self.transformedCurrentSprite = rotate(pygame.transform.scale(self.currentSprite,
-                                        (int((self.colW - 1)/camera.zoom), int((self.rowH - 1)/camera.zoom))), self.angle)
+        self.transformedCurrentSprite = spriteCache.get(self.currentSprite,
+                                        (int((self.colW - 1)/camera.zoom), int((self.rowH - 1)/camera.zoom)), self.angle)
     
     def loadNextImg(self):
-        self.currentCol += 1
-        if self.currentCol == self.cols:
-            self.currentCol = 0
-            self.currentRow += 1
-            if self.currentRow == self.rows:
-                self.finished = True
+        self.frameIndex += 1
+        if self.frameIndex == len(self.frames):
+            self.finished = True
         if not self.finished:
-            self.currentSprite = self.sheet.subsurface((self.currentCol*self.colW, self.currentRow*self.rowH,
-                                                        int(self.colW - 1), int(self.rowH - 1))) # -1 to account for rounding error
+            self.currentSprite = self.frames[self.frameIndex]
             
     def draw(self, surf, center, camera):
         topLeft = int(center[0] - self.colW/2), int(center[1] - self.rowH/2)
@@ -266,133 +449,104 @@ class Camera():
         else:
             return False
 
-class Planet():
-    def __init__(self, name, x, y, r, mass, clr):
-        self.name = name
-        self.pos = (x,y)
-        self.r = r
-        self.mass = mass
-        self.clr = clr
-
-    def __str__(self):
-        return self.name + "\n" + \
-               "position: " + str(self.pos) + "\n" + \
-               "radius: " + str(self.r) + "\n" + \
-               "mass: " + str(self.mass) + "\n"
-
-    def draw(self, surface, camera):
-        if camera.circleInFrame(self.pos, self.r):
-            pygame.draw.circle(surface, self.clr, camera.worldToScreen(self.pos),
-                               int(self.r/camera.zoom))
-
-    def getGravityVec(self, rocket):
-        if self == rocket.nearestPlanet and rocket.altitude <= 0:
-            return pygame.Vector2(0,0)
-        else:
-            dSquared = getDistSquared(rocket.center,self.pos)
-            g = G*self.mass/dSquared
-            vec = pygame.Vector2(self.pos - rocket.center)
-            vec.scale_to_length(g)
-            return vec
-
-class Path():
+class Planet(physics.Planet):
+    def draw(self, surface, camera, pixelTolerance=0.5):
+        """ Small planets are drawn as circles. A planet much larger than the screen is drawn as
+            only its visible part: the horizon arc, with chords no more than pixelTolerance from
+            the true curve, closed through the planet's center and clipped to the screen. When the
+            curvature across the screen is under a pixel the arc is a single chord (a half-plane). """
+        if not camera.circleInFrame(self.pos, self.r):
+            return
+        w, h = surface.get_size()
+        cx, cy = (self.pos[0] - camera.x)/camera.zoom, (self.pos[1] - camera.y)/camera.zoom
+        r = self.r/camera.zoom
+        if r < 2*max(w, h):
+            pygame.draw.circle(surface, self.clr, (int(cx), int(cy)), int(r))
+            return
+
+        cornerDists = [(x - cx)**2 + (y - cy)**2 for x in (0, w) for y in (0, h)]
+        if max(cornerDists) <= r*r:
+            surface.fill(self.clr)      # the whole screen is ground
+            return
+
+        # the screen does not contain the center here, so it spans less than 180 degrees seen
+        # from the center; measure the corners' angles from the direction to the screen center
+        midAngle = atan2(h/2 - cy, w/2 - cx)
+        cornerAngles = [(atan2(y - cy, x - cx) - midAngle + pi)%(2*pi) - pi for x in (0, w) for y in (0, h)]
+        startAngle, endAngle = midAngle + min(cornerAngles), midAngle + max(cornerAngles)
+        maxStep = 2*sqrt(2*pixelTolerance/r)        # chord angle whose sagitta is pixelTolerance
+        segments = min(256, max(1, int((endAngle - startAngle)/maxStep) + 1))
+        outline = [(cx, cy)]
+        for i in range(segments + 1):
+            angle = startAngle + (endAngle - startAngle)*i/segments
+            outline.append((cx + r*cos(angle), cy + r*sin(angle)))
+        visible = clipPolygon(outline, 0, 0, w, h)
+        if len(visible) >= 3:
+            pygame.draw.polygon(surface, self.clr, [(int(round(x)), int(round(y))) for x, y in visible])
+
+class Path(PathBuffer):
     def __init__(self, clr):
+        PathBuffer.__init__(self)
         self.clr = clr
-        self.points = []
         
-    def extend(self, point):
-        self.points.append(point)
-        
-    def draw(self, surface, camera):
-        if len(self.points) > 1:
-            destPoints = []
-            for point in self.points:
-                destPoints.append(camera.worldToScreen(point))
-            pygame.draw.lines(surface, self.clr, False, destPoints)
-
-class Rocket():
+    def draw(self, surface, camera, pixelTolerance=0.5):
+        """ Draws the coarsest level that is still exact to pixelTolerance, and only its visible blocks. """
+        if len(self) < 2:
+            return
+        level = self.levelFor(pixelTolerance*camera.zoom)
+        margin = level.tolerance + camera.zoom     # so simplified lines just off screen still reach the edge
+        runs = level.visibleRuns(camera.x - margin, camera.y - margin,
+                                 camera.x + camera.worldSize[0] + margin, camera.y + camera.worldSize[1] + margin)
+        levelPoints = level.points.view()
+        for start, end in runs:
+            self.drawPolyline(surface, camera, levelPoints[start:end + 1])
+        if len(self.history) > 0:
+            recent = np.concatenate((levelPoints[-1:], self.recentPoints()))    # join the coarse level to the tip
+        else:
+            recent = self.recentPoints()
+        self.drawPolyline(surface, camera, recent)
+
+    def drawPolyline(self, surface, camera, points):
+        if len(points) > 1:
+            destPoints = ((points - (camera.x, camera.y))/camera.zoom).astype(int)
+            pygame.draw.lines(surface, self.clr, False, destPoints.tolist())
+
+class Rocket(physics.RocketPhysics):
     def __init__(self, surfSide, rocketData, startPlanet, planets):   # rocketData format: [image, height, mass, max thrust]      
         self.surfSide = surfSide        # width/height of rocket surface 
         self.surf = pygame.Surface((surfSide,surfSide), pygame.SRCALPHA)    # original rocket surface
 
         try:
-            scaledImg, self.w, self.h = scaleMaintainAspect(rocketData[0], newH=rocketData[1], returnNewSize=True)
-            self.surf.blit(scaledImg, (int((self.surfSide - self.w)/2), int((self.surfSide - self.h)/2)))
+            scaledImg, w, h = scaleMaintainAspect(rocketData[0], newH=rocketData[1], returnNewSize=True)
+            self.surf.blit(scaledImg, (int((self.surfSide - w)/2), int((self.surfSide - h)/2)))
             self.surf = rotate(self.surf, -90)
         except:
-            self.w = 20
-            self.h = 150
-            pygame.draw.rect(self.surf, RED, (int((self.surfSide - self.h)/2),
-                                              int((self.surfSide - self.w)/2), self.h, self.w))  # rocket is drawn sideways, rotated in place after
+            w = 20
+            h = 150
+            pygame.draw.rect(self.surf, RED, (int((self.surfSide - h)/2),
+                                              int((self.surfSide - w)/2), h, w))  # rocket is drawn sideways, rotated in place after
 
         self.transformedSurf = self.surf
-       
-        self.center = pygame.Vector2(int(startPlanet.pos[0]),   # center in world space
-                                     int(startPlanet.pos[1] - startPlanet.r - self.h/2)) 
 
-        self.corners = []
-        self.angle = 90     # in degrees from positive x axis
-        
-        self.mass = rocketData[2]         # all masses in kg
-        self.fuelPercent = 100
-        self.maxThrust = rocketData[3]      # in N
-        self.throttle = 0           
-        self.thrust = self.throttle*self.maxThrust  
-        self.thrustA = pygame.Vector2() # instantaneous acceleration due to thrust in m/s^2
-
-        self.v = pygame.Vector2()       # instantaneous velocity in m/s
-        self.angV = 0           
-
-        self.gravityVectors = []
-        for planet in planets:
-            self.gravityVectors.append(pygame.Vector2())
-
-        self.nearestPlanet = startPlanet
-        self.altitude = 0
-        self.angFromPlanet = 90     # relate to nearest planet
-        self.vToPlanet = 0
-        self.vTanPlanet = 0
+        physics.RocketPhysics.__init__(self, w, h, rocketData[2], rocketData[3], startPlanet, planets)
 
         self.path = Path(LIGHT_GREY)     
 
-        self.crashed = False
-        self.launched = False
-
-    def __str__(self):
-        rocketStr = "center (x,y): " + str(self.center) + "\n" + \
-                    "altitude: " + str(self.altitude) + "\n" + \
-                    "crashed: " + str(self.crashed) + "\n" + \
-                    "nearest planet: " + str(self.nearestPlanet.name) + "\n" + \
-                    "angle from nearest planet (deg): " + str(self.angFromPlanet) + "\n" + \
-                    "angle (deg): " + str(self.angle) + "\n" + \
-                    "mass (kg): " + str(self.mass) + "\n" + \
-                    "fuel % left: " + str(self.fuelPercent) + "\n" + \
-                    "throttle (0 to 1):" + str(self.throttle) + "\n" + \
-                    "thrust (int): " + str(self.thrust) + "\n" + \
-                    "thrust acceleration (polar): " + str(self.thrustA.as_polar()) + "\n" + \
-                    "velocity (polar): " + str(self.v.as_polar()) + "\n" + \
-                    "velocity towards nearest planet: " + str(self.vToPlanet) + "\n" + \
-                    "velocity tangent to nearest planet: " + str(self.vTanPlanet) + "\n" + \
-                    "angular velocity (int): " + str(self.angV) + "\n" + \
-                    "fuel %: " + str(self.fuelPercent) + "\n"
-
-                
-        for vec in self.gravityVectors:
-            rocketStr += "gravity acceleration: " + str(vec.as_polar()) + "\n"
-        return rocketStr
-
-    def draw(self, surface, camera):
-        if camera.rectInFrame(self.center, (self.surfSide, self.surfSide)) and not self.crashed:
+    def draw(self, surface, camera, state=None):
+        """ state is something with center, angle and crashed to draw instead of the rocket's own,
+            like a SimSnapshot. """
+        if state == None:
+            state = self
+        if camera.rectInFrame(state.center, (self.surfSide, self.surfSide)) and not state.crashed:
             scaledSide = int(self.surfSide/camera.zoom)
             if scaledSide < 30:
                 scaledSide = 30
-                destCenter = camera.worldToScreen(self.center)
+                destCenter = camera.worldToScreen(state.center)
                 destPos = destCenter[0] - 15, destCenter[1] - 15
             else:
-                destPos = camera.worldToScreen((self.center.x - self.surfSide/2,
-                                            self.center.y - self.surfSide/2))
-            scaled = pygame.transform.scale(self.surf, (scaledSide, scaledSide))
-            self.transformedSurf = rotate(scaled, self.angle)
+                destPos = camera.worldToScreen((state.center.x - self.surfSide/2,
+                                            state.center.y - self.surfSide/2))
+            self.transformedSurf = spriteCache.get(self.surf, (scaledSide, scaledSide), state.angle)
             surface.blit(self.transformedSurf, destPos)
 
     def drawDevInfo(self, surface, camera):
@@ -409,117 +563,4 @@ class Rocket():
                                               int(self.surfSide/2)), 5)   # top of rocket
         pygame.draw.circle(surface, WHITE, camera.worldToScreen(self.center), 3)  # center of rocket
         pygame.draw.rect(self.surf, GREEN, self.surf.get_rect(), 2)     # border of rocket surface
-    
-    def detectCrash(self):
-        if self.altitude <= 0:
-            self.v.update(0,0)
-            self.angV *= 0.3
-            if abs(self.angle - self.angFromPlanet) > 5 and self.vToPlanet < 7 and self.vTanPlanet < 5:
-                self.crashed = True
-    
-    def update(self, planets, dt, timeWarp):
-        self.detectCrash()            
-
-        if self.fuelPercent > 0:
-            self.fuelPercent -= (self.throttle*dt*timeWarp*0.2)
-        
-        self.angle += (self.angV*dt*timeWarp)%360
-
-        if self.fuelPercent > 0:
-            self.thrust = self.throttle*self.maxThrust
-            self.thrustA.from_polar((self.thrust/self.mass, -self.angle))
-        else:
-            self.throttle = 0
-            self.thrust = 0
-            self.thrustA.update(0,0)
-
-        for i in range(len(planets)):
-            self.gravityVectors[i].update(planets[i].getGravityVec(self))
-
-        self.v += self.thrustA*dt*timeWarp
-        for vec in self.gravityVectors:
-            self.v += vec*dt*timeWarp
-            
-        self.center += self.v*dt*timeWarp
-        
-        self.corners = [[self.center.x + (self.h/2)*cos(radians(self.angle)) + (self.w/2)*cos(radians(self.angle + 90)),    
-                         self.center.y - (self.h/2)*sin(radians(self.angle)) - (self.w/2)*sin(radians(self.angle + 90))],   
-                        [self.center.x + (self.h/2)*cos(radians(self.angle)) + (self.w/2)*cos(radians(self.angle - 90)),    
-                         self.center.y - (self.h/2)*sin(radians(self.angle)) - (self.w/2)*sin(radians(self.angle - 90))],   
-                        [self.center.x + (self.h/2)*cos(radians(self.angle + 180)) + (self.w/2)*cos(radians(self.angle + 90)),
-                         self.center.y - (self.h/2)*sin(radians(self.angle + 180)) - (self.w/2)*sin(radians(self.angle + 90))],
-                        [self.center.x + (self.h/2)*cos(radians(self.angle + 180)) + (self.w/2)*cos(radians(self.angle - 90)),
-                         self.center.y - (self.h/2)*sin(radians(self.angle + 180)) - (self.w/2)*sin(radians(self.angle - 90))]]
-
-        for planet in planets:
-            if getDistSquared(planet.pos, self.center) < getDistSquared(self.nearestPlanet.pos, self.center):
-                self.nearestPlanet = planet
-
-        altitudesOfCorners = []
-        for corner in self.corners:
-            altitudesOfCorners.append(getDistance(corner, self.nearestPlanet.pos) - self.nearestPlanet.r)
-        self.altitude = min(altitudesOfCorners)
-        
-        self.angFromPlanet = (degrees(atan2(self.nearestPlanet.pos[1] - self.center.y,
-                                            self.center.x - self.nearestPlanet.pos[0])))%360
-
-        self.vToPlanet = cos(self.v.as_polar()[1] - self.angFromPlanet + 180)*self.v.length()
-        self.vTanPlanet = abs(sin(self.v.as_polar()[1] - self.angFromPlanet + 180)*self.v.length())
-
-        self.path.extend([self.center.x + (self.h/2)*cos(radians(self.angle + 180)),
-                          self.center.y - (self.h/2)*sin(radians(self.angle + 180))])
-
-    def freeze(self):
-        self.v.update(0,0)
-        self.angV = 0
-        self.throttle = 0
-        self.altitude = 0
-                                                
-    def throttleMax(self):
-        self.throttle = 1
-
-    def throttleZero(self):
-        self.throttle = 0
-    
-    def throttleUp(self):
-        if self.throttle < 1:
-            self.throttle += 0.05
-
-    def throttleDown(self):
-        if self.throttle > 0:
-            self.throttle -= 0.05
-
-    def rotCCW(self):
-        self.angV += 0.5
-
-    def rotCW(self):
-        self.angV -= 0.5
-
-    def stabilize(self):
-        if self.angV > 0.5:
-            self.angV -= 0.5
-        elif self.angV < -0.5:
-            self.angV += 0.5
-        else:
-            self.angV = 0
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-        
+        spriteCache.invalidate(self.surf)
@@ -0,0 +1,283 @@
+#########################################
+# File Name: game_v31_env.py
+# Description: Gym-style reset/step environments around the rocket physics for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import os, sys, argparse
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")    # once per worker process is plenty
+import numpy as np
+import multiprocessing as mp
+from time import perf_counter
+from game_v31_physics import ROCKET_SPECS, RocketPhysics, Simulation, makePlanets
+from game_v31_batch import RocketBatch
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+STEP = 1/60     # simulation seconds per physics step, as SimClock takes them
+
+## observation columns, nearestPlanet is an index into the environment's planets
+OBSERVATIONS = ["altitude", "vToPlanet", "vTanPlanet", "angle", "angV", "fuelPercent", "nearestPlanet"]
+
+## action columns: throttle (0 to 1) and turn (-1 to 1, the angular velocity added per step
+## in units of one rotCCW() press, like holding a rotation key)
+ACTIONS = ["throttle", "turn"]
+ACTION_LOW = np.array([0, -1], dtype=np.float64)
+ACTION_HIGH = np.array([1, 1], dtype=np.float64)
+TURN_RATE = 0.5     # angular velocity of one rotCCW() press
+
+CRASH_REWARD = -10
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def startPlanetOf(planets, planetName):
+    return [planet for planet in planets if planet.name == planetName][0]
+
+def asyncWorker(conn, buffers, rows, rocketName, planetName, options):
+    """ Runs one VectorRocketEnv in a worker process, reading actions from and writing results
+        into its rows of the shared buffers. """
+    env = VectorRocketEnv(rows.stop - rows.start, rocketName, planetName, **options)
+    views = {name: np.frombuffer(buffer, dtype).reshape(shape)[rows] for name, (buffer, dtype, shape) in buffers.items()}
+    try:
+        while True:
+            command = conn.recv()
+            if command == "step":
+                obs, reward, terminated, truncated, info = env.step(views["actions"])
+                views["finalObs"][:] = info["finalObs"]
+            elif command == "reset":
+                obs, info = env.reset()
+                reward, terminated, truncated = 0, False, False
+            else:
+                break
+            views["obs"][:] = obs
+            views["reward"][:] = reward
+            views["terminated"][:] = terminated
+            views["truncated"][:] = truncated
+            conn.send(None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class RocketEnv():
+    """ One rocket behind a reset()/step(action) interface, the way gym environments work.
+
+    Every episode starts on the pad of planetName with the engine lit. An action sets the
+    throttle and turns the rocket (see ACTIONS), then the physics takes stepsPerAction fixed
+    steps of STEP seconds. Observations are arrays of the OBSERVATIONS columns. The reward
+    is the altitude gained in km, CRASH_REWARD on a crash; override reward() for others. An
+    episode terminates on a crash and is truncated after maxSteps actions.
+    """
+    def __init__(self, rocketName="falcon9", planetName="earth", stepsPerAction=1, maxSteps=36000, integrator="euler"):
+        self.rocketName = rocketName
+        self.planetName = planetName
+        self.stepsPerAction = stepsPerAction
+        self.maxSteps = maxSteps
+        self.integrator = integrator
+        self.planets = makePlanets()
+        self.sim = None
+        self.steps = 0
+
+    def reset(self, seed=None, options=None):
+        """ Start a new episode. Returns (observation, info); the start is always the same, seed is
+            only taken for compatibility with gym. """
+        planets = self.planets
+        rocket = RocketPhysics.fromSpec(ROCKET_SPECS[self.rocketName], startPlanetOf(planets, self.planetName), planets)
+        self.sim = Simulation(rocket, planets, self.integrator)
+        self.sim.launch()
+        self.steps = 0
+        return self.observe(), {}
+
+    def observe(self):
+        rocket = self.sim.rocket
+        return np.array([rocket.altitude, rocket.vToPlanet, rocket.vTanPlanet, rocket.angle % 360, rocket.angV,
+                         rocket.fuelPercent, self.planets.index(rocket.nearestPlanet)], dtype=np.float64)
+
+    def reward(self, before, after, crashed):
+        if crashed:
+            return CRASH_REWARD
+        return (after[0] - before[0])/1000
+
+    def step(self, action):
+        """ Returns (observation, reward, terminated, truncated, info). """
+        rocket = self.sim.rocket
+        before = self.observe()
+        throttle, turn = np.clip(action, ACTION_LOW, ACTION_HIGH)
+        rocket.throttle = float(throttle)
+        rocket.angV += float(turn)*TURN_RATE
+        for i in range(self.stepsPerAction):
+            self.sim.step(STEP, 1, False)
+        self.steps += 1
+        obs = self.observe()
+        return obs, self.reward(before, obs, rocket.crashed), rocket.crashed, self.steps >= self.maxSteps, {}
+
+class VectorRocketEnv():
+    """ n RocketEnvs stepped together as arrays on a RocketBatch.
+
+    step() takes an (n, 2) array of actions and returns (n, ...) arrays. Environments whose
+    episode ended are reset straight away, so the observation returned for them is the first
+    of their next episode; the last one of the episode that ended is in info["finalObs"].
+    The batch integrates like RocketEnv does with the default "euler" integrator.
+    """
+    def __init__(self, n, rocketName="falcon9", planetName="earth", stepsPerAction=1, maxSteps=36000):
+        self.n = n
+        self.stepsPerAction = stepsPerAction
+        self.maxSteps = maxSteps
+        planets = makePlanets()
+        height, mass, maxThrust, width = ROCKET_SPECS[rocketName]
+        self.batch = RocketBatch(np.full(n, width), np.full(n, height), np.full(n, mass), np.full(n, maxThrust),
+                                 startPlanetOf(planets, planetName), planets)
+        self.steps = np.zeros(n, dtype=np.int64)
+
+    def reset(self, seed=None, options=None):
+        self.batch.reset()
+        self.batch.launch()
+        self.steps[:] = 0
+        return self.observe(), {}
+
+    def observe(self):
+        batch = self.batch
+        vToPlanet, vTanPlanet = batch.relativeVelocity()
+        return np.column_stack((batch.altitude, vToPlanet, vTanPlanet, batch.angle % 360, batch.angV,
+                                batch.fuelPercent, batch.nearest))
+
+    def reward(self, before, after, crashed):
+        return np.where(crashed, CRASH_REWARD, (after[:,0] - before[:,0])/1000)
+
+    def step(self, actions):
+        batch = self.batch
+        before = self.observe()
+        actions = np.clip(actions, ACTION_LOW, ACTION_HIGH)
+        batch.throttle = actions[:,0].copy()
+        batch.angV += actions[:,1]*TURN_RATE
+        for i in range(self.stepsPerAction):
+            batch.step(STEP)
+        self.steps += 1
+        obs = self.observe()
+        terminated = batch.crashed.copy()
+        truncated = self.steps >= self.maxSteps
+        reward = self.reward(before, obs, terminated)
+
+        done = terminated | truncated
+        finalObs = obs.copy()
+        if done.any():
+            batch.reset(done)
+            batch.launch(done)
+            self.steps[done] = 0
+            obs[done] = self.observe()[done]
+        return obs, reward, terminated, truncated, {"finalObs": finalObs, "done": done}
+
+    def close(self):
+        pass
+
+class AsyncVectorRocketEnv():
+    """ A VectorRocketEnv split over worker processes, each stepping envsPerWorker environments.
+
+    Actions and results go through shared memory, so a step costs one small pipe message per
+    worker however many environments there are. stepAsync() starts a step and stepWait()
+    collects it, leaving the caller free to work out its next actions in between; step() does
+    both. Results are views into the shared buffers, valid until the next step.
+    """
+    def __init__(self, workers, envsPerWorker, rocketName="falcon9", planetName="earth", context=None, **options):
+        self.n = workers*envsPerWorker
+        context = mp.get_context(context)
+        width = len(OBSERVATIONS)
+        layout = {"obs": ("d", np.float64, (self.n, width)), "finalObs": ("d", np.float64, (self.n, width)),
+                  "actions": ("d", np.float64, (self.n, len(ACTIONS))), "reward": ("d", np.float64, (self.n,)),
+                  "terminated": ("b", np.bool_, (self.n,)), "truncated": ("b", np.bool_, (self.n,))}
+        buffers = {name: (context.RawArray(code, int(np.prod(shape))), dtype, shape)
+                   for name, (code, dtype, shape) in layout.items()}
+        self.views = {name: np.frombuffer(buffer, dtype).reshape(shape) for name, (buffer, dtype, shape) in buffers.items()}
+
+        self.conns = []
+        self.processes = []
+        for i in range(workers):
+            conn, childConn = context.Pipe()
+            rows = slice(i*envsPerWorker, (i + 1)*envsPerWorker)
+            process = context.Process(target=asyncWorker, daemon=True,
+                                      args=(childConn, buffers, rows, rocketName, planetName, options))
+            process.start()
+            childConn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def send(self, command):
+        for conn in self.conns:
+            conn.send(command)
+        for conn in self.conns:
+            conn.recv()
+
+    def reset(self, seed=None, options=None):
+        self.send("reset")
+        return self.views["obs"], {}
+
+    def stepAsync(self, actions):
+        self.views["actions"][:] = actions
+        for conn in self.conns:
+            conn.send("step")
+
+    def stepWait(self):
+        for conn in self.conns:
+            conn.recv()
+        views = self.views
+        done = views["terminated"] | views["truncated"]
+        return views["obs"], views["reward"], views["terminated"], views["truncated"], \
+               {"finalObs": views["finalObs"], "done": done}
+
+    def step(self, actions):
+        self.stepAsync(actions)
+        return self.stepWait()
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send("close")
+            except OSError:
+                pass    # already gone
+            conn.close()
+        for process in self.processes:
+            process.join(1)
+        self.conns = []
+        self.processes = []
+
+#-----------------------------#
+# Main Program                #
+#-----------------------------#
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Measure environment steps per second with random actions.")
+    parser.add_argument("--envs", type=int, default=1024, help="environments (per worker with --workers)")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 steps everything in this one")
+    parser.add_argument("--rocket", default="falcon9", help="rocket to fly: " + ", ".join(ROCKET_SPECS))
+    parser.add_argument("--seconds", type=float, default=5, help="how long to step for")
+    args = parser.parse_args(args)
+
+    if args.workers > 0:
+        env = AsyncVectorRocketEnv(args.workers, args.envs, args.rocket)
+    else:
+        env = VectorRocketEnv(args.envs, args.rocket)
+    rng = np.random.default_rng(0)
+    env.reset()
+    steps = 0
+    episodes = 0
+    start = perf_counter()
+    while perf_counter() - start < args.seconds:
+        actions = rng.uniform(ACTION_LOW, ACTION_HIGH, (env.n, len(ACTIONS)))
+        obs, reward, terminated, truncated, info = env.step(actions)
+        steps += env.n
+        episodes += int(info["done"].sum())
+    seconds = perf_counter() - start
+    env.close()
+    print(str(steps) + " environment steps in " + str(round(seconds, 2)) + " s: " +
+          str(round(steps/seconds*60/1e6, 2)) + " million per minute, " + str(episodes) + " episodes ended")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+#########################################
+# File Name: game_v31_gravity.py
+# Description: Barnes-Hut gravity and spatial queries for large planetary systems
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import json
+import numpy as np
+from random import Random
+from math import sqrt, sin, cos, pi
+from pygame.math import Vector2
+from game_v31_physics import G, Planet, PlanetList
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+MAX_DEPTH = 16      # quadtree levels, cells are 1/65536 of the system's width at the bottom
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def spreadBits(x):
+    """ Put a zero bit between each of the low 16 bits of x, for interleaving into Morton keys. """
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+    return x
+
+def expandRanges(starts, ends):
+    """ For ranges [start, end): the index of the range each value came from, and the values. """
+    counts = ends - starts
+    owners = np.repeat(np.arange(len(starts)), counts)
+    firsts = np.cumsum(counts) - counts
+    values = np.arange(counts.sum()) - np.repeat(firsts - starts, counts)
+    return owners, values
+
+def circularVelocity(pos, parent, clockwise=False):
+    """ Velocity of a circular orbit around parent starting from pos. """
+    offset = Vector2(pos[0] - parent.pos[0], pos[1] - parent.pos[1])
+    speed = sqrt(G*parent.mass/offset.length())
+    tangent = Vector2(offset.y, -offset.x) if clockwise else Vector2(-offset.y, offset.x)
+    tangent.scale_to_length(speed)
+    return Vector2(parent.v) + tangent
+
+def loadSystem(filename, planetClass=None, clr=None):
+    """ Build a BodySystem from a json file:
+
+    {"theta": 0.5,
+     "bodies": [{"name": "earth", "x": 0, "y": 0, "r": 10000, "mass": 1.46838e19, "clr": [9, 12, 189]},
+                {"name": "moon", "x": 0, "y": -100000, "r": 3000, "mass": 2.1846e17, "orbits": "earth"}],
+     "belts": [{"name": "rock", "around": "earth", "count": 300, "distance": [30000, 60000],
+                "r": [20, 200], "density": 5000, "clr": [120, 110, 100], "seed": 1}]}
+
+    A body moves if it has "vx"/"vy" or "orbits" (a circular orbit around an earlier body),
+    unless "fixed" says otherwise. Belt bodies are scattered at random on circular orbits,
+    with masses from their radius and density (per square px, bodies are discs).
+    """
+    if planetClass == None:
+        planetClass = Planet
+    with open(filename) as f:
+        data = json.load(f)
+
+    planets = []
+    velocities = []
+    fixed = []
+    byName = {}
+    for body in data.get("bodies", []):
+        planet = planetClass(body["name"], body["x"], body["y"], body["r"], body["mass"],
+                             tuple(body["clr"]) if "clr" in body else clr)
+        if "orbits" in body:
+            v = circularVelocity(planet.pos, byName[body["orbits"]], body.get("clockwise", False))
+        else:
+            v = Vector2(body.get("vx", 0), body.get("vy", 0))
+        planet.v = (v.x, v.y)
+        planets.append(planet)
+        velocities.append(planet.v)
+        fixed.append(body.get("fixed", "orbits" not in body and "vx" not in body and "vy" not in body))
+        byName[planet.name] = planet
+
+    for belt in data.get("belts", []):
+        parent = byName[belt["around"]]
+        rand = Random(belt.get("seed", 0))
+        for i in range(belt["count"]):
+            distance = rand.uniform(*belt["distance"])
+            angle = rand.uniform(0, 2*pi)
+            r = rand.uniform(*belt["r"])
+            planet = planetClass(belt["name"] + " " + str(i + 1),
+                                 parent.pos[0] + distance*cos(angle), parent.pos[1] + distance*sin(angle),
+                                 r, belt.get("density", 5000)*pi*r*r,
+                                 tuple(belt["clr"]) if "clr" in belt else clr)
+            v = circularVelocity(planet.pos, parent, belt.get("clockwise", False))
+            planet.v = (v.x, v.y)
+            planets.append(planet)
+            velocities.append(planet.v)
+            fixed.append(False)
+
+    return BodySystem(planets, velocities, fixed, data.get("theta", 0.5))
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class QuadTree():
+    """ Barnes-Hut quadtree over bodies, stored as flat arrays and queried many points at a time.
+
+    Bodies are sorted along a Morton (Z-order) curve so every node is a contiguous range of
+    the sorted bodies. Each node keeps its total mass, center of mass, bounding box and the
+    largest and smallest radius inside it. Queries walk the tree one level at a time for all
+    points together, so the Python loop runs once per level instead of once per point or body.
+    """
+    def __init__(self, pos, mass, radius, maxDepth=MAX_DEPTH):
+        n = len(pos)
+        lo = pos.min(axis=0)
+        width = max((pos.max(axis=0) - lo).max(), 1e-9)
+        cells = np.minimum(((pos - lo)/width*2**maxDepth).astype(np.int64), 2**maxDepth - 1)
+        keys = spreadBits(cells[:,0]) | (spreadBits(cells[:,1]) << 1)
+
+        self.order = np.argsort(keys, kind="stable")   # sorted position -> body index
+        self.rank = np.empty(n, dtype=np.intp)          # body index -> sorted position
+        self.rank[self.order] = np.arange(n)
+        self.x = pos[self.order,0]
+        self.y = pos[self.order,1]
+        self.mass = mass[self.order]
+        self.r = radius[self.order]
+        keys = keys[self.order]
+
+        # one entry per level: the level's full partition of the sorted bodies into cells, and
+        # which of those cells are nodes (cells of parents with more than one body; a single
+        # body is always a leaf)
+        self.partitions = [np.array([0])]
+        self.kept = [np.array([True])]
+        levelStarts = [np.array([0])]
+        levelEnds = [np.array([n])]
+        for level in range(1, maxDepth + 1):
+            prefix = keys >> (2*(maxDepth - level))
+            partition = np.concatenate(([0], np.flatnonzero(prefix[1:] != prefix[:-1]) + 1))
+            ends = np.append(partition[1:], n)
+            parentStarts, parentEnds = levelStarts[-1], levelEnds[-1]
+            parent = np.searchsorted(parentStarts, partition, "right") - 1
+            kept = (partition < parentEnds[parent]) & (parentEnds - parentStarts > 1)[parent]
+            if not kept.any():
+                break
+            self.partitions.append(partition)
+            self.kept.append(kept)
+            levelStarts.append(partition[kept])
+            levelEnds.append(ends[kept])
+
+        offsets = np.cumsum([0] + [len(starts) for starts in levelStarts])
+        self.start = np.concatenate(levelStarts)
+        self.end = np.concatenate(levelEnds)
+        self.childStart = np.zeros(len(self.start), dtype=np.intp)
+        self.childEnd = np.zeros(len(self.start), dtype=np.intp)
+        for i in range(len(levelStarts) - 1):
+            childStarts = levelStarts[i + 1]
+            self.childStart[offsets[i]:offsets[i + 1]] = offsets[i + 1] + np.searchsorted(childStarts, levelStarts[i])
+            self.childEnd[offsets[i]:offsets[i + 1]] = offsets[i + 1] + np.searchsorted(childStarts, levelEnds[i])
+        self.refit()
+
+    def __len__(self):
+        return len(self.start)
+
+    def rangeReduce(self, ufunc, values):
+        """ ufunc.reduce over each node's bodies, one reduceat per level. """
+        return np.concatenate([ufunc.reduceat(values, partition)[kept]
+                               for partition, kept in zip(self.partitions, self.kept)])
+
+    def refit(self):
+        """ Recompute node masses, centers of mass and boxes from the sorted body arrays. """
+        self.nodeMass = self.rangeReduce(np.add, self.mass)
+        hasMass = self.nodeMass > 0
+        safeMass = np.where(hasMass, self.nodeMass, 1)
+        count = self.end - self.start
+        self.comX = np.where(hasMass, self.rangeReduce(np.add, self.mass*self.x)/safeMass,
+                             self.rangeReduce(np.add, self.x)/count)
+        self.comY = np.where(hasMass, self.rangeReduce(np.add, self.mass*self.y)/safeMass,
+                             self.rangeReduce(np.add, self.y)/count)
+        self.minX = self.rangeReduce(np.minimum, self.x)
+        self.maxX = self.rangeReduce(np.maximum, self.x)
+        self.minY = self.rangeReduce(np.minimum, self.y)
+        self.maxY = self.rangeReduce(np.maximum, self.y)
+        self.maxR = self.rangeReduce(np.maximum, self.r)
+        self.minR = self.rangeReduce(np.minimum, self.r)
+        self.sizeSquared = np.maximum(self.maxX - self.minX, self.maxY - self.minY)**2
+
+    def boxDistances(self, px, py, nodes):
+        """ Squared distance from each point to the nearest and farthest point of its node's box. """
+        nearX = np.maximum(np.maximum(self.minX[nodes] - px, px - self.maxX[nodes]), 0)
+        nearY = np.maximum(np.maximum(self.minY[nodes] - py, py - self.maxY[nodes]), 0)
+        farX = np.maximum(np.abs(px - self.minX[nodes]), np.abs(px - self.maxX[nodes]))
+        farY = np.maximum(np.abs(py - self.minY[nodes]), np.abs(py - self.maxY[nodes]))
+        return nearX*nearX + nearY*nearY, farX*farX + farY*farY
+
+    def children(self, queries, nodes):
+        """ (query, child) pairs replacing each (query, node) pair. """
+        owners, children = expandRanges(self.childStart[nodes], self.childEnd[nodes])
+        return queries[owners], children
+
+    def bodies(self, queries, nodes):
+        """ (query, sorted body) pairs for every body in each pair's node. """
+        owners, bodies = expandRanges(self.start[nodes], self.end[nodes])
+        return queries[owners], bodies
+
+    def accelerations(self, points, theta=0.5, exclude=None):
+        """ Gravity acceleration at each point. A node is treated as one mass at its center of
+            mass when its size is under theta times its distance; smaller theta is more exact.
+            exclude[i] is a body to leave out for point i, or -1. """
+        px, py = points[:,0], points[:,1]
+        m = len(points)
+        ax, ay = np.zeros(m), np.zeros(m)
+        excludeRank = np.full(m, -1) if exclude is None else np.where(exclude >= 0, self.rank[exclude], -1)
+        queries = np.arange(m)
+        nodes = np.zeros(m, dtype=np.intp)
+        thetaSquared = theta*theta
+
+        def accumulate(queries, dx, dy, mass, dSquared):
+            scale = G*mass/(dSquared*np.sqrt(dSquared))
+            ax[:] += np.bincount(queries, dx*scale, m)
+            ay[:] += np.bincount(queries, dy*scale, m)
+
+        while len(queries) > 0:
+            qx, qy = px[queries], py[queries]
+            dx, dy = self.comX[nodes] - qx, self.comY[nodes] - qy
+            dSquared = dx*dx + dy*dy
+            excluded = excludeRank[queries]
+            containsExcluded = (excluded >= self.start[nodes]) & (excluded < self.end[nodes])
+            inside = (qx >= self.minX[nodes]) & (qx <= self.maxX[nodes]) & \
+                     (qy >= self.minY[nodes]) & (qy <= self.maxY[nodes])
+            far = (self.sizeSquared[nodes] < thetaSquared*dSquared) & ~inside & ~containsExcluded
+            if far.any():
+                accumulate(queries[far], dx[far], dy[far], self.nodeMass[nodes[far]], dSquared[far])
+
+            leaf = self.childStart[nodes] == self.childEnd[nodes]
+            near = ~far & leaf
+            if near.any():
+                bodyQueries, bodies = self.bodies(queries[near], nodes[near])
+                bx, by = self.x[bodies] - px[bodyQueries], self.y[bodies] - py[bodyQueries]
+                bSquared = bx*bx + by*by
+                valid = (bSquared > 0) & (bodies != excludeRank[bodyQueries])
+                accumulate(bodyQueries[valid], bx[valid], by[valid], self.mass[bodies[valid]], bSquared[valid])
+
+            opened = ~far & ~leaf
+            queries, nodes = self.children(queries[opened], nodes[opened])
+        return np.stack((ax, ay), axis=1)
+
+    def nearest(self, points, surface=False):
+        """ Index (into the original bodies) of the nearest body to each point, and its distance.
+            surface=True measures to each body's surface instead of its center. """
+        px, py = points[:,0], points[:,1]
+        m = len(points)
+        bound = np.full(m, np.inf)      # some body is at most this far, for pruning
+        best = np.full(m, np.inf)       # nearest body measured so far
+        bestBody = np.full(m, -1, dtype=np.intp)
+        queries = np.arange(m)
+        nodes = np.zeros(m, dtype=np.intp)
+
+        while len(queries) > 0:
+            nearSquared, farSquared = self.boxDistances(px[queries], py[queries], nodes)
+            lower, upper = np.sqrt(nearSquared), np.sqrt(farSquared)
+            if surface:
+                lower -= self.maxR[nodes]
+                upper -= self.minR[nodes]
+            np.minimum.at(bound, queries, upper)
+            keep = lower <= bound[queries] + 1e-9*np.abs(bound[queries])   # slack for rounding
+            queries, nodes = queries[keep], nodes[keep]
+
+            leaf = self.childStart[nodes] == self.childEnd[nodes]
+            if leaf.any():
+                bodyQueries, bodies = self.bodies(queries[leaf], nodes[leaf])
+                dist = np.hypot(self.x[bodies] - px[bodyQueries], self.y[bodies] - py[bodyQueries])
+                if surface:
+                    dist -= self.r[bodies]
+                order = np.lexsort((dist, bodyQueries))
+                firsts = order[np.flatnonzero(np.diff(bodyQueries[order], prepend=-1) != 0)]
+                firsts = firsts[dist[firsts] < best[bodyQueries[firsts]]]
+                best[bodyQueries[firsts]] = dist[firsts]
+                bestBody[bodyQueries[firsts]] = self.order[bodies[firsts]]
+
+            queries, nodes = self.children(queries[~leaf], nodes[~leaf])
+        return bestBody, best
+
+    def overlapping(self, points, radii):
+        """ (point index, body index) pairs where a circle of radii[i] around point i touches a body. """
+        px, py = points[:,0], points[:,1]
+        radii = np.broadcast_to(radii, (len(points),))
+        queries = np.arange(len(points))
+        nodes = np.zeros(len(points), dtype=np.intp)
+        hitPoints, hitBodies = [], []
+
+        while len(queries) > 0:
+            nearSquared = self.boxDistances(px[queries], py[queries], nodes)[0]
+            reach = self.maxR[nodes] + radii[queries]
+            keep = nearSquared <= reach*reach
+            queries, nodes = queries[keep], nodes[keep]
+
+            leaf = self.childStart[nodes] == self.childEnd[nodes]
+            if leaf.any():
+                bodyQueries, bodies = self.bodies(queries[leaf], nodes[leaf])
+                dx, dy = self.x[bodies] - px[bodyQueries], self.y[bodies] - py[bodyQueries]
+                reach = self.r[bodies] + radii[bodyQueries]
+                hit = dx*dx + dy*dy < reach*reach
+                hitPoints.append(bodyQueries[hit])
+                hitBodies.append(self.order[bodies[hit]])
+
+            queries, nodes = self.children(queries[~leaf], nodes[~leaf])
+        if len(hitPoints) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        return np.concatenate(hitPoints), np.concatenate(hitBodies)
+
+class BodySystem(PlanetList):
+    """ Planets as arrays, optionally moving under each other's gravity.
+
+    Answers the same queries as PlanetList, but in numpy: summing over every body directly
+    while points times bodies is at most directLimit, and through a Barnes-Hut QuadTree with
+    opening angle theta above that. Bodies that are not fixed are moved by step() with
+    kick-drift-kick leapfrog; fixed bodies still pull on everything but stay put.
+    The nearest planet of a rocket is the one whose surface is closest.
+    """
+    def __init__(self, planets, velocities=None, fixed=None, theta=0.5, directLimit=100000):
+        PlanetList.__init__(self, planets)
+        self.pos = np.array([planet.pos for planet in planets], dtype=np.float64)
+        if velocities is None:
+            velocities = np.zeros((len(planets), 2))
+        self.v = np.array(velocities, dtype=np.float64)
+        self.mass = np.array([planet.mass for planet in planets], dtype=np.float64)
+        self.r = np.array([planet.r for planet in planets], dtype=np.float64)
+        self.gm = G*self.mass
+        if fixed is None:
+            fixed = (self.v == 0).all(axis=1)     # bodies given no velocity stay put
+        self.fixed = np.array(fixed, dtype=bool)
+        self.movingIndex = np.flatnonzero(~self.fixed)
+        self.moving = len(self.movingIndex) > 0
+        self.theta = theta
+        self.directLimit = directLimit
+        self.indices = {planet: i for i, planet in enumerate(planets)}
+        self.tree = None
+        self.movingA = None     # acceleration of the moving bodies at the end of the last step
+        for planet, v in zip(planets, self.v.tolist()):
+            planet.v = tuple(v)
+
+    def getTree(self):
+        if self.tree is None:
+            self.tree = QuadTree(self.pos, self.mass, self.r)
+        return self.tree
+
+    def gravityAt(self, points, exclude=None):
+        """ (M, 2) gravity acceleration at points; exclude[i] is a body to leave out for point i, or -1. """
+        points = np.asarray(points, dtype=np.float64)
+        if len(points)*len(self) > self.directLimit:
+            return self.getTree().accelerations(points, self.theta, exclude)
+        dx = self.pos[None,:,0] - points[:,None,0]
+        dy = self.pos[None,:,1] - points[:,None,1]
+        dSquared = dx*dx + dy*dy
+        dSquared[dSquared == 0] = np.inf     # a point exactly on a body feels nothing from it
+        scale = self.gm/(dSquared*np.sqrt(dSquared))
+        if exclude is not None:
+            rows = np.flatnonzero(exclude >= 0)
+            scale[rows, exclude[rows]] = 0
+        return np.stack(((dx*scale).sum(axis=1), (dy*scale).sum(axis=1)), axis=1)
+
+    def nearest(self, points):
+        """ Index of the body with the closest surface to each point, and the distance to it. """
+        points = np.asarray(points, dtype=np.float64)
+        if len(points)*len(self) > self.directLimit:
+            return self.getTree().nearest(points, True)
+        dist = np.hypot(self.pos[None,:,0] - points[:,None,0], self.pos[None,:,1] - points[:,None,1]) - self.r
+        index = dist.argmin(axis=1)
+        return index, dist[np.arange(len(points)), index]
+
+    def overlapping(self, points, radii):
+        """ (point index, body index) pairs where a circle of radii around a point touches a body. """
+        return self.getTree().overlapping(np.asarray(points, dtype=np.float64), radii)
+
+    def step(self, h):
+        if not self.moving:
+            return
+        moving = self.movingIndex
+        if self.movingA is None:
+            self.movingA = self.gravityAt(self.pos[moving], moving)
+        self.v[moving] += self.movingA*(h/2)
+        self.pos[moving] += self.v[moving]*h
+        self.tree = None
+        self.movingA = self.gravityAt(self.pos[moving], moving)
+        self.v[moving] += self.movingA*(h/2)
+        for i, pos, v in zip(moving.tolist(), self.pos[moving].tolist(), self.v[moving].tolist()):
+            self[i].pos = tuple(pos)
+            self[i].v = tuple(v)
+
+    # PlanetList queries for one RocketPhysics
+
+    def rocketExclude(self, rocket):
+        if rocket.altitude <= 0:
+            return np.array([self.indices[rocket.nearestPlanet]])
+        return np.array([-1])
+
+    def gravityVectors(self, rocket):
+        """ One vector, the total pull of every body. """
+        a = self.gravityAt([tuple(rocket.center)], self.rocketExclude(rocket))[0]
+        return [Vector2(a[0], a[1])]
+
+    def accelerationAt(self, rocket, pos):
+        a = self.gravityAt([tuple(pos)], self.rocketExclude(rocket))[0]
+        return Vector2(a[0], a[1])
+
+    def nearestTo(self, pos, current):
+        return self[int(self.nearest([tuple(pos)])[0][0])]
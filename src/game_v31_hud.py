@@ -0,0 +1,110 @@
+#########################################
+# File Name: game_v31_hud.py
+# Description: Flight info text for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import pygame
+from game_v31_classes import ScalableText, scaleSurface, DEFAULT_RES
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class GlyphAtlas():
+    """ Characters used in numbers, rendered once and rescaled only when the window changes size. """
+    def __init__(self, font, clr, chars="0123456789-.,"):
+        self.glyphs = {}
+        for char in chars:
+            self.glyphs[char] = ScalableText(char, font, clr)
+
+    def resize(self, screenSize, defaultScreenSize=DEFAULT_RES, smooth=True):
+        for glyph in self.glyphs.values():
+            glyph.scale(screenSize, defaultScreenSize, smooth)
+
+    def canRender(self, text):
+        for char in text:
+            if char not in self.glyphs:
+                return False
+        return True
+
+    def render(self, text):
+        surfs = [self.glyphs[char].scaledSurf for char in text]
+        w = sum(surf.get_width() for surf in surfs)
+        h = max([surf.get_height() for surf in surfs] + [0])
+        rendered = pygame.Surface((w, h), pygame.SRCALPHA)
+        x = 0
+        for surf in surfs:
+            rendered.blit(surf, (x, 0))
+            x += surf.get_width()
+        return rendered
+
+class HudLine():
+    """ "label value unit" as one cached surface, rebuilt only when the value text changes. """
+    def __init__(self, label, unit, font, clr, atlas):
+        self.label = ScalableText(label, font, clr)
+        self.unit = ScalableText(unit, font, clr)
+        self.font = font
+        self.clr = clr
+        self.atlas = atlas
+        self.screenSize = DEFAULT_RES
+        self.smooth = True
+        self.words = {}         # renders of values that are not numbers (planet names)
+        self.value = None
+        self.surf = None
+        self.topLeft = (0,0)
+
+    def resize(self, topLeft, screenSize, defaultScreenSize=DEFAULT_RES, smooth=True):
+        self.topLeft = topLeft
+        self.screenSize = screenSize
+        self.smooth = smooth
+        self.label.scale(screenSize, defaultScreenSize, smooth)
+        self.unit.scale(screenSize, defaultScreenSize, smooth)
+        self.value, value = None, self.value
+        if value != None:
+            self.set(value)
+
+    def renderValue(self, value):
+        if self.atlas.canRender(value):
+            return self.atlas.render(value)
+        if value not in self.words:
+            self.words[value] = ScalableText(value, self.font, self.clr)
+        self.words[value].scale(self.screenSize, DEFAULT_RES, self.smooth)     # kept from the last time at this size
+        return self.words[value].scaledSurf
+
+    def set(self, value):
+        if value == self.value:
+            return
+        self.value = value
+        parts = [self.label.scaledSurf, self.renderValue(value), self.unit.scaledSurf]
+        self.surf = pygame.Surface((sum(part.get_width() for part in parts),
+                                    max(part.get_height() for part in parts)), pygame.SRCALPHA)
+        x = 0
+        for part in parts:
+            self.surf.blit(part, (x, 0))
+            x += part.get_width()
+
+    def draw(self, screen):
+        if self.surf != None:
+            screen.blit(self.surf, self.topLeft)
+
+class Hud():
+    """ Flight info in the top left corner. lines is a list of [label, unit] pairs. """
+    def __init__(self, lines, font, clr):
+        self.atlas = GlyphAtlas(font, clr)
+        self.lines = []
+        for label, unit in lines:
+            self.lines.append(HudLine(label, unit, font, clr, self.atlas))
+
+    def resize(self, width, height, smooth=True):
+        self.atlas.resize((width, height), DEFAULT_RES, smooth)
+        for i in range(len(self.lines)):
+            self.lines[i].resize((width//20, height*(i+1)//30), (width, height), DEFAULT_RES, smooth)
+
+    def update(self, values):
+        for i in range(len(self.lines)):
+            self.lines[i].set(values[i])
+
+    def draw(self, screen):
+        for line in self.lines:
+            line.draw(screen)
@@ -0,0 +1,204 @@
+#########################################
+# File Name: game_v31_inputlog.py
+# Description: Control input logging and headless deterministic re-simulation for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import os, sys, json, argparse
+from time import perf_counter
+from game_v31_physics import INTEGRATORS, RocketPhysics, Simulation, SimClock, makePlanets
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+VERSION = 1
+
+## control inputs that can be logged, each a method of RocketPhysics except launch
+COMMANDS = ("launch", "throttleMax", "throttleZero", "throttleUp", "throttleDown", "rotCCW", "rotCW", "stabilize")
+
+## rocket values compared between a flight and its re-simulation
+STATE_FIELDS = ["time", "ticks", "x", "y", "vx", "vy", "angle", "angV", "throttle", "fuel", "crashed"]
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def applyCommand(sim, command):
+    if command == "launch":
+        sim.launch()
+    elif command in COMMANDS:
+        getattr(sim.rocket, command)()
+    else:
+        raise ValueError("unknown command " + str(command))
+
+def stateOf(sim, simClock):
+    rocket = sim.rocket
+    return {"time": sim.time, "ticks": simClock.ticks, "x": rocket.center.x, "y": rocket.center.y,
+            "vx": rocket.v.x, "vy": rocket.v.y, "angle": rocket.angle, "angV": rocket.angV,
+            "throttle": rocket.throttle, "fuel": rocket.fuelPercent, "crashed": rocket.crashed}
+
+def readInputLog(filename):
+    """ Header, frames and end record of a log. A log cut short (the game was killed) has no end record. """
+    frames = []
+    end = None
+    with open(filename) as f:
+        header = json.loads(f.readline())
+        if header.get("version") != VERSION:
+            raise ValueError(filename + " has input log version " + str(header.get("version")))
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break   # the last line was only half written
+            if isinstance(record, dict):
+                end = record
+            else:
+                frames.append(record)
+    return header, frames, end
+
+def simHeader(sim, simClock):
+    """ What makeSimulation() needs to build the simulation again: integrator, rocket and clock settings. """
+    rocket = sim.rocket
+    integrator = [name for name, fn in INTEGRATORS.items() if fn == sim.integrator][0]
+    return {"integrator": integrator, "coast": sim.coast != None,
+            "rocket": {"w": rocket.w, "h": rocket.h, "mass": rocket.mass, "maxThrust": rocket.maxThrust},
+            "clock": {"stepSize": simClock.stepSize, "maxSubsteps": simClock.maxSubsteps,
+                      "maxFrameTime": simClock.maxFrameTime, "pathSamples": simClock.pathSamples}}
+
+def makeSimulation(header):
+    """ A new simulation and clock from a simHeader() plus the system it flies in, rocket on the pad. """
+    if header["system"] == None:
+        planets = makePlanets()
+    else:
+        from game_v31_gravity import loadSystem
+        planets = loadSystem(os.path.join(os.path.dirname(os.path.abspath(__file__)), header["system"]))   # relative to the game
+    spec = header["rocket"]
+    rocket = RocketPhysics(spec["w"], spec["h"], spec["mass"], spec["maxThrust"], planets[0], planets)
+    coast = None
+    if header["coast"]:
+        from game_v31_kepler import KeplerCoast
+        coast = KeplerCoast(planets)
+    return Simulation(rocket, planets, header["integrator"], coast), SimClock(**header["clock"])
+
+def resimulate(header, frames, end=None, telemetryFile=None):
+    """ Feed a logged flight through the physics again, with nothing drawn and no waiting.
+
+    Every frame makes the same SimClock.advance() call as the game did, after the commands
+    given since the frame before, so the result is bit for bit the same as long as the
+    physics is. Returns the simulation, its clock and the first frame whose tick count no
+    longer matches the log (None if they all do). With telemetryFile the flight is also
+    recorded the way the game records it, so the two files can be compared. A log of a
+    flight that was quickloaded starts from the snapshot it names instead of the pad.
+    """
+    sim, simClock = makeSimulation(header)
+    if header.get("snapshot") != None:
+        from game_v31_save import loadSnapshot
+        loadSnapshot(os.path.join(os.path.dirname(os.path.abspath(__file__)), header["snapshot"])).restore(sim, simClock)
+    rocket = sim.rocket
+    planets = sim.planets
+    telemetry = None
+    if telemetryFile != None:
+        from game_v31_telemetry import TelemetryRecorder
+        telemetry = TelemetryRecorder(telemetryFile, planets, header["rocketName"])
+
+    diverged = None
+    for n, frame in enumerate(frames):
+        tick, dt, timeWarp, rcs = frame[:4]
+        if tick != simClock.ticks and diverged == None:
+            diverged = n
+        for command in frame[4:]:
+            applyCommand(sim, command)
+        sim.rcs = bool(rcs)
+        simClock.advance(sim, dt, timeWarp)
+        if telemetry != None and rocket.launched:
+            telemetry.record(sim)
+        if rocket.crashed:
+            rocket.freeze()     # as the game does every frame after a crash
+    if end != None:
+        for command in end["commands"]:
+            applyCommand(sim, command)
+    if telemetry != None:
+        telemetry.close()
+    return sim, simClock, diverged
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class InputLog():
+    """ Logs everything the player does to a flight, so it can be re-simulated without the game.
+
+    The physics only depends on the frame times and time warps passed to SimClock.advance()
+    and the control commands given between those calls; countdowns, crash delays and
+    drawing do not reach it. The file is json lines: a header with the rocket, system and
+    clock settings, one [tick, dt, timeWarp, rcs, commands...] list per frame, and a final
+    record with the commands given after the last frame and the state the flight ended in.
+    A flight that continues from a saved snapshot names the snapshot file in the header.
+    """
+    def __init__(self, filename, sim, simClock, rocketName, system=None, snapshot=None):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(filename, "w")
+        self.sim = sim
+        self.simClock = simClock
+        self.commands = []      # given since the last frame
+        header = {"version": VERSION, "rocketName": rocketName, "system": system, "snapshot": snapshot}
+        header.update(simHeader(sim, simClock))
+        self.file.write(json.dumps(header) + "\n")
+
+    def apply(self, command):
+        """ Give the rocket a command and log it. """
+        applyCommand(self.sim, command)
+        self.commands.append(command)
+
+    def frame(self, dt, timeWarp, rcs):
+        """ Log the inputs of the SimClock.advance() call about to be made. """
+        record = [self.simClock.ticks, dt, timeWarp, int(rcs)] + self.commands
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.commands = []
+
+    def close(self):
+        if self.file == None:
+            return
+        self.file.write(json.dumps({"commands": self.commands, "state": stateOf(self.sim, self.simClock)}) + "\n")
+        self.file.close()
+        self.file = None
+
+#-----------------------------#
+# Main Program                #
+#-----------------------------#
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Re-simulate logged flights and check they end the same way.")
+    parser.add_argument("logs", nargs="+", help="input logs, e.g. flights/last.inputs")
+    parser.add_argument("--telemetry", help="also record the re-simulation to this telemetry file (one log only)")
+    args = parser.parse_args(args)
+
+    failed = 0
+    for filename in args.logs:
+        header, frames, end = readInputLog(filename)
+        start = perf_counter()
+        sim, simClock, diverged = resimulate(header, frames, end, args.telemetry)
+        seconds = perf_counter() - start
+
+        state = stateOf(sim, simClock)
+        print(filename + ": " + str(len(frames)) + " frames, " + str(simClock.ticks) + " steps, " +
+              str(round(sim.time, 2)) + " s simulated in " + str(round(seconds, 3)) + " s (" +
+              str(round(simClock.ticks/max(seconds, 1e-9))) + " steps/s)")
+        if end == None:
+            print("  no end state logged, nothing to compare")
+            continue
+        different = [name for name in STATE_FIELDS if state[name] != end["state"][name]]
+        if diverged != None:
+            print("  step count differs from frame " + str(diverged) + " on")
+        for name in different:
+            print("  " + name + ": logged " + repr(end["state"][name]) + ", re-simulated " + repr(state[name]))
+        if different:
+            failed += 1
+        else:
+            print("  identical")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+#########################################
+# File Name: game_v31_kepler.py
+# Description: Analytic two-body coasting ("on rails") for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+from pygame.math import Vector2
+from math import sqrt, sin, cos, sinh, cosh, asinh, atan2, log, pi, inf
+from game_v31_physics import G
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def stumpffC(z):
+    if z > 1e-6:
+        return (1 - cos(sqrt(z)))/z
+    elif z < -1e-6:
+        return (cosh(sqrt(-z)) - 1)/(-z)
+    else:
+        return 1/2 - z/24 + z*z/720
+
+def stumpffS(z):
+    if z > 1e-6:
+        sz = sqrt(z)
+        return (sz - sin(sz))/(sz**3)
+    elif z < -1e-6:
+        sz = sqrt(-z)
+        return (sinh(sz) - sz)/(sz**3)
+    else:
+        return 1/6 - z/120 + z*z/5040
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class KeplerOrbit():
+    """ Two-body orbit around one planet, propagated with the universal variable Kepler equation.
+
+    Works for ellipses, parabolas and hyperbolas alike. pos and v are relative to the planet.
+    """
+    def __init__(self, planet, pos, v):
+        self.planet = planet
+        self.mu = G*planet.mass
+        self.r0 = Vector2(pos)
+        self.v0 = Vector2(v)
+        self.r0Length = self.r0.length()
+        self.vr0 = self.r0.dot(self.v0)/self.r0Length      # radial speed
+        self.alpha = 2/self.r0Length - self.v0.length_squared()/self.mu    # 1/semi-major axis
+
+        angMomentum = self.r0.x*self.v0.y - self.r0.y*self.v0.x
+        eVec = (self.r0*(self.v0.length_squared() - self.mu/self.r0Length) - self.v0*self.r0.dot(self.v0))/self.mu
+        self.e = eVec.length()
+        self.p = angMomentum**2/self.mu          # semi-latus rectum
+        self.periapsis = self.p/(1 + self.e)
+        if self.alpha > 0:
+            self.period = 2*pi/sqrt(self.mu*self.alpha**3)
+        else:
+            self.period = None
+
+    def solveChi(self, dt):
+        """ Universal anomaly dt >= 0 seconds after the epoch. The Kepler function only ever
+            increases with chi, so Newton's method is kept inside a bisection bracket. """
+        sqrtMu = sqrt(self.mu)
+        def kepler(chi):
+            z = self.alpha*chi*chi
+            if z < -490000:
+                return inf, inf     # cosh would overflow, chi is far past the answer
+            c, s = stumpffC(z), stumpffS(z)
+            f = self.r0Length*self.vr0/sqrtMu*chi*chi*c + (1 - self.alpha*self.r0Length)*chi**3*s + \
+                self.r0Length*chi - sqrtMu*dt
+            r = self.r0Length*self.vr0/sqrtMu*chi*(1 - z*s) + (1 - self.alpha*self.r0Length)*chi*chi*c + self.r0Length
+            return f, r
+
+        if self.alpha > 1e-12:
+            chi = sqrtMu*self.alpha*dt
+        elif self.alpha < -1e-12:
+            a = 1/self.alpha
+            guess = (-2*self.mu*self.alpha*dt)/(self.r0.dot(self.v0) + sqrt(-self.mu*a)*(1 - self.r0Length*self.alpha))
+            chi = sqrt(-a)*log(guess) if guess > 0 else sqrtMu*dt/self.r0Length
+        else:
+            chi = sqrtMu*dt/self.r0Length
+
+        lo, hi = 0, None     # dt >= 0 so chi >= 0
+        for i in range(100):
+            f, r = kepler(chi)
+            if abs(f) < 1e-12*sqrtMu*max(1, dt):
+                break
+            if f < 0:
+                lo = chi
+            else:
+                hi = chi
+            if f == inf:
+                chi = (lo + hi)/2
+                continue
+            chi -= f/r
+            if chi <= lo or (hi != None and chi >= hi):
+                chi = lo*2 + 1 if hi == None else (lo + hi)/2
+        return chi
+
+    def propagate(self, dt):
+        """ Position and velocity relative to the planet dt seconds after the epoch. """
+        if dt == 0:
+            return Vector2(self.r0), Vector2(self.v0)
+        if self.period != None:
+            dt = dt % self.period
+        chi = self.solveChi(dt)
+        z = self.alpha*chi*chi
+        c, s = stumpffC(z), stumpffS(z)
+        sqrtMu = sqrt(self.mu)
+
+        f = 1 - chi*chi/self.r0Length*c
+        g = dt - chi**3*s/sqrtMu
+        pos = self.r0*f + self.v0*g
+        r = pos.length()
+        fDot = sqrtMu/(r*self.r0Length)*(z*s - 1)*chi
+        gDot = 1 - chi*chi/r*c
+        v = self.r0*fDot + self.v0*gDot
+        return pos, v
+
+    def timeToPeriapsis(self):
+        """ Seconds until the next periapsis, or None if the rocket is already leaving on an open orbit. """
+        if self.e < 1e-9:
+            return None
+        if self.alpha > 0:
+            a = 1/self.alpha
+            eCosE = 1 - self.r0Length/a
+            eSinE = self.r0.dot(self.v0)/sqrt(self.mu*a)
+            E = atan2(eSinE, eCosE)
+            M = E - eSinE
+            n = sqrt(self.mu*self.alpha**3)
+            return ((-M) % (2*pi))/n
+        elif self.vr0 < 0:
+            a = -1/self.alpha if self.alpha < 0 else 1e30
+            F = asinh(self.r0.dot(self.v0)/(self.e*sqrt(self.mu*a)))
+            M = self.e*sinh(F) - F
+            n = sqrt(self.mu/a**3)
+            return -M/n
+        return None
+
+class KeplerCoast():
+    """ Moves an unpowered rocket analytically about its dominant planet (patched conics).
+
+    The dominant planet is the most massive one unless the rocket is inside another planet's
+    sphere of influence. Crossing a sphere of influence is located by sampling the orbit and
+    bisecting, then the orbit is rebuilt around the new planet. Coasting stops minAltitude
+    above the ground so the numerical integrator handles landings and crashes.
+    """
+    def __init__(self, planets, minAltitude=500, samples=32):
+        self.planets = planets
+        self.minAltitude = minAltitude
+        self.samples = samples      # orbit samples per advance, for finding sphere of influence crossings
+        self.primary = max(planets, key=lambda planet: planet.mass)
+        self.soi = {}
+        for planet in planets:
+            if planet != self.primary:
+                d = (Vector2(planet.pos) - Vector2(self.primary.pos)).length()
+                self.soi[planet] = d*(planet.mass/self.primary.mass)**0.4    # Laplace radius
+
+    def dominantPlanet(self, pos):
+        for planet, radius in self.soi.items():
+            if (Vector2(pos) - Vector2(planet.pos)).length_squared() < radius*radius:
+                return planet
+        return self.primary
+
+    def makeOrbit(self, planet, pos, v):
+        return KeplerOrbit(planet, Vector2(pos) - Vector2(planet.pos), v)
+
+    def worldState(self, orbit, t):
+        pos, v = orbit.propagate(t)
+        return pos + Vector2(orbit.planet.pos), v
+
+    def groundTime(self, orbit, duration, margin):
+        """ First time in [0, duration] the orbit comes within minAltitude of its planet's surface. """
+        limit = orbit.planet.r + self.minAltitude + margin
+        if orbit.periapsis >= limit:
+            return None
+        tPeri = orbit.timeToPeriapsis()
+        if tPeri == None:
+            return None
+        start = 0
+        if orbit.period != None:
+            start = max(0, tPeri - orbit.period/2)    # radius only falls between apoapsis and periapsis
+        if start >= duration:
+            return None
+        end = min(tPeri, duration)
+        if orbit.propagate(end)[0].length() > limit:
+            return None
+        if orbit.propagate(start)[0].length() <= limit:
+            return start
+        for i in range(50):
+            mid = (start + end)/2
+            if orbit.propagate(mid)[0].length() > limit:
+                start = mid
+            else:
+                end = mid
+        return start
+
+    def soiTime(self, orbit, duration):
+        """ First time in [0, duration] the dominant planet changes, found by sampling then bisecting. """
+        prev = 0
+        for i in range(1, self.samples + 1):
+            t = duration*i/self.samples
+            pos, v = self.worldState(orbit, t)
+            if self.dominantPlanet(pos) != orbit.planet:
+                start, end = prev, t
+                for j in range(40):
+                    mid = (start + end)/2
+                    if self.dominantPlanet(self.worldState(orbit, mid)[0]) != orbit.planet:
+                        end = mid
+                    else:
+                        start = mid
+                return end
+            prev = t
+        return None
+
+    def advance(self, rocket, duration, pathSamples=16):
+        """ Coast the rocket for up to duration seconds. Returns the time actually coasted,
+            which is less than duration if the rocket got close to the ground. """
+        margin = rocket.h/2 + rocket.w/2
+        elapsed = 0
+        for i in range(len(self.planets) + 2):     # a few sphere of influence changes per frame at most
+            orbit = self.makeOrbit(self.dominantPlanet(rocket.center), rocket.center, rocket.v)
+            remaining = duration - elapsed
+            stop = self.groundTime(orbit, remaining, margin)
+            end = remaining if stop == None else stop
+            crossing = self.soiTime(orbit, end)
+            if crossing != None:
+                end = crossing
+
+            if rocket.path != None:
+                for j in range(1, pathSamples):
+                    rocket.center.update(self.worldState(orbit, end*j/pathSamples)[0])
+                    rocket.recordPath()
+            pos, v = self.worldState(orbit, end)
+            rocket.center.update(pos)
+            rocket.v.update(v)
+            elapsed += end
+            if crossing == None:
+                break
+        rocket.angle += (rocket.angV*elapsed)%360
+        return elapsed
@@ -0,0 +1,286 @@
+#########################################
+# File Name: game_v31_path.py
+# Description: Bounded trajectory storage for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import numpy as np
+from math import sqrt, radians, cos
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+CHUNK_POINTS = 4096     # points per frozen chunk of a level, 64 KB
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def simplifyPolyline(points, tolerance):
+    """ Douglas-Peucker: drop points closer than tolerance to the line between the points kept around them. """
+    n = len(points)
+    if n < 3:
+        return points.copy()
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        inner = points[first + 1:last]
+        seg = end - start
+        segLength = sqrt(seg[0]*seg[0] + seg[1]*seg[1])
+        if segLength == 0:
+            dists = np.hypot(inner[:,0] - start[0], inner[:,1] - start[1])
+        else:
+            dists = np.abs(seg[0]*(inner[:,1] - start[1]) - seg[1]*(inner[:,0] - start[0]))/segLength
+        worst = int(dists.argmax())
+        if dists[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class PointBuffer():
+    """ Growable (n, 2) float64 array with amortized O(1) appends. """
+    def __init__(self, capacity=256):
+        self.data = np.empty((capacity, 2))
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def reserve(self, n):
+        if n > len(self.data):
+            bigger = np.empty((max(n, len(self.data)*2), 2))
+            bigger[:self.n] = self.data[:self.n]
+            self.data = bigger
+
+    def append(self, x, y):
+        self.reserve(self.n + 1)
+        self.data[self.n] = (x, y)
+        self.n += 1
+
+    def appendMany(self, points):
+        self.reserve(self.n + len(points))
+        self.data[self.n:self.n + len(points)] = points
+        self.n += len(points)
+
+    def view(self):
+        return self.data[:self.n]
+
+    def clear(self):
+        self.n = 0
+
+class PathLevel():
+    """ One resolution of the path: a polyline simplified to tolerance, split into blocks
+        of blockSize segments with a bounding box each for culling. """
+    def __init__(self, tolerance, blockSize=64):
+        self.tolerance = tolerance
+        self.blockSize = blockSize
+        self.points = PointBuffer(1024)
+        self.boxes = np.empty((0, 4))       # minX, minY, maxX, maxY per block
+        self.consumed = 0                   # points of the finer level already simplified into this one
+        self.frozen = []                    # read-only copies of the full chunks, see freeze()
+
+    def __len__(self):
+        return len(self.points)
+
+    def extend(self, newPoints, simplify=True):
+        """ Append a polyline that starts at this level's last point (if it has one). """
+        if simplify:
+            newPoints = simplifyPolyline(newPoints, self.tolerance)
+        if len(self.points) > 0:
+            newPoints = newPoints[1:]
+        if len(newPoints) == 0:
+            return
+        firstDirty = max(0, len(self.points) - 1)//self.blockSize
+        self.points.appendMany(newPoints)
+        self.updateBoxes(firstDirty)
+
+    def updateBoxes(self, firstBlock):
+        points = self.points.view()
+        nBlocks = max(0, -(-(len(points) - 1)//self.blockSize))
+        boxes = np.empty((nBlocks, 4))
+        boxes[:firstBlock] = self.boxes[:firstBlock]
+        for i in range(firstBlock, nBlocks):
+            block = points[i*self.blockSize:(i + 1)*self.blockSize + 1]   # shares its end point with the next block
+            boxes[i,:2] = block.min(axis=0)
+            boxes[i,2:] = block.max(axis=0)
+        self.boxes = boxes
+
+    def visibleRuns(self, left, top, right, bottom):
+        """ (start, end) point index ranges, end inclusive, of consecutive blocks touching the rect. """
+        boxes = self.boxes
+        visible = (boxes[:,0] <= right) & (boxes[:,2] >= left) & (boxes[:,1] <= bottom) & (boxes[:,3] >= top)
+        edges = np.diff(np.concatenate(([0], visible.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)      # one past the last visible block
+        last = len(self.points) - 1
+        return [(start*self.blockSize, min(end*self.blockSize, last)) for start, end in zip(starts, ends)]
+
+    def clear(self):
+        self.points.clear()
+        self.boxes = np.empty((0, 4))
+        self.consumed = 0
+        self.frozen = []
+
+    def freeze(self):
+        """ The points as read-only chunks of CHUNK_POINTS, the last one partial.
+
+        Points are only ever appended until the level is cleared, so a full chunk is copied
+        once and the same array is handed out by every later call: snapshots of a long path
+        share all but its newest points.
+        """
+        points = self.points.view()
+        full = len(points)//CHUNK_POINTS
+        for i in range(len(self.frozen), full):
+            chunk = points[i*CHUNK_POINTS:(i + 1)*CHUNK_POINTS].copy()
+            chunk.flags.writeable = False
+            self.frozen.append(chunk)
+        return self.frozen[:full] + [points[full*CHUNK_POINTS:].copy()]
+
+    def thaw(self, chunks, consumed):
+        """ Set the points to those of freeze()d chunks, which stay shared for the next freeze(). """
+        self.points.clear()
+        for chunk in chunks:
+            self.points.appendMany(chunk)
+        self.frozen = list(chunks[:-1])
+        self.consumed = consumed
+        self.boxes = np.empty((0, 4))
+        self.updateBoxes(0)
+
+class PathBuffer():
+    """ Trajectory storage whose size stays bounded however long the flight.
+
+    New points are only kept when the path has moved at least minDistance and turned by
+    more than angleTolerance (or gone maxSegment in a straight line). Every chunkSize kept
+    points, the chunk is simplified with Douglas-Peucker and moved to the history. If the
+    history passes maxPoints, it is simplified again with twice the tolerance.
+
+    The history is levels[0] of a pyramid; each level above it is simplified with
+    levelFactor times the tolerance of the one below, so drawing can pick the coarsest
+    level that still looks exact at the current zoom.
+    """
+    def __init__(self, minDistance=2, angleTolerance=1, maxSegment=2000,
+                 chunkSize=256, tolerance=1, maxPoints=20000, numLevels=6, levelFactor=4):
+        self.minDistance = minDistance
+        self.cosTolerance = cos(radians(angleTolerance))
+        self.maxSegment = maxSegment
+        self.chunkSize = chunkSize
+        self.tolerance = tolerance          # world units, doubles whenever history is full
+        self.maxPoints = maxPoints
+        self.levelFactor = levelFactor
+
+        self.levels = [PathLevel(tolerance*levelFactor**i) for i in range(numLevels)]
+        self.recent = PointBuffer(chunkSize + 1)    # decimated points not yet simplified
+        self.tip = None                     # latest point, always drawn but not always kept
+        self.lastDir = None                 # unit direction of the last kept segment
+
+    @property
+    def history(self):
+        """ Simplified older points. """
+        return self.levels[0].points
+
+    def __len__(self):
+        return len(self.history) + len(self.recent) + (self.tip != None)
+
+    def extend(self, point):
+        x, y = point[0], point[1]
+        self.tip = (x, y)
+        if len(self.recent) == 0:
+            self.recent.append(x, y)
+            return
+        lastX, lastY = self.recent.data[self.recent.n - 1]
+        dx, dy = x - lastX, y - lastY
+        dist = sqrt(dx*dx + dy*dy)
+        if dist < self.minDistance:
+            return
+        dirX, dirY = dx/dist, dy/dist
+        if self.lastDir != None and dist < self.maxSegment and \
+           dirX*self.lastDir[0] + dirY*self.lastDir[1] > self.cosTolerance:
+            return      # still going the same way, the tip covers it
+        self.recent.append(x, y)
+        self.lastDir = (dirX, dirY)
+        if len(self.recent) > self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        """ Simplify the recent points into the history, keeping the last one to continue from. """
+        self.levels[0].extend(simplifyPolyline(self.recent.view(), self.tolerance), False)
+        last = self.recent.data[self.recent.n - 1].copy()
+        self.recent.clear()
+        self.recent.append(last[0], last[1])
+        if len(self.history) > self.maxPoints:
+            self.setTolerance(self.tolerance*2)
+            simplified = simplifyPolyline(self.history.view(), self.tolerance)
+            for level in self.levels:
+                level.clear()
+            self.levels[0].extend(simplified, False)
+        self.updateLevels()
+
+    def setTolerance(self, tolerance):
+        """ Set the history's tolerance and scale every level's to match. """
+        self.tolerance = tolerance
+        for i, level in enumerate(self.levels):
+            level.tolerance = tolerance*self.levelFactor**i
+
+    def updateLevels(self):
+        """ Feed the points added to each level into the next coarser one. """
+        for finer, coarser in zip(self.levels, self.levels[1:]):
+            if len(finer) - coarser.consumed < 2:
+                break
+            coarser.extend(finer.points.view()[coarser.consumed:])
+            coarser.consumed = len(finer) - 1
+
+    def levelFor(self, tolerance):
+        """ Coarsest level whose error stays under tolerance world units. """
+        chosen = self.levels[0]
+        for level in self.levels[1:]:
+            if level.tolerance > tolerance:
+                break
+            chosen = level
+        return chosen
+
+    def recentPoints(self):
+        """ Points after the history: the unsimplified chunk and the tip. """
+        if self.tip == None:
+            return self.recent.view()
+        return np.concatenate((self.recent.view(), [self.tip]))
+
+    @property
+    def points(self):
+        """ Every stored point, oldest first, as an (n, 2) array. """
+        recent = self.recentPoints()
+        if len(self.history) > 0:
+            recent = recent[1:]     # the first recent point is the last point of history
+        return np.concatenate((self.history.view(), recent))
+
+    def clear(self):
+        for level in self.levels:
+            level.clear()
+        self.recent.clear()
+        self.tip = None
+        self.lastDir = None
+
+    def freeze(self):
+        """ Everything needed to thaw() the path to where it is now, sharing unchanged chunks. """
+        return {"tolerance": self.tolerance, "tip": self.tip, "lastDir": self.lastDir,
+                "recent": self.recent.view().copy(),
+                "levels": [{"chunks": level.freeze(), "consumed": level.consumed} for level in self.levels]}
+
+    def thaw(self, state):
+        self.setTolerance(state["tolerance"])
+        self.tip = None if state["tip"] == None else tuple(state["tip"])
+        self.lastDir = None if state["lastDir"] == None else tuple(state["lastDir"])
+        self.recent.clear()
+        self.recent.appendMany(state["recent"])
+        for level, levelState in zip(self.levels, state["levels"]):
+            level.thaw(levelState["chunks"], levelState["consumed"])
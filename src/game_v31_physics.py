@@ -0,0 +1,423 @@
+#########################################
+# File Name: game_v31_physics.py
+# Description: Display-free simulation core for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+from pygame.math import Vector2
+from math import sqrt, degrees, radians, sin, cos, atan2
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+G = 6.674e-11 # Gravitational constant
+
+## planet data format: [name, x, y, radius, mass]
+EARTH_DATA = ["earth", 0, 0, 10000, 1.46838e19]
+MOON_DATA = ["moon", 0, -100000, 3000, 2.1846e17]
+
+## rocket spec format: [height (1 m = 2 px), mass, max thrust, width]
+## width is the height scaled by the aspect ratio of the rocket image
+ROCKET_SPECS = {"spaceShuttle": [112, 2030000, 34696128, 55],
+                "falcon9": [140, 541300, 5885000, 10],
+                "longMarch2F": [124, 464000, 5920000, 17],
+                "soyuz": [91, 305000, 3357000, 16]}
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def getDistance(p1,p2):
+    return sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
+
+def getDistSquared(p1, p2):
+    return (p1[0]-p2[0])**2 + (p1[1]-p2[1])**2
+
+def semiImplicitEuler(rocket, planets, h):
+    """ Velocity first, then position with the new velocity. The original update rule. """
+    rocket.v += rocket.thrustA*h
+    for vec in rocket.gravityVectors:
+        rocket.v += vec*h
+    rocket.center += rocket.v*h
+
+def velocityVerlet(rocket, planets, h):
+    """ Leapfrog in kick-drift-kick form, second order and energy conserving for coasting orbits. """
+    a0 = rocket.getAcceleration()
+    rocket.center += rocket.v*h + a0*(h*h/2)
+    a1 = rocket.getAccelerationAt(planets, rocket.center)
+    rocket.v += (a0 + a1)*(h/2)
+
+def rungeKutta4(rocket, planets, h):
+    x0 = Vector2(rocket.center)
+    v0 = Vector2(rocket.v)
+    k1x, k1v = v0, rocket.getAcceleration()
+    k2x = v0 + k1v*(h/2)
+    k2v = rocket.getAccelerationAt(planets, x0 + k1x*(h/2))
+    k3x = v0 + k2v*(h/2)
+    k3v = rocket.getAccelerationAt(planets, x0 + k2x*(h/2))
+    k4x = v0 + k3v*h
+    k4v = rocket.getAccelerationAt(planets, x0 + k3x*h)
+    rocket.center.update(x0 + (k1x + k2x*2 + k3x*2 + k4x)*(h/6))
+    rocket.v.update(v0 + (k1v + k2v*2 + k3v*2 + k4v)*(h/6))
+
+INTEGRATORS = {"euler": semiImplicitEuler,
+               "verlet": velocityVerlet,
+               "rk4": rungeKutta4}
+
+def makePlanets(planetClass=None, colours=None):
+    """ Create earth and moon. planetClass lets the game build drawable planets. """
+    if planetClass == None:
+        planetClass = Planet
+    if colours == None:
+        colours = [None, None]
+    earth = planetClass(*EARTH_DATA, colours[0])
+    moon = planetClass(*MOON_DATA, colours[1])
+    return PlanetList([earth, moon])
+
+def asPlanetList(planets):
+    if isinstance(planets, PlanetList):
+        return planets
+    return PlanetList(planets)
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class Planet():
+    def __init__(self, name, x, y, r, mass, clr=None):
+        self.name = name
+        self.pos = (x,y)
+        self.r = r
+        self.mass = mass
+        self.clr = clr
+        self.v = (0,0)      # only bodies in a moving BodySystem (game_v31_gravity) have a velocity
+
+    def __str__(self):
+        return self.name + "\n" + \
+               "position: " + str(self.pos) + "\n" + \
+               "radius: " + str(self.r) + "\n" + \
+               "mass: " + str(self.mass) + "\n"
+
+    def getGravityVec(self, rocket):
+        if self == rocket.nearestPlanet and rocket.altitude <= 0:
+            return Vector2(0,0)
+        else:
+            return self.getGravityAt(rocket.center)
+
+    def getGravityAt(self, pos):
+        dSquared = getDistSquared(pos,self.pos)
+        g = G*self.mass/dSquared
+        vec = Vector2(self.pos - pos)
+        vec.scale_to_length(g)
+        return vec
+
+class PlanetList(list):
+    """ The planets of a simulation, with the gravity and nearest planet queries a rocket makes.
+
+    These loop over the planets, which is fastest for a handful of static ones. BodySystem
+    (game_v31_gravity) answers the same queries with arrays and a Barnes-Hut tree for
+    hundreds of moving bodies.
+    """
+    moving = False
+
+    def step(self, h):
+        pass
+
+    def gravityVectors(self, rocket):
+        """ Gravity from each planet, none from the planet a grounded rocket stands on. """
+        return [planet.getGravityVec(rocket) for planet in self]
+
+    def accelerationAt(self, rocket, pos):
+        a = Vector2()
+        for planet in self:
+            if not (planet == rocket.nearestPlanet and rocket.altitude <= 0):
+                a += planet.getGravityAt(pos)
+        return a
+
+    def nearestTo(self, pos, current):
+        """ Planet with the closest center, current unless another is strictly closer. """
+        nearest = current
+        for planet in self:
+            if getDistSquared(planet.pos, pos) < getDistSquared(nearest.pos, pos):
+                nearest = planet
+        return nearest
+
+class RocketPhysics():
+    """ Rocket state and flight dynamics with no surface, image or sound attached. """
+    def __init__(self, w, h, mass, maxThrust, startPlanet, planets):
+        self.w = w
+        self.h = h
+
+        self.center = Vector2(int(startPlanet.pos[0]),   # center in world space
+                              int(startPlanet.pos[1] - startPlanet.r - self.h/2))
+
+        self.corners = []
+        self.angle = 90     # in degrees from positive x axis
+
+        self.mass = mass            # all masses in kg
+        self.fuelPercent = 100
+        self.maxThrust = maxThrust  # in N
+        self.throttle = 0
+        self.thrust = self.throttle*self.maxThrust
+        self.thrustA = Vector2() # instantaneous acceleration due to thrust in m/s^2
+
+        self.v = Vector2()       # instantaneous velocity in m/s
+        self.angV = 0
+
+        self.gravityVectors = []
+        for planet in planets:
+            self.gravityVectors.append(Vector2())
+
+        self.nearestPlanet = startPlanet
+        self.altitude = 0
+        self.angFromPlanet = 90     # relate to nearest planet
+        self.vToPlanet = 0
+        self.vTanPlanet = 0
+
+        self.path = None    # set to a Path to record the trajectory
+
+        self.crashed = False
+        self.launched = False
+
+    @classmethod
+    def fromSpec(cls, spec, startPlanet, planets):
+        height, mass, maxThrust, width = spec
+        return cls(width, height, mass, maxThrust, startPlanet, planets)
+
+    def __str__(self):
+        rocketStr = "center (x,y): " + str(self.center) + "\n" + \
+                    "altitude: " + str(self.altitude) + "\n" + \
+                    "crashed: " + str(self.crashed) + "\n" + \
+                    "nearest planet: " + str(self.nearestPlanet.name) + "\n" + \
+                    "angle from nearest planet (deg): " + str(self.angFromPlanet) + "\n" + \
+                    "angle (deg): " + str(self.angle) + "\n" + \
+                    "mass (kg): " + str(self.mass) + "\n" + \
+                    "fuel % left: " + str(self.fuelPercent) + "\n" + \
+                    "throttle (0 to 1):" + str(self.throttle) + "\n" + \
+                    "thrust (int): " + str(self.thrust) + "\n" + \
+                    "thrust acceleration (polar): " + str(self.thrustA.as_polar()) + "\n" + \
+                    "velocity (polar): " + str(self.v.as_polar()) + "\n" + \
+                    "velocity towards nearest planet: " + str(self.vToPlanet) + "\n" + \
+                    "velocity tangent to nearest planet: " + str(self.vTanPlanet) + "\n" + \
+                    "angular velocity (int): " + str(self.angV) + "\n" + \
+                    "fuel %: " + str(self.fuelPercent) + "\n"
+
+        for vec in self.gravityVectors:
+            rocketStr += "gravity acceleration: " + str(vec.as_polar()) + "\n"
+        return rocketStr
+
+    def detectCrash(self):
+        if self.altitude <= 0:
+            self.v.update(self.nearestPlanet.v)     # stand still on the ground
+            self.angV *= 0.3
+            if abs(self.angle - self.angFromPlanet) > 5 and self.vToPlanet < 7 and self.vTanPlanet < 5:
+                self.crashed = True
+
+    def update(self, planets, dt, timeWarp, integrator=None, recordPath=True):
+        self.detectCrash()
+
+        if self.fuelPercent > 0:
+            self.fuelPercent -= (self.throttle*dt*timeWarp*0.2)
+
+        self.angle += (self.angV*dt*timeWarp)%360
+
+        if self.fuelPercent > 0:
+            self.thrust = self.throttle*self.maxThrust
+            self.thrustA.from_polar((self.thrust/self.mass, -self.angle))
+        else:
+            self.throttle = 0
+            self.thrust = 0
+            self.thrustA.update(0,0)
+
+        planets = asPlanetList(planets)
+        self.gravityVectors = planets.gravityVectors(self)
+
+        if integrator == None:
+            integrator = semiImplicitEuler
+        integrator(self, planets, dt*timeWarp)
+
+        self.updateSurroundings(planets)
+        if recordPath:
+            self.recordPath()
+
+    def getAcceleration(self):
+        """ Acceleration at the current position, from the thrust and gravity vectors of this update. """
+        a = Vector2(self.thrustA)
+        for vec in self.gravityVectors:
+            a += vec
+        return a
+
+    def getAccelerationAt(self, planets, pos):
+        """ Acceleration if the rocket were at pos, thrust held constant over the step. """
+        return self.thrustA + asPlanetList(planets).accelerationAt(self, pos)
+
+    def updateSurroundings(self, planets):
+        """ Recompute corners, nearest planet, altitude and relative velocities from center and v. """
+        self.corners = [[self.center.x + (self.h/2)*cos(radians(self.angle)) + (self.w/2)*cos(radians(self.angle + 90)),
+                         self.center.y - (self.h/2)*sin(radians(self.angle)) - (self.w/2)*sin(radians(self.angle + 90))],
+                        [self.center.x + (self.h/2)*cos(radians(self.angle)) + (self.w/2)*cos(radians(self.angle - 90)),
+                         self.center.y - (self.h/2)*sin(radians(self.angle)) - (self.w/2)*sin(radians(self.angle - 90))],
+                        [self.center.x + (self.h/2)*cos(radians(self.angle + 180)) + (self.w/2)*cos(radians(self.angle + 90)),
+                         self.center.y - (self.h/2)*sin(radians(self.angle + 180)) - (self.w/2)*sin(radians(self.angle + 90))],
+                        [self.center.x + (self.h/2)*cos(radians(self.angle + 180)) + (self.w/2)*cos(radians(self.angle - 90)),
+                         self.center.y - (self.h/2)*sin(radians(self.angle + 180)) - (self.w/2)*sin(radians(self.angle - 90))]]
+
+        self.nearestPlanet = asPlanetList(planets).nearestTo(self.center, self.nearestPlanet)
+
+        altitudesOfCorners = []
+        for corner in self.corners:
+            altitudesOfCorners.append(getDistance(corner, self.nearestPlanet.pos) - self.nearestPlanet.r)
+        self.altitude = min(altitudesOfCorners)
+
+        self.angFromPlanet = (degrees(atan2(self.nearestPlanet.pos[1] - self.center.y,
+                                            self.center.x - self.nearestPlanet.pos[0])))%360
+
+        relV = self.v - self.nearestPlanet.v     # the planet may be moving, touchdowns are judged relative to it
+        speed, direction = relV.as_polar()
+        self.vToPlanet = cos(direction - self.angFromPlanet + 180)*speed
+        self.vTanPlanet = abs(sin(direction - self.angFromPlanet + 180)*speed)
+
+    def recordPath(self):
+        if self.path != None:
+            self.path.extend([self.center.x + (self.h/2)*cos(radians(self.angle + 180)),
+                              self.center.y - (self.h/2)*sin(radians(self.angle + 180))])
+
+    def freeze(self):
+        self.v.update(0,0)
+        self.angV = 0
+        self.throttle = 0
+        self.altitude = 0
+
+    def launch(self):
+        self.throttleMax()
+        self.launched = True
+
+    def throttleMax(self):
+        self.throttle = 1
+
+    def throttleZero(self):
+        self.throttle = 0
+
+    def throttleUp(self):
+        if self.throttle < 1:
+            self.throttle += 0.05
+
+    def throttleDown(self):
+        if self.throttle > 0:
+            self.throttle -= 0.05
+
+    def rotCCW(self):
+        self.angV += 0.5
+
+    def rotCW(self):
+        self.angV -= 0.5
+
+    def stabilize(self):
+        if self.angV > 0.5:
+            self.angV -= 0.5
+        elif self.angV < -0.5:
+            self.angV += 0.5
+        else:
+            self.angV = 0
+
+class Simulation():
+    """ A world of planets and one rocket that can be stepped without a window.
+
+    coast is an optional KeplerCoast (game_v31_kepler) used by SimClock to move the rocket
+    analytically while its engines are off.
+    """
+    def __init__(self, rocket, planets, integrator="euler", coast=None):
+        self.rocket = rocket
+        self.planets = asPlanetList(planets)
+        self.integrator = INTEGRATORS[integrator]
+        self.coast = coast
+        self.rcs = False    # set while the player fires the RCS thrusters, which ends coasting
+        self.time = 0       # simulation seconds since launch
+
+    @classmethod
+    def fromSpec(cls, spec, planets=None, integrator="euler", coast=None):
+        if planets == None:
+            planets = makePlanets()
+        return cls(RocketPhysics.fromSpec(spec, planets[0], planets), planets, integrator, coast)
+
+    def launch(self):
+        self.rocket.launch()
+
+    def step(self, dt, timeWarp=1, recordPath=True):
+        if not self.rocket.crashed and self.rocket.launched:
+            self.planets.step(dt*timeWarp)
+            self.rocket.update(self.planets, dt, timeWarp, self.integrator, recordPath)
+            self.time += dt*timeWarp
+
+    def run(self, duration, dt=1/60, timeWarp=1):
+        """ Step until duration simulation seconds have passed or the rocket crashes. """
+        while self.rocket.launched and not self.rocket.crashed and self.time < duration:
+            self.step(dt, timeWarp)
+        return self.rocket
+
+    def canCoast(self):
+        rocket = self.rocket
+        return self.coast != None and not self.planets.moving and rocket.launched and not rocket.crashed and rocket.throttle == 0 and \
+               not self.rcs and rocket.altitude > self.coast.minAltitude
+
+    def coastFor(self, duration, pathSamples=16):
+        """ Move the rocket on its orbit for up to duration seconds. Returns the time coasted. """
+        elapsed = self.coast.advance(self.rocket, duration, pathSamples)
+        if elapsed > 0:
+            self.rocket.gravityVectors = self.planets.gravityVectors(self.rocket)
+            self.rocket.updateSurroundings(self.planets)
+            self.rocket.recordPath()
+            self.time += elapsed
+        return elapsed
+
+class SimClock():
+    """ Turns variable frame times into fixed simulation steps.
+
+    Frame time times time warp goes into an accumulator which is drained in steps of stepSize,
+    so warping time takes more substeps instead of bigger ones. When a frame would need more
+    than maxSubsteps, steps grow only up to what the orbit and the ground allow (see
+    maxStableStep) and any time still left over is dropped, so the simulation runs slower
+    than asked rather than blowing up. Above 1x, a simulation that can coast is moved along
+    its orbit analytically instead, which costs the same at any warp.
+    """
+    def __init__(self, stepSize=1/60, maxSubsteps=400, maxFrameTime=0.25, pathSamples=16):
+        self.stepSize = stepSize            # simulation seconds per substep at normal speed
+        self.maxSubsteps = maxSubsteps      # substeps allowed per frame
+        self.maxFrameTime = maxFrameTime    # longer frames (window drags, loading) are clamped
+        self.pathSamples = pathSamples      # path points recorded per frame at most
+        self.accumulator = 0
+        self.alpha = 0          # fraction of a step left in the accumulator, for interpolated drawing
+        self.ticks = 0          # substeps taken so far
+        self.lastSubsteps = 0
+
+    def maxStableStep(self, rocket):
+        """ Largest step that keeps orbits and landings stable near the nearest planet. """
+        planet = rocket.nearestPlanet
+        d = getDistance(rocket.center, planet.pos)
+        limit = 0.01*sqrt(d**3/(G*planet.mass))     # 1/100 of the local orbital time scale
+        speed = rocket.v.length()
+        if rocket.altitude > 0 and speed > 0:
+            limit = min(limit, 0.25*rocket.altitude/speed)   # never skip past the ground
+        return max(limit, self.stepSize)
+
+    def advance(self, sim, frameDt, timeWarp=1):
+        """ Step sim by frameDt real seconds at timeWarp. Returns the number of substeps taken. """
+        self.accumulator += min(frameDt, self.maxFrameTime)*timeWarp
+        if timeWarp > 1 and sim.canCoast():
+            self.accumulator -= sim.coastFor(self.accumulator, self.pathSamples)
+        h = self.stepSize
+        if self.accumulator > h*self.maxSubsteps:
+            h = min(self.accumulator/self.maxSubsteps, self.maxStableStep(sim.rocket))
+        steps = min(int(self.accumulator/h), self.maxSubsteps)
+        recordEvery = max(1, steps//self.pathSamples)
+
+        for i in range(steps):
+            sim.step(h, 1, (self.ticks + 1) % recordEvery == 0 or i == steps - 1)
+            self.ticks += 1
+
+        self.accumulator -= steps*h
+        if self.accumulator > h:
+            self.accumulator = 0    # over budget, drop the rest instead of falling behind
+        self.alpha = self.accumulator/h
+        self.lastSubsteps = steps
+        return steps
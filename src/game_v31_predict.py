@@ -0,0 +1,260 @@
+#########################################
+# File Name: game_v31_predict.py
+# Description: Background trajectory prediction for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import threading, queue, time
+from math import sqrt, radians, sin, cos, atan2, pi
+from game_v31_physics import G
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+
+## Dormand-Prince 5(4) tableau: nodes, stage weights, 5th order weights and error weights
+DP_C = [0, 1/5, 3/10, 4/5, 8/9, 1, 1]
+DP_A = [[],
+        [1/5],
+        [3/40, 9/40],
+        [44/45, -56/15, 32/9],
+        [19372/6561, -25360/2187, 64448/6561, -212/729],
+        [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+        [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+DP_B = [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]
+DP_E = [71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40]    # 5th minus 4th order
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def propagate(snapshot, maxTime=20000, maxSteps=4000, chunkSize=64, rtol=1e-8, atol=1e-3, maxTurn=0.02):
+    """ Integrate a TrajectorySnapshot forward with adaptive Dormand-Prince steps.
+
+    Yields (points, done, impact) every chunkSize steps: points is a list of predicted (x, y),
+    impact is the point where the rocket hits a planet, or None. The prediction ends at an
+    impact, after one full turn around the planet pulling hardest at the start once the
+    engine is off, or after maxTime seconds or maxSteps steps. Steps are also kept under
+    maxTurn radians of the rocket's angle around the nearest planet, so the points draw
+    smooth curves.
+    """
+    bodies = snapshot.bodies
+    burnTime = snapshot.burnTime
+
+    def acceleration(t, x, y, thrusting):
+        ax = ay = 0
+        for bx, by, gm, r in bodies:
+            dx, dy = bx - x, by - y
+            dSquared = dx*dx + dy*dy
+            g = gm/(dSquared*sqrt(dSquared))
+            ax += g*dx
+            ay += g*dy
+        if thrusting:
+            angle = radians(snapshot.angle + snapshot.angV*t)
+            ax += snapshot.thrustA*cos(angle)
+            ay -= snapshot.thrustA*sin(angle)
+        return ax, ay
+
+    def derivative(t, state, thrusting):
+        ax, ay = acceleration(t, state[0], state[1], thrusting)
+        return (state[2], state[3], ax, ay)
+
+    state = (snapshot.x, snapshot.y, snapshot.vx, snapshot.vy)
+    strongest = max(bodies, key=lambda body: body[2]/((body[0] - state[0])**2 + (body[1] - state[1])**2))
+    lastAngle = atan2(state[1] - strongest[1], state[0] - strongest[0])
+    sweep = 0
+
+    t = 0
+    h = 1
+    points = [(state[0], state[1])]
+    for step in range(maxSteps):
+        thrusting = t < burnTime
+        dMin = min(sqrt((body[0] - state[0])**2 + (body[1] - state[1])**2) - body[3] for body in bodies)
+        speed = sqrt(state[2]**2 + state[3]**2)
+        if speed > 0:
+            h = min(h, maxTurn*(dMin + min(body[3] for body in bodies))/speed)
+        h = min(h, maxTime - t)
+        if thrusting:
+            h = min(h, burnTime - t)    # the engine cutting out is a kink, end a step on it
+
+        while True:
+            k = []
+            for i in range(7):
+                stageState = [state[j] + h*sum(a*kk[j] for a, kk in zip(DP_A[i], k)) for j in range(4)]
+                k.append(derivative(t + DP_C[i]*h, stageState, thrusting))
+            newState = [state[j] + h*sum(b*kk[j] for b, kk in zip(DP_B, k)) for j in range(4)]
+            error = 0
+            for j in range(4):
+                scale = atol + rtol*max(abs(state[j]), abs(newState[j]))
+                error = max(error, abs(h*sum(e*kk[j] for e, kk in zip(DP_E, k)))/scale)
+            if error <= 1:
+                break
+            h *= max(0.2, 0.9*error**-0.2)
+
+        t += h
+        state = newState
+        h *= min(5, max(0.2, 0.9*error**-0.2)) if error > 0 else 5
+        points.append((state[0], state[1]))
+
+        angle = atan2(state[1] - strongest[1], state[0] - strongest[0])
+        sweep += (angle - lastAngle + pi) % (2*pi) - pi
+        lastAngle = angle
+
+        impact = None
+        for bx, by, gm, r in bodies:
+            if (bx - state[0])**2 + (by - state[1])**2 < r*r:
+                impact = (state[0], state[1])
+        done = impact != None or t >= maxTime or step == maxSteps - 1 or \
+               (t >= burnTime and abs(sweep) >= 2*pi)
+        if done or len(points) >= chunkSize:
+            yield points, done, impact
+            points = []
+        if done:
+            return
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class TrajectorySnapshot():
+    """ Everything propagate() needs, copied from a Simulation so the simulation can go on meanwhile.
+
+    Planets are held where they are. Only the maxBodies heaviest ones are kept, the pull of
+    small moons and rocks is left out.
+    """
+    def __init__(self, sim, maxBodies=16):
+        rocket = sim.rocket
+        self.x, self.y = rocket.center.x, rocket.center.y
+        self.vx, self.vy = rocket.v.x, rocket.v.y
+        self.angle = rocket.angle
+        self.angV = rocket.angV
+        self.thrustA = rocket.throttle*rocket.maxThrust/rocket.mass
+        if rocket.throttle > 0 and rocket.fuelPercent > 0:
+            self.burnTime = rocket.fuelPercent/(rocket.throttle*0.2)   # fuel burns 0.2 % per second at full throttle
+        else:
+            self.burnTime = 0
+        heaviest = sorted(sim.planets, key=lambda planet: planet.mass, reverse=True)[:maxBodies]
+        self.bodies = [(float(planet.pos[0]), float(planet.pos[1]), G*planet.mass, planet.r) for planet in heaviest]
+
+class Predictor():
+    """ Keeps a forecast of the rocket's trajectory in path, computed in a background thread.
+
+    update() is called once a frame and never waits: it hands the worker a new snapshot
+    when the player changes throttle or attitude (or every refreshInterval seconds once a
+    prediction is complete) and adds whatever points have come back since the last frame
+    to path. A new request makes the worker drop the old prediction after its current chunk.
+    With the simulation on another thread, that thread calls refresh() and the one drawing
+    path calls poll(), the two halves of update().
+    """
+    def __init__(self, path, refreshInterval=1, maxBodies=16, **options):
+        self.path = path                    # anything with extend(point) and clear(), like a PathBuffer
+        self.refreshInterval = refreshInterval
+        self.maxBodies = maxBodies
+        self.options = options              # passed on to propagate()
+        self.lock = threading.Lock()        # guards everything below, both threads keep track of requests
+        self.generation = 0                 # requests so far, results of older ones are dropped
+        self.pathGeneration = 0             # request whose points path holds
+        self.pending = None                 # (generation, snapshot) the worker has not taken yet
+        self.wake = threading.Event()
+        self.results = queue.Queue()
+        self.thread = None
+        self.running = True
+        self.controls = None
+        self.requestTime = 0
+        self.finished = False
+        self.impact = None                  # where the predicted trajectory hits a planet
+
+    def request(self, sim):
+        """ Start predicting from the simulation's current state, cancelling any older prediction. """
+        snapshot = TrajectorySnapshot(sim, self.maxBodies)
+        with self.lock:
+            self.generation += 1
+            self.pending = (self.generation, snapshot)
+            self.finished = False
+            self.impact = None
+            self.requestTime = time.perf_counter()
+            self.wake.set()
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.pending = None
+            self.finished = True
+            self.impact = None
+
+    def reset(self):
+        """ Drop the prediction and the controls it was for, e.g. after the rocket was moved. """
+        self.cancel()
+        with self.lock:
+            self.controls = None
+
+    def current(self, generation):
+        with self.lock:
+            return generation == self.generation and self.running
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            with self.lock:
+                job, self.pending = self.pending, None
+                self.wake.clear()
+                running = self.running
+            if not running:
+                return
+            if job == None:
+                continue
+            generation, snapshot = job
+            for points, done, impact in propagate(snapshot, **self.options):
+                if not self.current(generation):
+                    break   # cancelled, the next request is waiting
+                self.results.put((generation, points, done, impact))
+                time.sleep(0)   # let the render loop have the interpreter between chunks
+
+    def poll(self):
+        """ Add the points computed since the last call to path, starting it over after a new request.
+
+        The lock is held throughout, so no request can come in between checking a result's
+        generation and keeping it.
+        """
+        with self.lock:
+            if self.pathGeneration != self.generation:
+                self.path.clear()
+                self.pathGeneration = self.generation
+            while True:
+                try:
+                    generation, points, done, impact = self.results.get_nowait()
+                except queue.Empty:
+                    return
+                if generation == self.generation:
+                    for point in points:
+                        self.path.extend(point)
+                    if done:
+                        self.finished = True
+                        self.impact = impact
+
+    def refresh(self, sim):
+        """ Request a new prediction if the rocket's controls changed or the last one is stale. """
+        rocket = sim.rocket
+        flying = rocket.launched and not rocket.crashed and rocket.altitude > 0
+        controls = (rocket.throttle, rocket.angV, flying)
+        with self.lock:
+            changed = controls != self.controls
+            stale = self.finished and time.perf_counter() - self.requestTime > self.refreshInterval
+            self.controls = controls
+        if not flying:
+            if changed:
+                self.cancel()   # nothing to forecast on the ground
+        elif changed or stale:
+            self.request(sim)
+
+    def update(self, sim):
+        self.refresh(sim)
+        self.poll()
+
+    def close(self):
+        with self.lock:
+            self.running = False
+        self.wake.set()
@@ -0,0 +1,176 @@
+#########################################
+# File Name: game_v31_profiler.py
+# Description: Frame time profiling and overlay for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import pygame, json, csv
+import numpy as np
+from time import perf_counter
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+FRAME_BUDGET = 1/60     # seconds per frame at 60 FPS
+
+## colour of each section in the overlay, in order
+SECTION_COLOURS = [(230, 90, 90), (230,160, 60), (220,220, 80), (120,210, 90), ( 70,200,200),
+                   ( 90,140,240), (170,110,240), (230,110,200), (160,160,160), (110,110,110),
+                   (200,200,200), (120, 90, 60), (240,240,240), ( 60,160,120)]
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class FrameProfiler():
+    """ Time spent in each section of the game loop, for the last numFrames frames.
+
+    Call beginFrame() at the top of the loop and mark(name) after each section: the time
+    since the previous mark (or the frame start) is charged to name. Times go into
+    preallocated ring buffers, so recording costs one clock read and a few array writes.
+    """
+    def __init__(self, sections, numFrames=600):
+        self.sections = list(sections)
+        self.index = {name: i for i, name in enumerate(self.sections)}
+        self.numFrames = numFrames
+        self.durations = np.zeros((numFrames, len(self.sections)))   # seconds per frame and section
+        self.offsets = np.zeros((numFrames, len(self.sections)))     # first start in the frame, for traces
+        self.frameStarts = np.zeros(numFrames)
+        self.frameTimes = np.zeros(numFrames)
+        self.frames = 0     # frames begun so far
+        self.row = -1       # ring buffer row of the current frame
+        self.last = 0       # time of the last mark
+        self.enabled = True
+
+    def beginFrame(self):
+        if not self.enabled:
+            return
+        now = perf_counter()
+        if self.row >= 0:
+            self.frameTimes[self.row] = now - self.frameStarts[self.row]
+        self.row = self.frames % self.numFrames
+        self.frames += 1
+        self.durations[self.row] = 0
+        self.frameStarts[self.row] = now
+        self.last = now
+
+    def mark(self, name):
+        """ Charge the time since the last mark to section name. """
+        if not self.enabled or self.row < 0:
+            return
+        now = perf_counter()
+        i = self.index[name]
+        if self.durations[self.row, i] == 0:
+            self.offsets[self.row, i] = self.last - self.frameStarts[self.row]
+        self.durations[self.row, i] += now - self.last
+        self.last = now
+
+    def completedRows(self, n=None):
+        """ Ring buffer rows of the last n finished frames, oldest first. """
+        finished = min(self.frames - 1, self.numFrames - 1)   # the current frame is still being timed
+        if n != None:
+            finished = min(finished, n)
+        return (self.row - finished + np.arange(finished)) % self.numFrames
+
+    def averages(self, n=60):
+        """ Mean frame time and mean time per section over the last n frames, in seconds. """
+        rows = self.completedRows(n)
+        if len(rows) == 0:
+            return 0, np.zeros(len(self.sections))
+        return self.frameTimes[rows].mean(), self.durations[rows].mean(axis=0)
+
+    def exportChromeTrace(self, filename):
+        """ Write the buffered frames as a trace for chrome://tracing or Perfetto. """
+        rows = self.completedRows()
+        events = []
+        for row in rows:
+            start = self.frameStarts[row]*1e6
+            events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": start, "dur": self.frameTimes[row]*1e6})
+            for i, name in enumerate(self.sections):
+                if self.durations[row, i] > 0:
+                    events.append({"name": name, "ph": "X", "pid": 1, "tid": 2,
+                                   "ts": start + self.offsets[row, i]*1e6, "dur": self.durations[row, i]*1e6})
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def exportCsv(self, filename):
+        """ One row per buffered frame, times in milliseconds. """
+        rows = self.completedRows()
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "start", "total"] + self.sections)
+            for n, row in enumerate(rows):
+                writer.writerow([self.frames - 1 - len(rows) + n, round(self.frameStarts[row]*1000, 3),
+                                 round(self.frameTimes[row]*1000, 3)] +
+                                [round(value, 3) for value in self.durations[row]*1000])
+
+class ProfilerOverlay():
+    """ Frame time graph and per section breakdown in the top right corner.
+
+    The graph shows the last numBars frames, each bar split into its sections (idle ones,
+    like waiting for the next tick, are left out), with a line at the 60 FPS budget. It
+    is scrolled one bar a frame instead of being redrawn, and the text is only rendered
+    again every textInterval seconds.
+    """
+    def __init__(self, profiler, font, idle=("wait",), numBars=120, graphH=80, textInterval=0.25):
+        self.profiler = profiler
+        self.font = font
+        self.busy = [i for i, name in enumerate(profiler.sections) if name not in idle]
+        self.numBars = numBars
+        self.graphH = graphH
+        self.textInterval = textInterval
+        self.graph = pygame.Surface((numBars*2, graphH))
+        self.graphFrames = profiler.frames      # frames already in the graph
+        self.textSurf = None
+        self.textTime = 0
+        self.visible = False
+
+    def renderText(self):
+        frameTime, sectionTimes = self.profiler.averages()
+        lines = [("frame " + str(round(frameTime*1000, 2)) + " ms", (255,255,255))]
+        for i, name in enumerate(self.profiler.sections):
+            lines.append((name + " " + str(round(sectionTimes[i]*1000, 2)) + " ms",
+                          SECTION_COLOURS[i % len(SECTION_COLOURS)]))
+        surfs = [self.font.render(line, True, clr) for line, clr in lines]
+        self.textSurf = pygame.Surface((max(surf.get_width() for surf in surfs),
+                                        sum(surf.get_height() for surf in surfs)))
+        y = 0
+        for surf in surfs:
+            self.textSurf.blit(surf, (0, y))
+            y += surf.get_height()
+
+    def addBars(self):
+        """ Scroll the graph left and draw the frames finished since the last call. """
+        rows = self.profiler.completedRows(min(self.numBars, self.profiler.frames - 1 - self.graphFrames))
+        self.graphFrames = self.profiler.frames - 1
+        if len(rows) == 0:
+            return
+        w = self.graph.get_width()
+        scale = self.graphH/(2*FRAME_BUDGET)     # pixels per second, two frame budgets fit
+        self.graph.scroll(-2*len(rows), 0)
+        self.graph.fill((0, 0, 0), (w - 2*len(rows), 0, 2*len(rows), self.graphH))
+        x = w - 2*len(rows)
+        for row in rows:
+            y = self.graphH
+            for i in self.busy:
+                h = self.profiler.durations[row, i]*scale
+                if h >= 1:
+                    pygame.draw.line(self.graph, SECTION_COLOURS[i % len(SECTION_COLOURS)], (x, y), (x, max(0, y - h)))
+                y -= h
+            x += 2
+        budgetY = self.graphH - round(FRAME_BUDGET*scale)
+        pygame.draw.line(self.graph, (255,255,255), (w - 2*len(rows), budgetY), (w, budgetY))
+
+    def draw(self, screen):
+        if not self.visible:
+            self.graphFrames = self.profiler.frames - 1
+            return
+        now = perf_counter()
+        if self.textSurf == None or now - self.textTime > self.textInterval:
+            self.renderText()
+            self.textTime = now
+        self.addBars()
+        left = screen.get_width() - self.graph.get_width() - 10
+        screen.blit(self.graph, (left, 10))
+        screen.blit(self.textSurf, (left, self.graphH + 15))
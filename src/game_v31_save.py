@@ -0,0 +1,267 @@
+#########################################
+# File Name: game_v31_save.py
+# Description: Binary snapshots of a flight for quicksave, quickload and branching for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import os, json, struct, hashlib, queue, threading, weakref
+import numpy as np
+from pygame.math import Vector2
+from game_v31_path import PathBuffer
+from game_v31_telemetry import padded
+from game_v31_inputlog import simHeader, makeSimulation
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+MAGIC = b"RSAV"
+VERSION = 1
+CHUNK_FOLDER = "chunks"     # next to the saves, shared path chunks named by the hash of their points
+
+## rocket values saved as they are, vectors and the nearest planet are saved separately
+ROCKET_FIELDS = ["angle", "angV", "throttle", "thrust", "fuelPercent", "altitude", "angFromPlanet",
+                 "vToPlanet", "vTanPlanet", "launched", "crashed"]
+CLOCK_FIELDS = ["accumulator", "alpha", "ticks", "lastSubsteps"]
+
+digests = {}    # id of a frozen path chunk: sha1 of its points, so each chunk is only hashed once
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def chunkDigest(chunk):
+    key = id(chunk)
+    digest = digests.get(key)
+    if digest == None:
+        digest = hashlib.sha1(chunk.tobytes()).hexdigest()
+        digests[key] = digest
+        weakref.finalize(chunk, digests.pop, key, None)
+    return digest
+
+def writeChunk(folder, chunk):
+    """ Store a frozen path chunk in folder unless an earlier save already did. Returns its digest. """
+    digest = chunkDigest(chunk)
+    chunkPath = os.path.join(folder, digest + ".bin")
+    if not os.path.exists(chunkPath):
+        with open(chunkPath + ".tmp", "wb") as f:
+            f.write(chunk.tobytes())
+        os.replace(chunkPath + ".tmp", chunkPath)
+    return digest
+
+def readChunk(folder, digest):
+    chunk = np.fromfile(os.path.join(folder, digest + ".bin"), np.float64).reshape(-1, 2)
+    chunk.flags.writeable = False
+    digests[id(chunk)] = digest     # saving it again needs no hashing
+    weakref.finalize(chunk, digests.pop, id(chunk), None)
+    return chunk
+
+def readHeader(data, filename):
+    if data[:4] != MAGIC:
+        raise ValueError(filename + " is not a saved flight")
+    version, reserved, headerLength = struct.unpack_from("<HHI", data, 4)
+    if version != VERSION:
+        raise ValueError(filename + " has save version " + str(version))
+    return json.loads(data[12:12 + headerLength]), padded(12 + headerLength)
+
+def saveSnapshot(snapshot, filename):
+    """ Write a snapshot: a json header and its arrays in one file, full path chunks in CHUNK_FOLDER. """
+    folder = os.path.dirname(filename)
+    chunkFolder = os.path.join(folder, CHUNK_FOLDER)
+    os.makedirs(chunkFolder, exist_ok=True)
+    header = dict(snapshot.header)
+    arrays = dict(snapshot.arrays)
+    if snapshot.path != None:
+        path = snapshot.path
+        levels = []
+        for i, level in enumerate(path["levels"]):
+            levels.append({"consumed": level["consumed"],
+                           "chunks": [writeChunk(chunkFolder, chunk) for chunk in level["chunks"][:-1]]})
+            arrays["level" + str(i)] = level["chunks"][-1]
+        arrays["recent"] = path["recent"]
+        header["path"] = {"tolerance": path["tolerance"], "tip": path["tip"], "lastDir": path["lastDir"],
+                          "levels": levels}
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset += padded(array.nbytes)
+    header["arrays"] = layout
+    headerBytes = json.dumps(header).encode()
+    with open(filename + ".tmp", "wb") as f:
+        f.write(MAGIC + struct.pack("<HHI", VERSION, 0, len(headerBytes)) + headerBytes)
+        f.write(bytes(padded(f.tell()) - f.tell()))
+        for name, array in arrays.items():
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data + bytes(padded(len(data)) - len(data)))
+    os.replace(filename + ".tmp", filename)
+
+def loadSnapshot(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    header, dataStart = readHeader(data, filename)
+    arrays = {}
+    for name, (dtype, shape, offset) in header.pop("arrays").items():
+        arrays[name] = np.frombuffer(data, dtype, int(np.prod(shape)), dataStart + offset).reshape(shape)
+
+    path = header.pop("path", None)
+    if path != None:
+        chunkFolder = os.path.join(os.path.dirname(filename), CHUNK_FOLDER)
+        levels = []
+        for i, level in enumerate(path["levels"]):
+            chunks = [readChunk(chunkFolder, digest) for digest in level["chunks"]]
+            levels.append({"consumed": level["consumed"], "chunks": chunks + [arrays.pop("level" + str(i))]})
+        path["levels"] = levels
+        path["recent"] = arrays.pop("recent")
+    return Snapshot(header, arrays, path)
+
+def pruneChunks(folder):
+    """ Delete the path chunks in folder that no save there uses any more. """
+    chunkFolder = os.path.join(folder, CHUNK_FOLDER)
+    if not os.path.isdir(chunkFolder):
+        return
+    used = set()
+    for name in os.listdir(folder):
+        if name.endswith(".rsav"):
+            try:
+                with open(os.path.join(folder, name), "rb") as f:
+                    start = f.read(12)
+                    header = readHeader(start + f.read(struct.unpack_from("<I", start, 8)[0]), name)[0]
+            except (OSError, ValueError, struct.error):
+                continue
+            for level in header.get("path", {}).get("levels", []):
+                used.update(level["chunks"])
+    for name in os.listdir(chunkFolder):
+        if name.endswith(".bin") and name[:-4] not in used:
+            os.remove(os.path.join(chunkFolder, name))
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class Snapshot():
+    """ The full state of a flight at one instant: rocket, moving planets, clock, path, camera and time warp.
+
+    capture() copies the state into plain values and arrays and freezes the path, so the
+    flight can go on at once while the snapshot is written (see SaveWriter). A snapshot can
+    be restored any number of times, into the game's simulation or into new independent
+    ones with branch(), to try several what-ifs from one moment. Everything is kept exactly,
+    a restored flight continues bit for bit as the original would have.
+    """
+    def __init__(self, header, arrays, path=None):
+        self.header = header        # json values
+        self.arrays = arrays        # moving planet positions and velocities
+        self.path = path            # PathBuffer.freeze() of the rocket's path, or None
+
+    @classmethod
+    def capture(cls, sim, simClock, path=None, camera=None, timeWarp=1, rocketName=None, system=None):
+        rocket = sim.rocket
+        planets = sim.planets
+        rocketState = {name: getattr(rocket, name) for name in ROCKET_FIELDS}
+        rocketState.update({"center": [rocket.center.x, rocket.center.y], "v": [rocket.v.x, rocket.v.y],
+                            "thrustA": [rocket.thrustA.x, rocket.thrustA.y],
+                            "corners": [list(corner) for corner in rocket.corners],
+                            "gravityVectors": [[vec.x, vec.y] for vec in rocket.gravityVectors],
+                            "nearestPlanet": planets.index(rocket.nearestPlanet)})
+        state = {"time": sim.time, "rcs": sim.rcs, "timeWarp": timeWarp, "rocket": rocketState,
+                 "clock": {name: getattr(simClock, name) for name in CLOCK_FIELDS}, "camera": None}
+        if camera != None:
+            state["camera"] = {"x": camera.x, "y": camera.y, "zoom": camera.zoom, "tether": camera.tether}
+        arrays = {}
+        if planets.moving:
+            arrays["planetPos"] = np.array([planet.pos for planet in planets], dtype=np.float64)
+            arrays["planetV"] = np.array([planet.v for planet in planets], dtype=np.float64)
+        header = {"version": VERSION, "rocketName": rocketName, "system": system,
+                  "sim": simHeader(sim, simClock), "state": state}
+        return cls(header, arrays, path.freeze() if path != None else None)
+
+    def fits(self, sim, simClock, system=None):
+        """ True if the snapshot is of the same rocket in the same system as sim. """
+        return self.header["system"] == system and self.header["sim"] == simHeader(sim, simClock)
+
+    def restore(self, sim, simClock, path=None, camera=None):
+        """ Put the snapshot into an existing simulation of the same rocket and system. Returns the time warp. """
+        state = self.header["state"]
+        rocket = sim.rocket
+        planets = sim.planets
+        if "planetPos" in self.arrays:
+            positions, velocities = self.arrays["planetPos"], self.arrays["planetV"]
+            for planet, pos, v in zip(planets, positions.tolist(), velocities.tolist()):
+                planet.pos = tuple(pos)
+                planet.v = tuple(v)
+            if hasattr(planets, "movingA"):     # a BodySystem, its arrays are what it steps
+                planets.pos[:] = positions
+                planets.v[:] = velocities
+                planets.tree = None
+                planets.movingA = None      # recomputed from the same positions, to the same values
+
+        rocketState = state["rocket"]
+        for name in ROCKET_FIELDS:
+            setattr(rocket, name, rocketState[name])
+        rocket.center.update(rocketState["center"])
+        rocket.v.update(rocketState["v"])
+        rocket.thrustA.update(rocketState["thrustA"])
+        rocket.corners = [list(corner) for corner in rocketState["corners"]]
+        rocket.gravityVectors = [Vector2(vec) for vec in rocketState["gravityVectors"]]
+        rocket.nearestPlanet = planets[rocketState["nearestPlanet"]]
+
+        sim.time = state["time"]
+        sim.rcs = state["rcs"]
+        for name in CLOCK_FIELDS:
+            setattr(simClock, name, state["clock"][name])
+        if path != None and self.path != None:
+            path.thaw(self.path)
+        if camera != None and state["camera"] != None:
+            for name, value in state["camera"].items():
+                setattr(camera, name, value)
+            camera.updateAll()
+        return state["timeWarp"]
+
+    def branch(self, withPath=False):
+        """ A new simulation and clock in the snapshot's state, independent of every other branch. """
+        header = dict(self.header["sim"])
+        header["system"] = self.header["system"]
+        sim, simClock = makeSimulation(header)
+        path = None
+        if withPath:
+            path = PathBuffer()
+            sim.rocket.path = path
+        self.restore(sim, simClock, path)
+        return sim, simClock
+
+class SaveWriter():
+    """ Writes snapshots to disk on a background thread, so saving never holds up a frame.
+
+    After each save, path chunks that no save in its folder uses any more are deleted.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.written = 0
+        self.error = None       # the last OSError, if a save failed
+
+    def write(self, snapshot, filename):
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.queue.put((snapshot, filename))
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job == None:
+                return
+            snapshot, filename = job
+            try:
+                saveSnapshot(snapshot, filename)
+                pruneChunks(os.path.dirname(filename))
+                self.written += 1
+            except OSError as error:
+                self.error = error
+
+    def close(self):
+        """ Finish the saves still queued. """
+        if self.thread != None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
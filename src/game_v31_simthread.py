@@ -0,0 +1,192 @@
+#########################################
+# File Name: game_v31_simthread.py
+# Description: Fixed-rate physics thread with interpolated snapshots for drawing for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import threading, time
+from collections import deque
+from contextlib import contextmanager
+from pygame.math import Vector2
+from game_v31_inputlog import applyCommand
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+
+## rocket values copied into snapshots as they are, not interpolated
+DISCRETE_FIELDS = ["altitude", "throttle", "vToPlanet", "vTanPlanet", "angV", "fuelPercent",
+                   "angFromPlanet", "nearestPlanet", "crashed", "launched"]
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class PathFeed():
+    """ Stands in for the rocket's Path on the physics thread. Recorded points wait in a deque
+        until the render thread moves them into the real path with drain(). """
+    def __init__(self):
+        self.points = deque()
+
+    def extend(self, point):
+        self.points.append((point[0], point[1]))
+
+    def drain(self, path):
+        points = self.points
+        while points:
+            path.extend(points.popleft())
+
+class SimSnapshot():
+    """ What the renderer needs of the rocket after a physics tick. Attributes are named as on
+        the rocket, so a snapshot can be drawn, shown on the hud and followed by the camera. """
+    def __init__(self):
+        self.center = Vector2()
+        self.v = Vector2()
+        self.angle = 90
+        for name in DISCRETE_FIELDS:
+            setattr(self, name, None)
+        self.time = 0
+        self.stamp = 0      # perf_counter() when it was taken
+
+    def copyFrom(self, sim, stamp):
+        rocket = sim.rocket
+        self.center.update(rocket.center)
+        self.v.update(rocket.v)
+        self.angle = rocket.angle
+        for name in DISCRETE_FIELDS:
+            setattr(self, name, getattr(rocket, name))
+        self.time = sim.time
+        self.stamp = stamp
+
+    def interpolate(self, before, after, f):
+        """ Become the state f of the way from before to after. """
+        self.center.update(before.center.lerp(after.center, f))
+        self.v.update(before.v.lerp(after.v, f))
+        self.angle = before.angle + ((after.angle - before.angle + 180) % 360 - 180)*f     # the short way round
+        latest = after if f >= 1 else before
+        for name in DISCRETE_FIELDS:
+            setattr(self, name, getattr(latest, name))
+        self.time = before.time + (after.time - before.time)*f
+        self.stamp = before.stamp + (after.stamp - before.stamp)*f
+
+class SimThread():
+    """ Runs a simulation on its own thread at a fixed tick rate, independent of drawing.
+
+    Each tick gives the rocket the commands queued by command() since the last one, logs
+    and advances the SimClock by the real time that has passed, records telemetry, lets the
+    predictor see the new state and copies the rocket into a snapshot. Snapshots rotate
+    through three buffers under a lock held only for the swap, so neither side waits on
+    the other's work. interpolated() returns the rocket as it was one tick ago, blended
+    between the last two snapshots, which draws smoothly at any frame rate.
+
+    While it runs, the rocket records its path into a PathFeed; drainPath() moves the
+    points into the real path on the render thread, and close() puts the path back.
+    """
+    def __init__(self, sim, simClock, inputLog=None, recorder=None, predictor=None, tickRate=60):
+        self.sim = sim
+        self.simClock = simClock
+        self.inputLog = inputLog
+        self.recorder = recorder
+        self.predictor = predictor
+        self.tickTime = 1/tickRate
+        self.lock = threading.Lock()    # guards the queued input and the snapshots
+        self.tickLock = threading.Lock()    # held for a whole tick, see paused()
+        self.commands = []
+        self.timeWarp = 1
+        self.rcs = False
+
+        now = time.perf_counter()
+        self.previous, self.current, self.back = SimSnapshot(), SimSnapshot(), SimSnapshot()
+        self.previous.copyFrom(sim, now - self.tickTime)
+        self.current.copyFrom(sim, now)
+        self.view = SimSnapshot()       # interpolated, only touched by the render thread
+        self.view.interpolate(self.previous, self.current, 1)
+
+        self.path = sim.rocket.path
+        self.feed = None
+        if self.path != None:
+            self.feed = PathFeed()
+            sim.rocket.path = self.feed
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def command(self, command):
+        """ Queue a control command (see game_v31_inputlog.COMMANDS) for the next tick. """
+        with self.lock:
+            self.commands.append(command)
+
+    def setControls(self, timeWarp, rcs):
+        with self.lock:
+            self.timeWarp = timeWarp
+            self.rcs = rcs
+
+    def run(self):
+        last = time.perf_counter()
+        nextTick = last + self.tickTime
+        while self.running:
+            delay = nextTick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            with self.tickLock:
+                self.tick(now - last)
+            last = now
+            nextTick = max(nextTick + self.tickTime, now)   # a late tick is not made up for, SimClock catches up
+
+    def tick(self, dt):
+        with self.lock:
+            commands, self.commands = self.commands, []
+            timeWarp, rcs = self.timeWarp, self.rcs
+        sim = self.sim
+        rocket = sim.rocket
+        for command in commands:
+            if self.inputLog != None:
+                self.inputLog.apply(command)
+            else:
+                applyCommand(sim, command)
+
+        sim.rcs = rcs
+        if self.inputLog != None:
+            self.inputLog.frame(dt, timeWarp, rcs)
+        self.simClock.advance(sim, dt, timeWarp)
+        if self.recorder != None and rocket.launched:
+            self.recorder.record(sim)
+        if rocket.crashed:
+            rocket.freeze()
+        if self.predictor != None:
+            self.predictor.refresh(sim)
+
+        self.back.copyFrom(sim, time.perf_counter())
+        with self.lock:
+            self.previous, self.current, self.back = self.current, self.back, self.previous
+
+    def interpolated(self, now=None):
+        """ The rocket to draw at now, one tick behind the physics. """
+        if now == None:
+            now = time.perf_counter()
+        with self.lock:
+            before, after = self.previous, self.current
+            span = after.stamp - before.stamp
+            f = 1 if span <= 0 else min(1, max(0, (now - self.tickTime - before.stamp)/span))
+            self.view.interpolate(before, after, f)
+        return self.view
+
+    @contextmanager
+    def paused(self):
+        """ Hold the physics between two ticks with the path drained, e.g. to snapshot the simulation. """
+        with self.tickLock:
+            self.drainPath()
+            yield self.sim
+
+    def drainPath(self):
+        if self.feed != None:
+            self.feed.drain(self.path)
+
+    def close(self):
+        """ Stop the thread after its current tick and give the rocket its path back. """
+        self.running = False
+        self.thread.join()
+        self.drainPath()
+        self.sim.rocket.path = self.path
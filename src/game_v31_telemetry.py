@@ -0,0 +1,265 @@
+#########################################
+# File Name: game_v31_telemetry.py
+# Description: Binary flight recording and memory-mapped replay for rocket simulator
+# Author: Suyu Chen
+# Date: 06/03/2020
+#########################################
+import os, json, mmap, struct
+from time import perf_counter
+import numpy as np
+
+#-----------------------------#
+# Constants                   #
+#-----------------------------#
+MAGIC = b"RTLM"
+INDEX_MAGIC = b"RTLX"
+VERSION = 1
+
+## column format: [name, numpy dtype]
+COLUMNS = [["time", "<f8"], ["x", "<f8"], ["y", "<f8"], ["vx", "<f8"], ["vy", "<f8"],
+           ["angle", "<f4"], ["angV", "<f4"], ["throttle", "<f4"], ["fuel", "<f4"],
+           ["altitude", "<f4"], ["planet", "<u2"]]
+
+## index entry per chunk: time of its first and last row, file offset and number of rows
+INDEX_DTYPE = np.dtype([("start", "<f8"), ("end", "<f8"), ("offset", "<u8"), ("rows", "<u4"), ("pad", "<u4")])
+CHUNK_HEADER = struct.Struct("<II")     # rows, padding
+TRAILER = struct.Struct("<QI4s")        # index offset, number of chunks, INDEX_MAGIC
+
+#-----------------------------#
+# Functions                   #
+#-----------------------------#
+
+def padded(n):
+    """ n rounded up to a multiple of 8 bytes, so every column in a chunk is aligned. """
+    return (n + 7)//8*8
+
+def columnOffsets(rows, columns=COLUMNS):
+    """ Offset of each column from the start of a chunk of rows rows, and the chunk size. """
+    offsets = {}
+    offset = CHUNK_HEADER.size
+    for name, dtype in columns:
+        offsets[name] = offset
+        offset += padded(rows*np.dtype(dtype).itemsize)
+    return offsets, offset
+
+def recordedRows(filename):
+    """ Rows in a recorded flight, 0 if there is none or it cannot be read. """
+    try:
+        reader = TelemetryReader(filename)
+    except (OSError, ValueError):
+        return 0
+    rows = len(reader)
+    reader.close()
+    return rows
+
+#-------------------------------#
+# Classes                       #
+#-------------------------------#
+
+class TelemetryRecorder():
+    """ Writes one row of flight state per record() call into a chunked columnar file.
+
+    The file starts with MAGIC, a version and a json header (columns, chunk size, planets,
+    rocket). Rows are collected column by column in preallocated arrays and written out
+    chunkRows at a time, each column contiguous, or sooner once flushInterval seconds have
+    passed, so a flight that is killed loses at most that much. close() appends an index
+    of the chunks' time ranges and file offsets, then a trailer pointing at it.
+
+    The file is only created by the first record(), a game left before launch keeps the
+    previous flight.
+    """
+    def __init__(self, filename, planets, rocketName, chunkRows=4096, flushInterval=1):
+        self.filename = filename
+        self.file = None
+        self.chunkRows = chunkRows
+        self.flushInterval = flushInterval
+        self.planetIds = {planet: i for i, planet in enumerate(planets)}
+        self.buffers = {name: np.empty(chunkRows, dtype) for name, dtype in COLUMNS}
+        self.rows = 0       # rows in the current chunk
+        self.index = []
+        self.lastTime = None
+        self.lastFlush = perf_counter()
+        self.header = json.dumps({"columns": COLUMNS, "chunkRows": chunkRows, "rocket": rocketName,
+                                  "planets": [planet.name for planet in planets]}).encode()
+
+    def open(self):
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.filename, "wb")
+        self.file.write(MAGIC + struct.pack("<HHI", VERSION, 0, len(self.header)) + self.header)
+        self.file.write(bytes(padded(self.file.tell()) - self.file.tell()))
+
+    def record(self, sim):
+        if sim.time == self.lastTime:
+            return      # paused, on the pad or crashed, nothing new
+        if self.file == None:
+            self.open()
+        self.lastTime = sim.time
+        rocket = sim.rocket
+        row = self.rows
+        buffers = self.buffers
+        buffers["time"][row] = sim.time
+        buffers["x"][row] = rocket.center.x
+        buffers["y"][row] = rocket.center.y
+        buffers["vx"][row] = rocket.v.x
+        buffers["vy"][row] = rocket.v.y
+        buffers["angle"][row] = rocket.angle % 360
+        buffers["angV"][row] = rocket.angV
+        buffers["throttle"][row] = rocket.throttle
+        buffers["fuel"][row] = rocket.fuelPercent
+        buffers["altitude"][row] = rocket.altitude
+        buffers["planet"][row] = self.planetIds.get(rocket.nearestPlanet, 0)
+        self.rows += 1
+        if self.rows == self.chunkRows or \
+           (self.flushInterval != None and perf_counter() - self.lastFlush > self.flushInterval):
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered rows as one chunk. """
+        self.lastFlush = perf_counter()
+        if self.rows == 0:
+            return
+        times = self.buffers["time"]
+        self.index.append((times[0], times[self.rows - 1], self.file.tell(), self.rows, 0))
+        self.file.write(CHUNK_HEADER.pack(self.rows, 0))
+        for name, dtype in COLUMNS:
+            data = self.buffers[name][:self.rows].tobytes()
+            self.file.write(data + bytes(padded(len(data)) - len(data)))
+        self.file.flush()
+        self.rows = 0
+
+    def close(self):
+        if self.file == None:
+            return
+        self.flush()
+        indexOffset = self.file.tell()
+        self.file.write(np.array(self.index, INDEX_DTYPE).tobytes())
+        self.file.write(TRAILER.pack(indexOffset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+        self.file = None
+
+class TelemetryReader():
+    """ Memory-mapped access to a recorded flight.
+
+    Only the header and the chunk index are read when opening; columns are numpy views
+    straight into the mapping. stateAt() finds a time with a binary search over the chunks
+    and then within one chunk, so scrubbing costs O(log n) and touches a few pages. A file
+    without an index (the game was closed mid-flight) is indexed by walking its chunk headers.
+    A file without any rows opens with len() 0, and stateAt() is None for it.
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC:
+            raise ValueError(filename + " is not a telemetry file")
+        version, reserved, headerLength = struct.unpack_from("<HHI", self.mm, 4)
+        if version != VERSION:
+            raise ValueError(filename + " has telemetry version " + str(version))
+        self.header = json.loads(self.mm[12:12 + headerLength])
+        self.dataStart = padded(12 + headerLength)
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in self.header["columns"]}
+        self.planets = self.header["planets"]
+        self.rocket = self.header["rocket"]
+        self.index = self.readIndex()
+        self.starts = self.index["start"]
+        self.ends = self.index["end"]
+        self.cachedChunk = None     # column views of the chunk read last, scrubbing mostly stays in one
+        self.cachedColumns = None
+
+    def readIndex(self):
+        size = len(self.mm)
+        if size >= self.dataStart + TRAILER.size:
+            indexOffset, count, magic = TRAILER.unpack_from(self.mm, size - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                return np.frombuffer(self.mm, INDEX_DTYPE, count, indexOffset)
+        entries = []
+        offset = self.dataStart
+        while offset + CHUNK_HEADER.size <= size:
+            rows = CHUNK_HEADER.unpack_from(self.mm, offset)[0]
+            offsets, chunkSize = columnOffsets(rows, self.header["columns"])
+            if rows == 0 or offset + chunkSize > size:
+                break   # the last chunk was cut short
+            times = np.frombuffer(self.mm, self.dtypes["time"], rows, offset + offsets["time"])
+            entries.append((times[0], times[-1], offset, rows, 0))
+            offset += chunkSize
+        return np.array(entries, INDEX_DTYPE)
+
+    def __len__(self):
+        return int(self.index["rows"].sum())
+
+    @property
+    def startTime(self):
+        return float(self.starts[0]) if len(self.index) > 0 else 0
+
+    @property
+    def endTime(self):
+        return float(self.ends[-1]) if len(self.index) > 0 else 0
+
+    def columns(self, chunk):
+        """ Every column of one chunk, as read-only views into the file. """
+        if chunk != self.cachedChunk:
+            rows, offset = int(self.index["rows"][chunk]), int(self.index["offset"][chunk])
+            offsets = columnOffsets(rows, self.header["columns"])[0]
+            self.cachedColumns = {name: np.frombuffer(self.mm, dtype, rows, offset + offsets[name])
+                                  for name, dtype in self.dtypes.items()}
+            self.cachedChunk = chunk
+        return self.cachedColumns
+
+    def column(self, chunk, name):
+        return self.columns(chunk)[name]
+
+    def row(self, chunk, i):
+        return {name: values[i].item() for name, values in self.columns(chunk).items()}
+
+    def find(self, t):
+        """ (chunk, row) of the last row at or before time t, clamped to the flight. None without rows. """
+        if len(self.index) == 0:
+            return None
+        chunk = int(np.searchsorted(self.starts, t, side="right")) - 1
+        if chunk < 0:
+            return 0, 0
+        i = int(np.searchsorted(self.column(chunk, "time"), t, side="right")) - 1
+        return chunk, i
+
+    def stateAt(self, t):
+        """ Flight state at time t, interpolated between the rows around it. """
+        if len(self.index) == 0:
+            return None
+        chunk, i = self.find(t)
+        state = self.row(chunk, i)
+        if i + 1 < self.index[chunk]["rows"]:
+            after = self.row(chunk, i + 1)
+        elif chunk + 1 < len(self.index):
+            after = self.row(chunk + 1, 0)
+        else:
+            return state
+        span = after["time"] - state["time"]
+        if span <= 0 or t <= state["time"]:
+            return state
+        f = (t - state["time"])/span
+        for name in ["x", "y", "vx", "vy", "angV", "throttle", "fuel", "altitude"]:
+            state[name] += (after[name] - state[name])*f
+        state["angle"] += ((after["angle"] - state["angle"] + 180) % 360 - 180)*f     # the short way round
+        state["time"] = t
+        return state
+
+    def sample(self, names, n, end=None):
+        """ About n rows spread evenly over the flight (up to time end), reading only those rows. """
+        step = max(1, len(self)//n)
+        parts = {name: [] for name in names}
+        rowsBefore = 0
+        for chunk in range(len(self.index)):
+            if end != None and self.starts[chunk] > end:
+                break
+            first = (-rowsBefore) % step    # keep the stride across chunks
+            rowsBefore += int(self.index["rows"][chunk])
+            times = self.column(chunk, "time")[first::step]
+            keep = len(times) if end == None else int(np.searchsorted(times, end, side="right"))
+            for name in names:
+                parts[name].append(self.column(chunk, name)[first::step][:keep])
+        return {name: np.concatenate(parts[name]) if parts[name] else np.empty(0) for name in names}
+
+    def close(self):
+        self.index = self.starts = self.ends = self.cachedColumns = None    # views into the mapping have to go first
+        self.mm.close()
@@ -0,0 +1,24 @@
+import os, sys
+from math import cos, sin
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from game_v31_path import PathBuffer
+
+def flyWiggle(path, n):
+    """ A path that keeps turning, so most points survive decimation and simplification. """
+    for i in range(n):
+        path.extend((i*10.0, 50*sin(i*0.7) + 20*cos(i*1.3)))
+
+def test_levels_follow_history_tolerance_after_overflow():
+    path = PathBuffer(chunkSize=64, tolerance=1, maxPoints=300)
+    flyWiggle(path, 5000)
+    assert path.tolerance > 1   # the history overflowed at least once
+    for i, level in enumerate(path.levels):
+        assert level.tolerance == path.tolerance*path.levelFactor**i
+
+def test_level_for_after_overflow():
+    path = PathBuffer(chunkSize=64, tolerance=1, maxPoints=300)
+    flyWiggle(path, 5000)
+    coarser = path.tolerance*path.levelFactor
+    assert path.levelFor(coarser*0.99) is path.levels[0]
+    assert path.levelFor(coarser) is path.levels[1]
+    assert path.levelFor(float("inf")) is path.levels[-1]